@@ -1,34 +1,77 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import contextvars
+import gc
 import os
 from dotenv import load_dotenv
 import logging
 import geopy
 from geopy.geocoders import Nominatim
 import json
+import sys
 import ee
 
-# Initialize Earth Engine
-try:
-    ee.Initialize(project='ee-ndirangudenise61')
-except:
-    ee.Authenticate()
-    ee.Initialize(project='ee-ndirangudenise61')
+# Make the shared pipeline package (band math, model loading) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 # Load environment variables
 load_dotenv()
 
+# Local modules read their configuration from the environment at import time
+import composites
+import ee_cache
+import ee_scheduler
+import export
+import jobs
+import log_config
+import model_server
+import partitions
+import sar
+import watchlist
+import zonal
+from db import get_db_connection
+from grid import cell_center, cell_id
+from http_cache import ResponseCache, dumps, json_response, make_etag
+from imagery import get_backend
+from local_rasters import REFRESH_HOURS as LOCAL_RASTER_REFRESH_HOURS, LocalRasterRefresher, LocalRasterStore
+from timeseries import TimeSeriesStore
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+# JSON lines written by a background thread, tagged with each request's trace id
+log_config.setup_logging()
 logger = logging.getLogger(__name__)
 
+# Initialize Earth Engine (EE_CACHE_MODE=replay needs no credentials)
+ee_cache.initialize(os.getenv('EE_PROJECT', 'ee-ndirangudenise61'))
+
 app = Flask(__name__)
 CORS(app)
+log_config.init_request_tracing(app)
+
+# Per-location indicator history, kept across requests
+timeseries_store = TimeSeriesStore()
+
+# Imagery source for index values (IMAGERY_BACKEND=composite,ee, ee, local or local,ee)
+imagery_backend = get_backend()
+
+# Locally ingested soil moisture / surface water layers, sampled before Earth Engine
+local_rasters = LocalRasterStore()
+
+# GET /api/analyze responses per grid cell, also cacheable by browsers and proxies
+ANALYZE_CACHE_MAX_AGE = int(os.getenv('ANALYZE_CACHE_MAX_AGE', 3600))
+analysis_cache = ResponseCache(ttl=ANALYZE_CACHE_MAX_AGE)
+
+# Polygons needing more tiles than this are run as a job instead of in the request
+ZONAL_SYNC_MAX_TILES = int(os.getenv('ZONAL_SYNC_MAX_TILES', 16))
+
+# Add Sentinel-1 flood extent around the point to every analysis (one extra Earth Engine round trip)
+SAR_IN_ANALYSIS = os.getenv('SAR_IN_ANALYSIS', '0') == '1'
 
 @app.route("/api/endpoint", methods=["GET", "POST"])
 def home():
@@ -40,52 +83,19 @@ def handler(event, context):
     lambda_app = FlaskLambda(app)
     return lambda_app(event, context)
 
-# Database configuration
-DB_CONFIG = {
-    'dbname': os.getenv('DB_NAME', 'flood_prediction_db'),
-    'user': os.getenv('DB_USER', 'postgres'),
-    'password': os.getenv('DB_PASSWORD', '1234'),
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'port': os.getenv('DB_PORT', '5432')
-}
-
 def init_db():
     """Initialize database tables"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
+    conn = get_db_connection()
     try:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS analysis_results (
-                id SERIAL PRIMARY KEY,
-                latitude DOUBLE PRECISION,
-                longitude DOUBLE PRECISION,
-                location_name TEXT,
-                risk_level VARCHAR(50),
-                ndvi DOUBLE PRECISION,
-                ndwi DOUBLE PRECISION,
-                soil_moisture DOUBLE PRECISION,
-                water_level DOUBLE PRECISION,
-                confidence_score DOUBLE PRECISION,
-                analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS historical_data (
-                id SERIAL PRIMARY KEY,
-                analysis_id INTEGER REFERENCES analysis_results(id),
-                date DATE,
-                ndvi DOUBLE PRECISION,
-                ndwi DOUBLE PRECISION,
-                soil_moisture DOUBLE PRECISION,
-                water_level DOUBLE PRECISION
-            );
-        """)
-        conn.commit()
+        # Monthly-partitioned analysis tables and the daily summary table
+        partitions.init_partitioned_tables(conn)
+        watchlist.init_watchlist_tables(conn)
+        jobs.init_job_tables(conn)
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
         conn.rollback()
         raise
     finally:
-        cur.close()
         conn.close()
 
 def get_location_name(lat, lng):
@@ -98,76 +108,38 @@ def get_location_name(lat, lng):
         return f"Location at {lat:.4f}, {lng:.4f}"
 
 def get_satellite_data(lat, lng, start_date, end_date):
-    """Get satellite data from Google Earth Engine with improved date handling"""
+    """Get satellite data from the configured imagery backend with improved date handling"""
     try:
-        # Define the point of interest
-        point = ee.Geometry.Point([lng, lat])
-        region = point.buffer(1000)  # 1km buffer
-
         # Convert start_date and end_date to datetime objects if they're strings
         if isinstance(start_date, str):
             start_date = datetime.strptime(start_date, '%Y-%m-%d')
         if isinstance(end_date, str):
             end_date = datetime.strptime(end_date, '%Y-%m-%d')
 
-        # Extend the date range to 30 days if no imagery is found
-        extended_start_date = start_date - timedelta(days=30)
-        
-        # Get Sentinel-2 imagery with more flexible cloud coverage
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-            .filterBounds(region) \
-            .filterDate(extended_start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 50))  # Increased cloud coverage threshold
-
-        # Try to get the least cloudy image
-        s2_size = s2.size().getInfo()
-        if s2_size == 0:
-            logger.warning("No Sentinel-2 imagery available, trying Landsat data")
-            # Try Landsat 8 as backup
-            landsat = ee.ImageCollection('LANDSAT/LC08/C02/T1_L2') \
-                .filterBounds(region) \
-                .filterDate(extended_start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-                .filter(ee.Filter.lt('CLOUD_COVER', 50))
-            
-            if landsat.size().getInfo() == 0:
-                raise Exception("No clear satellite imagery available")
-            
-            image = ee.Image(landsat.sort('CLOUD_COVER').first())
-            # Calculate indices using Landsat bands
-            ndvi = image.normalizedDifference(['SR_B5', 'SR_B4'])  # NIR and Red bands
-            ndwi = image.normalizedDifference(['SR_B3', 'SR_B5'])  # Green and NIR bands
-        else:
-            # Sort by cloud coverage and get the clearest image
-            image = ee.Image(s2.sort('CLOUDY_PIXEL_PERCENTAGE').first())
-            # Calculate indices
-            ndvi = image.normalizedDifference(['B8', 'B4'])  # NIR and Red bands
-            ndwi = image.normalizedDifference(['B3', 'B8'])  # Green and NIR bands
-
-        # Get soil moisture data from ERA5-Land
-        era5_land = ee.ImageCollection('ECMWF/ERA5_LAND/HOURLY') \
-            .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
-            .select('volumetric_soil_water_layer_1')
-        soil_moisture = era5_land.mean()
-
-        # Calculate mean values for the region
-        values = image.addBands(ndvi).addBands(ndwi).addBands(soil_moisture) \
-            .reduceRegion(
-                reducer=ee.Reducer.mean(),
-                geometry=point,
-                scale=30  # Using 30m resolution for compatibility with both sensors
-            ).getInfo()
-
-        # Get the actual date of the image used
-        image_date = ee.Date(image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-        
-        logger.info(f"Successfully retrieved satellite data from {image_date}")
+        # Soil moisture from the local ERA5-Land layer when ingested, otherwise from the backend
+        local_soil_moisture = local_rasters.sample('soil_moisture', lat, lng)
+
+        # The backend looks back 30 days for the clearest image
+        values = imagery_backend.index_values(
+            lat, lng, start_date, end_date,
+            include_soil_moisture=local_soil_moisture is None
+        )
+        if values is None:
+            raise Exception("No clear satellite imagery available")
+
+        image_date = values['image_date']
+        logger.info(f"Successfully retrieved satellite data from {image_date} ({values['source']})")
 
         return {
-            'ndvi': values.get('nd_1', 0),
-            'ndwi': values.get('nd_2', 0),
-            'soil_moisture': values.get('volumetric_soil_water_layer_1', 0),
+            'ndvi': values['ndvi'] or 0,
+            'ndwi': values['ndwi'] or 0,
+            'soil_moisture': local_soil_moisture if local_soil_moisture is not None
+                else values['soil_moisture'] or 0,
             'image_date': image_date
         }
+    except ee_cache.ReplayMissError:
+        # A replay with a missing recording must fail, not pass on made-up values
+        raise
     except Exception as e:
         logger.error(f"GEE analysis failed: {str(e)}")
         # Return mock data if GEE analysis fails
@@ -176,23 +148,35 @@ def get_satellite_data(lat, lng, start_date, end_date):
             'ndvi': np.random.uniform(0.2, 0.8),
             'ndwi': np.random.uniform(-0.2, 0.4),
             'soil_moisture': np.random.uniform(0.1, 0.5),
-            'image_date': current_date
+            'image_date': current_date,
+            'mock': True
         }
 
-def calculate_flood_risk(ndvi, ndwi, soil_moisture, water_level=None):
-    """Calculate flood risk with more sophisticated logic"""
+# Weights for each factor
+RISK_WEIGHTS = {
+    'ndvi': 0.25,    # Vegetation cover
+    'ndwi': 0.35,    # Water content
+    'soil': 0.40     # Soil moisture
+}
+WATER_LEVEL_WEIGHT = 0.2
+SAR_FLOOD_WEIGHT = 0.3
+# Flooded share of the area around a point at which the SAR factor saturates
+SAR_FLOOD_FRACTION_FULL = 0.2
+# Risk score above which each level applies
+RISK_THRESHOLDS = {'HIGH': 0.7, 'MEDIUM': 0.4}
+
+def calculate_flood_risk(ndvi, ndwi, soil_moisture, water_level=None, sar_flood_fraction=None):
+    """
+    Calculate flood risk with more sophisticated logic.
+    sar_flood_fraction is the flooded share of the surrounding area from Sentinel-1 change detection.
+    """
     try:
         # Normalize values
         norm_ndvi = (ndvi + 1) / 2  # NDVI ranges from -1 to 1
         norm_ndwi = (ndwi + 1) / 2  # NDWI ranges from -1 to 1
         norm_soil = min(1, soil_moisture)  # Ensure soil moisture is between 0 and 1
 
-        # Weights for each factor
-        weights = {
-            'ndvi': 0.25,    # Vegetation cover
-            'ndwi': 0.35,    # Water content
-            'soil': 0.40     # Soil moisture
-        }
+        weights = RISK_WEIGHTS
 
         # Calculate risk score (0-1)
         risk_factors = [
@@ -201,20 +185,26 @@ def calculate_flood_risk(ndvi, ndwi, soil_moisture, water_level=None):
             norm_soil * weights['soil']         # Higher soil moisture -> higher risk
         ]
         
+        added_weight = 0
         if water_level is not None and water_level > 0:
             # Normalize water level (assuming max reasonable level is 10m)
             norm_water = min(1, water_level / 10)
-            risk_factors.append(norm_water * 0.2)  # Add water level factor
-            # Readjust other weights
-            total = sum(risk_factors)
-            risk_score = total / (1 + 0.2)  # Adjust for added weight
-        else:
-            risk_score = sum(risk_factors)
+            risk_factors.append(norm_water * WATER_LEVEL_WEIGHT)  # Add water level factor
+            added_weight += WATER_LEVEL_WEIGHT
+
+        if sar_flood_fraction is not None:
+            # Observed flooding, independent of cloud cover
+            norm_flood = min(1, sar_flood_fraction / SAR_FLOOD_FRACTION_FULL)
+            risk_factors.append(norm_flood * SAR_FLOOD_WEIGHT)
+            added_weight += SAR_FLOOD_WEIGHT
+
+        # Readjust other weights
+        risk_score = sum(risk_factors) / (1 + added_weight)  # Adjust for added weight
 
         # Determine risk level with more granular thresholds
-        if risk_score > 0.7:
+        if risk_score > RISK_THRESHOLDS['HIGH']:
             risk_level = 'HIGH'
-        elif risk_score > 0.4:
+        elif risk_score > RISK_THRESHOLDS['MEDIUM']:
             risk_level = 'MEDIUM'
         else:
             risk_level = 'LOW'
@@ -232,35 +222,122 @@ def calculate_flood_risk(ndvi, ndwi, soil_moisture, water_level=None):
             'risk_score': 0
         }
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_location():
-    """Analyze location for flood risk"""
+def get_flood_extent(lat, lng):
+    """Sentinel-1 flood extent around the point, or None if unavailable"""
     try:
-        data = request.json
-        lat = float(data['lat'])
-        lng = float(data['lng'])
-
-        # Get location name
-        location_name = get_location_name(lat, lng)
-
-        # Get current satellite data
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=1)
-        satellite_data = get_satellite_data(
-            lat, lng,
-            start_date.strftime('%Y-%m-%d'),
-            end_date.strftime('%Y-%m-%d')
-        )
-
-        # Calculate flood risk
-        risk_analysis = calculate_flood_risk(
-            satellite_data['ndvi'],
-            satellite_data['ndwi'],
-            satellite_data['soil_moisture']
-        )
+        return sar.flood_extent(lat=lat, lng=lng, preview=False)
+    except ee_cache.ReplayMissError:
+        raise
+    except Exception as e:
+        logger.error(f"SAR flood extent failed: {str(e)}")
+        return None
 
-        # Store results in database
-        conn = psycopg2.connect(**DB_CONFIG)
+def get_warm_analysis(lat, lng):
+    """Pre-computed watchlist analysis for the point's grid cell, or None"""
+    try:
+        return watchlist.get_warm(lat, lng)
+    except Exception as e:
+        logger.error(f"Warm analysis lookup failed: {str(e)}")
+        return None
+
+def analysis_stages(lat, lng):
+    """
+    Run the full analysis for a point, yielding (event, data) as each part is ready:
+    'risk' with the current indicators, 'location', 'history' with trends and anomalies,
+    then 'done' with (response data, satellite data). Geocoding runs alongside the
+    satellite fetch and the water level lookup; history starts once the current
+    observation is recorded.
+    """
+    end_date = ee_cache.now()
+    start_date = end_date - timedelta(days=1)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        def submit(name, fn, *args):
+            def run():
+                with log_config.stage(name):
+                    return fn(*args)
+            # Keeps the request's trace id on records logged by the stage
+            return executor.submit(contextvars.copy_context().run, run)
+
+        water_level_future = submit('water_level', get_water_level, lat, lng, end_date)
+        pending = {
+            submit('geocode', get_location_name, lat, lng): 'location',
+            submit('satellite', get_satellite_data, lat, lng,
+                   start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')): 'risk',
+            water_level_future: 'water_level'
+        }
+        satellite_data = None
+        history_started = False
+        extent_future = submit('sar', get_flood_extent, lat, lng) if SAR_IN_ANALYSIS else None
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                event = pending.pop(future)
+
+                if event == 'location':
+                    location_name = future.result()
+                    yield 'location', {'location': location_name}
+
+                elif event == 'risk':
+                    satellite_data = future.result()
+                    flood_extent = extent_future.result() if extent_future else None
+                    with log_config.stage('risk'):
+                        risk_analysis = calculate_flood_risk(
+                            satellite_data['ndvi'],
+                            satellite_data['ndwi'],
+                            satellite_data['soil_moisture'],
+                            sar_flood_fraction=flood_extent['flood_fraction'] if flood_extent else None
+                        )
+                    current = {
+                        'coordinates': f"{lat:.4f}, {lng:.4f}",
+                        'risk_level': risk_analysis['risk_level'],
+                        'confidence': risk_analysis['confidence'],
+                        'vegetation': {'ndvi': round(satellite_data['ndvi'], 2)},
+                        'water': {'ndwi': round(satellite_data['ndwi'], 2)},
+                        'soil_moisture': {'value': round(satellite_data['soil_moisture'] * 100, 1)},
+                        'image_date': satellite_data['image_date']
+                    }
+                    if flood_extent:
+                        current['flood_extent'] = flood_extent
+                    yield 'risk', current
+
+                elif event == 'water_level':
+                    # Risk does not use it; only the recorded observation waits for it
+                    pass
+
+                else:
+                    historical_data = future.result()
+                    trends = {
+                        'historical_data': historical_data,
+                        'vegetation': {
+                            'trend': get_trend(historical_data['ndvi'], lat, lng, 'ndvi'),
+                            'anomaly': timeseries_store.anomaly(lat, lng, 'ndvi')
+                        },
+                        'water': {
+                            'trend': get_trend(historical_data['ndwi'], lat, lng, 'ndwi'),
+                            'anomaly': timeseries_store.anomaly(lat, lng, 'ndwi')
+                        },
+                        'soil_moisture': {
+                            'trend': get_trend(historical_data['soil_moisture'], lat, lng, 'soil_moisture'),
+                            'anomaly': timeseries_store.anomaly(lat, lng, 'soil_moisture')
+                        }
+                    }
+                    yield 'history', trends
+
+                if satellite_data is not None and water_level_future.done() and not history_started:
+                    # Record the observation in the per-location history (never the mock fallback)
+                    if not satellite_data.get('mock'):
+                        timeseries_store.add(lat, lng, satellite_data['image_date'],
+                                             dict(satellite_data, water_level=water_level_future.result()))
+                    pending[submit('history', get_historical_analysis, lat, lng)] = 'history'
+                    history_started = True
+
+    water_level = water_level_future.result()
+
+    # Store results in database
+    with log_config.stage('database'):
+        conn = get_db_connection()
         cur = conn.cursor()
         try:
             cur.execute("""
@@ -268,49 +345,137 @@ def analyze_location():
                 (latitude, longitude, location_name, risk_level, ndvi, ndwi, 
                 soil_moisture, water_level, confidence_score)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
+                RETURNING id, analysis_date::date
             """, (
                 lat, lng, location_name, risk_analysis['risk_level'],
                 satellite_data['ndvi'], satellite_data['ndwi'],
                 satellite_data['soil_moisture'], 
-                satellite_data.get('water_level', 0),
+                water_level,
                 risk_analysis['confidence']
             ))
-            analysis_id = cur.fetchone()[0]
+            analysis_id, analysis_day = cur.fetchone()
+            partitions.record_summary(
+                cur, lat, lng, risk_analysis['risk_level'], dict(satellite_data, water_level=water_level),
+                risk_analysis['confidence'], analysis_day
+            )
             conn.commit()
         finally:
             cur.close()
             conn.close()
 
-        # Get historical data
-        historical_data = get_historical_analysis(lat, lng)
-
-        response_data = {
-            'location': location_name,
-            'coordinates': f"{lat:.4f}, {lng:.4f}",
-            'risk_level': risk_analysis['risk_level'],
-            'confidence': risk_analysis['confidence'],
-            'vegetation': {
-                'ndvi': round(satellite_data['ndvi'], 2),
-                'trend': get_trend(historical_data['ndvi'])
-            },
-            'water': {
-                'ndwi': round(satellite_data['ndwi'], 2),
-                'trend': get_trend(historical_data['ndwi'])
-            },
-            'soil_moisture': {
-                'value': round(satellite_data['soil_moisture'] * 100, 1),
-                'trend': get_trend(historical_data['soil_moisture'])
-            },
-            'historical_data': historical_data,
-            'analysis_id': analysis_id
-        }
+    response_data = {
+        'location': location_name,
+        'coordinates': current['coordinates'],
+        'risk_level': current['risk_level'],
+        'confidence': current['confidence'],
+        'vegetation': dict(current['vegetation'], **trends['vegetation']),
+        'water': dict(current['water'], **trends['water']),
+        'soil_moisture': dict(current['soil_moisture'], **trends['soil_moisture']),
+        'historical_data': trends['historical_data'],
+        'image_date': current['image_date'],
+        'analysis_id': analysis_id
+    }
+    if flood_extent:
+        response_data['flood_extent'] = flood_extent
+
+    yield 'done', (response_data, satellite_data)
+
+def run_analysis(lat, lng):
+    """Run the full analysis for a point; returns (response data, satellite data)"""
+    for event, data in analysis_stages(lat, lng):
+        if event == 'done':
+            return data
 
-        return jsonify(response_data)
+@app.route('/api/analyze', methods=['POST'])
+def analyze_location():
+    """Analyze location for flood risk"""
+    try:
+        data = request.json
+        lat = float(data['lat'])
+        lng = float(data['lng'])
+
+        # Watchlisted places are refreshed in the background
+        warm = get_warm_analysis(lat, lng)
+        if warm is not None:
+            etag, response_data = warm
+            return json_response(response_data, etag=etag)
+
+        response_data, _ = run_analysis(lat, lng)
+        etag = make_etag(cell_id(lat, lng), response_data['image_date'], response_data['analysis_id'])
+        return json_response(response_data, etag=etag)
 
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, status=500)
+
+@app.route('/api/analyze/stream', methods=['POST'])
+def analyze_location_stream():
+    """
+    Analyze location for flood risk, streamed as NDJSON: one {"event", "data"} line
+    per part (risk, location, history) as it completes, then done with the full result
+    """
+    try:
+        data = request.json
+        lat = float(data['lat'])
+        lng = float(data['lng'])
+    except (KeyError, TypeError, ValueError):
+        return json_response({'error': 'lat and lng are required'}, status=400)
+
+    def line(event, payload):
+        return dumps({'event': event, 'data': payload}) + b'\n'
+
+    def generate():
+        try:
+            warm = get_warm_analysis(lat, lng)
+            if warm is not None:
+                yield line('done', warm[1])
+                return
+            for event, payload in analysis_stages(lat, lng):
+                if event == 'done':
+                    payload = payload[0]
+                yield line(event, payload)
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            yield line('error', {'error': str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        # Proxies must pass each line on instead of buffering the response
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/analyze', methods=['GET'])
+def analyze_cell():
+    """Cacheable analysis of the grid cell containing lat/lng"""
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+    except (KeyError, ValueError):
+        return json_response({'error': 'lat and lng query parameters are required'}, status=400)
+
+    try:
+        cell = cell_id(lat, lng)
+        cache_control = f"public, max-age={ANALYZE_CACHE_MAX_AGE}"
+
+        cached = analysis_cache.get(cell) or get_warm_analysis(lat, lng)
+        if cached is not None:
+            etag, response_data = cached
+            analysis_cache.put(cell, etag, response_data)
+            return json_response(response_data, etag=etag, cache_control=cache_control)
+
+        # Every point in the cell gets the analysis of the cell centre
+        response_data, satellite_data = run_analysis(*cell_center(lat, lng))
+        if satellite_data.get('mock'):
+            return json_response(response_data, cache_control='no-store')
+
+        etag = make_etag(cell, response_data['image_date'])
+        analysis_cache.put(cell, etag, response_data)
+        return json_response(response_data, etag=etag, cache_control=cache_control)
+
+    except Exception as e:
+        logger.error(f"Analysis failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
 
 # def get_historical_analysis(lat, lng, days=10):
 #     """Get historical analysis data"""
@@ -359,32 +524,39 @@ def analyze_location():
 #         }
 
 def get_water_level(lat, lng, date):
-    """Get water level data from satellite imagery"""
+    """Get water level data from satellite imagery, or None if unavailable"""
     try:
+        # Static occurrence layer: use the local copy when the point is covered
+        water_value = local_rasters.sample('water_occurrence', lat, lng)
+        if water_value is not None:
+            return water_value * 0.1
+
         # Get water level data from Global Surface Water dataset
         gsw = ee.Image('JRC/GSW1_4/GlobalSurfaceWater')
-        point = ee.Geometry.Point([lng, lat])
         
-        # Calculate water occurrence
+        # Calculate water occurrence; concurrent lookups share one reduceRegions call
         water_occurrence = gsw.select('occurrence')
-        water_value = water_occurrence.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=point,
-            scale=30
-        ).get('occurrence').getInfo()
+        water_value = ee_scheduler.sample_point(water_occurrence, lat, lng, scale=30).get('occurrence')
         
         # Convert occurrence to approximate water level (simplified model)
         # You might want to adjust this based on your specific needs
         water_level = water_value * 0.1 if water_value else 0
         
         return water_level
+    except ee_cache.ReplayMissError:
+        raise
     except Exception as e:
         logger.error(f"Water level calculation failed: {str(e)}")
-        return np.random.uniform(0, 5)  # Return mock data between 0-5 meters
+        return None
 
 def get_historical_analysis(lat, lng, days=10):
     """Get historical analysis data with water level"""
-    end_date = datetime.now()
+    # Served from recorded observations once the location has some history
+    stored_history = timeseries_store.history(lat, lng, days)
+    if stored_history is not None:
+        return stored_history
+
+    end_date = ee_cache.now()
     start_date = end_date - timedelta(days=days)
     
     try:
@@ -394,7 +566,7 @@ def get_historical_analysis(lat, lng, days=10):
             end_date.strftime('%Y-%m-%d')
         )
 
-        # Get current water level
+        # Get current water level (recorded in the store by analysis_stages)
         current_water_level = get_water_level(lat, lng, end_date)
 
         # Generate daily data points
@@ -416,7 +588,7 @@ def get_historical_analysis(lat, lng, days=10):
             soil_moisture_values.append(round(
                 satellite_data['soil_moisture'] + np.random.uniform(-0.05, 0.05), 2))
             water_level_values.append(round(
-                current_water_level + np.random.uniform(-0.5, 0.5), 2))
+                current_water_level + np.random.uniform(-0.5, 0.5), 2) if current_water_level is not None else None)
 
         return {
             'dates': dates,
@@ -426,6 +598,8 @@ def get_historical_analysis(lat, lng, days=10):
             'water_level': water_level_values
         }
 
+    except ee_cache.ReplayMissError:
+        raise
     except Exception as e:
         logger.error(f"Historical analysis failed: {str(e)}")
         return {
@@ -436,8 +610,14 @@ def get_historical_analysis(lat, lng, days=10):
             'water_level': []
         }
 
-def get_trend(values):
-    """Calculate trend from historical values"""
+def get_trend(values, lat=None, lng=None, indicator=None):
+    """Calculate trend from historical values, or from the stored series when available"""
+    if indicator is not None:
+        stored_trend = timeseries_store.trend(lat, lng, indicator)
+        if stored_trend is not None:
+            return stored_trend['direction']
+
+    values = [v for v in values if v is not None]
     if not values or len(values) < 2:
         return 'Stable'
     
@@ -446,10 +626,345 @@ def get_trend(values):
         return 'Stable'
     return 'Increasing' if diff > 0 else 'Decreasing'
 
+# Sentinel bands fetched for each sensor the model can be trained on
+PATCH_BANDS = {
+    's1': ('COPERNICUS/S1_GRD', ['VV', 'VH']),
+    's2': ('COPERNICUS/S2_SR_HARMONIZED', ['B3', 'B4', 'B8'])
+}
+
+def get_feature_patch(lat, lng, stats, days=30):
+    """Fetch a model input patch around a point and compute its features"""
+    from pipeline.band_math import ndvi_ndwi, soil_moisture_proxy
+
+    sensor = stats['sensor']
+    patch_size = stats['target_shape'][0]
+    # Training scenes are 512 px at 10 m resized to the patch size
+    scale = 5120 / patch_size
+
+    point = ee.Geometry.Point([lng, lat])
+    region = point.buffer(2560).bounds()
+    end_date = ee_cache.now()
+    start_date = end_date - timedelta(days=days)
+
+    collection_id, band_names = PATCH_BANDS[sensor]
+    collection = ee.ImageCollection(collection_id) \
+        .filterBounds(region) \
+        .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    if sensor == 's2':
+        collection = collection.sort('CLOUDY_PIXEL_PERCENTAGE')
+    else:
+        collection = collection.filter(ee.Filter.eq('instrumentMode', 'IW')).sort('system:time_start', False)
+
+    image = ee.Image(collection.first()).select(band_names) \
+        .reproject(crs='EPSG:3857', scale=scale)
+    values = ee_scheduler.get_info(image.sampleRectangle(region=region, defaultValue=0))['properties']
+
+    bands = []
+    for name in band_names:
+        band = np.asarray(values[name], dtype=np.float32)[:patch_size, :patch_size]
+        rows, cols = band.shape
+        bands.append(np.pad(band, ((0, patch_size - rows), (0, patch_size - cols)), mode='edge'))
+
+    if sensor == 's2':
+        return ndvi_ndwi(*bands)
+    return soil_moisture_proxy(*bands)[..., np.newaxis]
+
+@app.route('/api/predict', methods=['POST'])
+def predict():
+    """Flood probability from the trained CNN for feature patches or a point"""
+    try:
+        data = request.json or {}
+        _, stats = model_server.get_model()
+        width, height = stats['target_shape']
+        expected_shape = (height, width, len(stats['channels']))
+
+        if 'patches' in data:
+            patches = [np.asarray(patch, dtype=np.float32) for patch in data['patches']]
+            for patch in patches:
+                if patch.shape != expected_shape:
+                    return jsonify({'error': f"Patches must have shape {list(expected_shape)}"}), 400
+        elif 'lat' in data and 'lng' in data:
+            patches = [get_feature_patch(float(data['lat']), float(data['lng']), stats)]
+        else:
+            return jsonify({'error': 'Provide either patches or lat/lng'}), 400
+
+        if not patches:
+            return jsonify({'predictions': []})
+
+        probabilities = model_server.predict_patches(patches)
+        return jsonify({
+            'predictions': [
+                {
+                    'flood_probability': round(p, 4),
+                    'prediction': 'FLOODING' if p >= 0.5 else 'NO_FLOODING'
+                }
+                for p in probabilities
+            ],
+            'channels': stats['channels']
+        })
+
+    except Exception as e:
+        logger.error(f"Prediction failed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def run_batch_job(params):
+    """Analyze a list of points; failures are reported per point"""
+    results = []
+    for point in params['points']:
+        try:
+            response_data, _ = run_analysis(float(point['lat']), float(point['lng']))
+            results.append(response_data)
+        except Exception as e:
+            results.append({'lat': point['lat'], 'lng': point['lng'], 'error': str(e)})
+    return {'results': results}
+
+def run_zonal_job(params):
+    return zonal.zonal_statistics(
+        params['geometry'], RISK_WEIGHTS, RISK_THRESHOLDS,
+        end_date=params.get('date'),
+        days=int(params.get('days', 30)),
+        scale=int(params.get('scale', zonal.ZONAL_SCALE))
+    )
+
+def job_handlers():
+    """Job kinds accepted by POST /api/jobs"""
+    return {
+        'analysis': lambda params: run_analysis(float(params['lat']), float(params['lng']))[0],
+        'batch': run_batch_job,
+        'zonal': run_zonal_job
+    }
+
+job_queue = jobs.JobQueue(job_handlers())
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a long-running analysis; returns the job id immediately"""
+    try:
+        data = request.json or {}
+        kind = data.get('kind', 'analysis')
+        params = data.get('params', {})
+        job_id, created = job_queue.submit(kind, params)
+        return json_response({
+            'id': job_id,
+            'status_url': f"/api/jobs/{job_id}",
+            'deduplicated': not created
+        }, status=202)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Job submission failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status, and the result once it is done"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return json_response({'error': 'Job not found or expired'}, status=404)
+        return json_response(job)
+    except Exception as e:
+        logger.error(f"Job lookup failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+@app.route('/api/zonal', methods=['POST'])
+def analyze_polygon():
+    """Zonal flood-risk statistics for a GeoJSON polygon; large polygons are run as a job"""
+    try:
+        params = request.json or {}
+        scale = int(params.get('scale', zonal.ZONAL_SCALE))
+        if scale < 10:
+            return json_response({'error': 'scale must be at least 10 m'}, status=400)
+        geometry = zonal.parse_geometry(params.get('geometry') or {})
+        if len(zonal.split_tiles(geometry, scale)) > ZONAL_SYNC_MAX_TILES:
+            job_id, created = job_queue.submit('zonal', params)
+            return json_response({
+                'id': job_id,
+                'status_url': f"/api/jobs/{job_id}",
+                'deduplicated': not created
+            }, status=202)
+        return json_response(run_zonal_job(params))
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+    except LookupError as e:
+        return json_response({'error': str(e)}, status=404)
+    except Exception as e:
+        logger.error(f"Zonal analysis failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+@app.route('/api/flood-extent', methods=['POST'])
+def analyze_flood_extent():
+    """Cloud-independent flood extent from Sentinel-1 change detection, with the resulting flood risk"""
+    try:
+        data = request.json or {}
+        options = {
+            'end_date': data.get('date'),
+            'current_days': int(data.get('current_days', sar.CURRENT_DAYS)),
+            'reference_start_days': int(data.get('reference_start_days', sar.REFERENCE_START_DAYS)),
+            'reference_end_days': int(data.get('reference_end_days', sar.REFERENCE_END_DAYS))
+        }
+        if data.get('geometry'):
+            geometry = zonal.parse_geometry(data['geometry'])
+            if zonal.area_km2(geometry) > zonal.MAX_AREA_KM2:
+                return json_response({'error': 'Polygon is too large'}, status=400)
+            extent = sar.flood_extent(geometry=geometry, **options)
+            lat, lng = geometry.centroid.y, geometry.centroid.x
+        else:
+            lat = float(data['lat'])
+            lng = float(data['lng'])
+            radius_m = min(int(data.get('radius_m', sar.DEFAULT_RADIUS_M)), 50000)
+            extent = sar.flood_extent(lat=lat, lng=lng, radius_m=radius_m, **options)
+
+        if extent is None:
+            return json_response({'error': 'No Sentinel-1 coverage for the reference or current period'},
+                                 status=404)
+
+        satellite_data = get_satellite_data(
+            lat, lng,
+            (ee_cache.now() - timedelta(days=1)).strftime('%Y-%m-%d'),
+            ee_cache.now().strftime('%Y-%m-%d')
+        )
+        extent['risk'] = calculate_flood_risk(
+            satellite_data['ndvi'],
+            satellite_data['ndwi'],
+            satellite_data['soil_moisture'],
+            sar_flood_fraction=extent['flood_fraction']
+        )
+        return json_response(extent)
+    except (KeyError, ValueError) as e:
+        return json_response({'error': f"Invalid request: {str(e)}"}, status=400)
+    except Exception as e:
+        logger.error(f"Flood extent analysis failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+@app.route('/api/export', methods=['GET'])
+def export_results():
+    """Stream analysis_results or historical_data as csv, ndjson or parquet"""
+    fmt = request.args.get('format', 'csv')
+    table = request.args.get('table', 'analysis_results')
+    if fmt not in export.FORMATS:
+        return json_response({'error': f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    if table not in export.TABLES:
+        return json_response({'error': f"table must be one of {', '.join(export.TABLES)}"}, status=400)
+    if fmt == 'parquet' and export.pa is None:
+        return json_response({'error': 'Parquet export is not available on this server'}, status=400)
+    try:
+        filters = export.parse_filters(request.args)
+    except ValueError as e:
+        return json_response({'error': f"Invalid filter: {str(e)}"}, status=400)
+
+    sql, params, columns = export.build_query(table, filters)
+
+    def generate():
+        conn = get_db_connection()
+        try:
+            yield from export.encode(fmt, export.iter_chunks(conn, sql, params), columns, table)
+        except Exception as e:
+            logger.error(f"Export failed: {str(e)}")
+            raise
+        finally:
+            conn.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f"attachment; filename={table}.{fmt}"}
+    )
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    """Daily risk counts and per-cell aggregates for dashboards, read from risk_daily_summary"""
+    try:
+        end_day = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date() \
+            if request.args.get('end_date') else datetime.now().date()
+        start_day = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date() \
+            if request.args.get('start_date') else end_day - timedelta(days=30)
+        bbox = tuple(float(v) for v in request.args['bbox'].split(',')) if request.args.get('bbox') else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox must be west,south,east,north")
+    except ValueError as e:
+        return json_response({'error': f"Invalid request: {str(e)}"}, status=400)
+
+    conn = get_db_connection()
+    try:
+        summary = partitions.daily_summary(conn, start_day, end_day, bbox)
+        summary.update({'start_date': start_day.strftime('%Y-%m-%d'), 'end_date': end_day.strftime('%Y-%m-%d')})
+        return json_response(summary, cache_control='public, max-age=300')
+    except Exception as e:
+        logger.error(f"Summary query failed: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+    finally:
+        conn.close()
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Serving metrics"""
+    return jsonify({
+        'predict': model_server.metrics(),
+        'earth_engine': ee_scheduler.metrics(),
+        'earth_engine_cache': ee_cache.metrics(),
+        'composites': composites.metrics(),
+        'jobs': job_queue.metrics(),
+        'watchlist': watchlist_scheduler.last_run if watchlist_scheduler else None,
+        'partitions': partition_maintainer.last_run if partition_maintainer else None,
+        'local_raster_refresh': raster_refresher.last_run if raster_refresher else None,
+        'logging': {'dropped_records': log_config.dropped_records()}
+    })
+
+watchlist_scheduler = None
+partition_maintainer = None
+raster_refresher = None
+
+def start_background_workers(singletons=True):
+    """Start optional in-process workers (once per server, not per request)"""
+    if jobs.JOB_WORKERS > 0:
+        job_queue.start()
+    if singletons:
+        start_singleton_workers()
+
+def start_singleton_workers():
+    """Watchlist, partition maintenance and local raster refresh; with several server processes, run in one only"""
+    global watchlist_scheduler, partition_maintainer, raster_refresher
+    if os.getenv('WATCHLIST_SCHEDULER', '0') == '1':
+        watchlist_scheduler = watchlist.WatchlistScheduler(run_analysis)
+        watchlist_scheduler.start()
+    # Creates next months' partitions before inserts need them
+    if os.getenv('PARTITION_MAINTENANCE', '1') == '1':
+        partition_maintainer = partitions.PartitionMaintainer()
+        partition_maintainer.start()
+    # Keeps ingested soil moisture recent enough to be served locally
+    if LOCAL_RASTER_REFRESH_HOURS > 0:
+        raster_refresher = LocalRasterRefresher(local_rasters.directory)
+        raster_refresher.start()
+
+def preload_assets():
+    """
+    Load read-only state in the pre-fork master (see gunicorn.conf.py), so every
+    worker shares it copy-on-write instead of loading its own copy
+    """
+    loaded = []
+    if os.getenv('PRELOAD_MODEL', '1') == '1' and model_server.preload():
+        loaded.append('model')
+    # Memory-mapped, so the pages are shared through the page cache
+    loaded.extend(local_rasters.preload())
+    # Keep the garbage collector from touching (and so copying) objects that exist before fork
+    gc.freeze()
+    return loaded
+
+def after_fork():
+    """Re-create what does not survive fork in a worker: threads and Earth Engine connections"""
+    log_config.after_fork()
+    timeseries_store.start_flush_thread()
+    ee_cache.initialize(os.getenv('EE_PROJECT', 'ee-ndirangudenise61'))
+
 if __name__ == '__main__':
     init_db()
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
+    # With the debug reloader only the child process serves requests
+    if not debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(
         host=os.getenv('HOST', '0.0.0.0'),
         port=int(os.getenv('PORT', 5000)),
-        debug=os.getenv('FLASK_DEBUG', '1') == '1'
+        debug=debug
     )
\ No newline at end of file
@@ -0,0 +1,368 @@
+# composites.py
+"""
+Cloud-free Sentinel-2 composites per fixed tile and time bucket, stored locally.
+
+Instead of searching for the least cloudy scene on every request, the first
+request in a tile and time bucket builds a cloud-masked (SCL) median composite
+of the COMPOSITE_WINDOW_DAYS before the bucket end, downloads its NDVI, NDWI
+and ERA5-Land soil moisture for the whole tile in one computePixels call, and
+stores it as a memory-mapped .npy with a .json sidecar listing the scenes used.
+All later point queries in that tile and bucket are array lookups.
+
+While a bucket can still receive scenes (until COMPOSITE_SETTLE_DAYS after it
+ends), the scene list is re-checked at most every COMPOSITE_CHECK_MINUTES and
+the composite is rebuilt when new scenes have arrived.
+
+Use it with IMAGERY_BACKEND=composite,ee (the default), so points outside any
+cloud-free pixel fall back to the per-image search with Landsat.
+
+Pre-build the tiles of a region:
+    python composites.py warm --bbox 33.9 -4.7 41.9 5.0
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import ee_cache
+import ee_scheduler
+from grid import cell_index
+from imagery import ImageryBackend, to_datetime
+from local_rasters import compute_pixels, write_meta
+
+logger = logging.getLogger(__name__)
+
+COMPOSITE_DIR = os.getenv('COMPOSITE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'composites'))
+# Tile size in degrees (0.05° is about 5.5 km); each tile is one computePixels request
+COMPOSITE_TILE_DEGREES = float(os.getenv('COMPOSITE_TILE_DEGREES', 0.05))
+# Pixel size in degrees (about 28 m, close to the 30 m used for point reductions)
+COMPOSITE_RESOLUTION = float(os.getenv('COMPOSITE_RESOLUTION', 0.00025))
+# One composite per bucket; Sentinel-2 revisits every 5 days
+COMPOSITE_BUCKET_DAYS = int(os.getenv('COMPOSITE_BUCKET_DAYS', 5))
+# Scenes from this many days before the bucket end go into the median
+COMPOSITE_WINDOW_DAYS = int(os.getenv('COMPOSITE_WINDOW_DAYS', 30))
+# Scenes are skipped entirely above this cloud cover; the rest are masked per pixel
+COMPOSITE_MAX_CLOUD = float(os.getenv('COMPOSITE_MAX_CLOUD', 80))
+# Sentinel-2 L2A is usually published within a few days; after that a bucket is final
+COMPOSITE_SETTLE_DAYS = int(os.getenv('COMPOSITE_SETTLE_DAYS', 3))
+COMPOSITE_CHECK_MINUTES = float(os.getenv('COMPOSITE_CHECK_MINUTES', 60))
+# Buckets ending longer ago than this are deleted
+COMPOSITE_KEEP_DAYS = int(os.getenv('COMPOSITE_KEEP_DAYS', 90))
+
+S2_COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+BANDS = ('ndvi', 'ndwi', 'soil_moisture')
+# Scene classification: saturated, cloud shadow, cloud medium/high probability, cirrus
+SCL_MASKED_CLASSES = (1, 3, 8, 9, 10)
+BUCKET_EPOCH = date(2017, 1, 1)
+NODATA = -9999
+
+
+def bucket_of(day, bucket_days=COMPOSITE_BUCKET_DAYS):
+    return (to_datetime(day).date() - BUCKET_EPOCH).days // bucket_days
+
+
+def bucket_end(bucket, bucket_days=COMPOSITE_BUCKET_DAYS):
+    """First day after the bucket"""
+    return BUCKET_EPOCH + timedelta(days=(bucket + 1) * bucket_days)
+
+
+def tile_bounds(row, col, tile_degrees=COMPOSITE_TILE_DEGREES):
+    """(west, south, east, north) of a tile from grid.cell_index"""
+    south = row * tile_degrees - 90
+    west = col * tile_degrees - 180
+    return west, south, west + tile_degrees, south + tile_degrees
+
+
+def cloud_masked(image):
+    import ee
+
+    scl = image.select('SCL')
+    masked = ee.Image(0)
+    for value in SCL_MASKED_CLASSES:
+        masked = masked.Or(scl.eq(value))
+    return image.updateMask(masked.Not())
+
+
+def build_collection(bbox, start, end, max_cloud=COMPOSITE_MAX_CLOUD):
+    import ee
+
+    return ee.ImageCollection(S2_COLLECTION) \
+        .filterBounds(ee.Geometry.Rectangle(list(bbox))) \
+        .filterDate(start, end) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud))
+
+
+def build_image(collection, start, end):
+    """NDVI and NDWI of the cloud-masked median, and mean ERA5-Land soil moisture"""
+    import ee
+
+    composite = collection.map(cloud_masked).median()
+    soil = ee.ImageCollection('ECMWF/ERA5_LAND/HOURLY') \
+        .filterDate(start, end) \
+        .select('volumetric_soil_water_layer_1') \
+        .mean() \
+        .rename('soil_moisture')
+    return composite.normalizedDifference(['B8', 'B4']).rename('ndvi') \
+        .addBands(composite.normalizedDifference(['B3', 'B8']).rename('ndwi')) \
+        .addBands(soil) \
+        .toFloat() \
+        .unmask(NODATA)
+
+
+def scene_list(collection):
+    """(sorted scene ids, date of the latest scene or None)"""
+    # Always asked of Earth Engine (not the response cache): the answer changes as scenes arrive
+    scenes = sorted(ee_scheduler.get_info(collection.aggregate_array('system:index'), fresh=True))
+    # Sentinel-2 ids start with the sensing time, e.g. 20240105T073211_20240105T075132_T36MZE
+    dates = [scene[:8] for scene in scenes if scene[:8].isdigit()]
+    latest = max(dates) if dates else None
+    return scenes, latest and f"{latest[:4]}-{latest[4:6]}-{latest[6:]}"
+
+
+class Composite:
+    """A stored composite tile: (bands, rows, cols) float32 array plus its sidecar"""
+
+    def __init__(self, directory, name):
+        with open(os.path.join(directory, f"{name}.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.data = None
+        if self.meta['scenes']:
+            self.data = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        self.west, self.south, self.east, self.north = self.meta['bbox']
+        self.resolution = self.meta['resolution']
+
+    def sample(self, lat, lng):
+        """{band: value} at a point, or None where no cloud-free pixel was available"""
+        if self.data is None:
+            return None
+        row = int((self.north - lat) // self.resolution)
+        col = int((lng - self.west) // self.resolution)
+        if not (0 <= row < self.data.shape[1] and 0 <= col < self.data.shape[2]):
+            return None
+        values = {band: float(v) for band, v in zip(self.meta['bands'], self.data[:, row, col])}
+        if values['ndvi'] == NODATA or values['ndwi'] == NODATA:
+            return None
+        if values['soil_moisture'] == NODATA:
+            values['soil_moisture'] = None
+        return values
+
+
+class CompositeStore:
+    """Builds, caches and invalidates composites by (tile, bucket)"""
+
+    def __init__(self, directory=COMPOSITE_DIR, tile_degrees=COMPOSITE_TILE_DEGREES,
+                 resolution=COMPOSITE_RESOLUTION, bucket_days=COMPOSITE_BUCKET_DAYS,
+                 window_days=COMPOSITE_WINDOW_DAYS):
+        self.directory = directory
+        self.tile_degrees = tile_degrees
+        self.resolution = resolution
+        self.bucket_days = bucket_days
+        self.window_days = window_days
+        self.composites = {}
+        self.checked = {}
+        self.lock = threading.Lock()
+        self.build_locks = {}
+        self.stats = {'hits': 0, 'builds': 0, 'invalidated': 0, 'checks': 0, 'empty': 0, 'errors': 0}
+
+    def location(self, row, col, bucket):
+        return os.path.join(self.directory, str(bucket)), f"{row}_{col}"
+
+    def is_open(self, bucket):
+        """Whether the bucket may still receive scenes"""
+        return ee_cache.now().date() < bucket_end(bucket, self.bucket_days) + timedelta(days=COMPOSITE_SETTLE_DAYS)
+
+    def window(self, bucket):
+        end = bucket_end(bucket, self.bucket_days)
+        return (end - timedelta(days=self.window_days)).isoformat(), end.isoformat()
+
+    def load(self, row, col, bucket):
+        """The stored composite (re-read when rebuilt on disk), or None"""
+        directory, name = self.location(row, col, bucket)
+        try:
+            mtime = os.path.getmtime(os.path.join(directory, f"{name}.json"))
+        except OSError:
+            return None
+        key = (row, col, bucket)
+        with self.lock:
+            cached = self.composites.get(key)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, Composite(directory, name))
+                self.composites[key] = cached
+            return cached[1]
+
+    def build(self, row, col, bucket, scenes=None, latest=None):
+        """Download and store the composite of a tile and bucket"""
+        bbox = tile_bounds(row, col, self.tile_degrees)
+        start, end = self.window(bucket)
+        collection = build_collection(bbox, start, end)
+        if scenes is None:
+            scenes, latest = scene_list(collection)
+
+        directory, name = self.location(row, col, bucket)
+        os.makedirs(directory, exist_ok=True)
+        size = int(round(self.tile_degrees / self.resolution))
+        meta = {'bands': list(BANDS), 'scenes': scenes, 'latest_scene': latest,
+                'start_date': start, 'end_date': end, 'built_at': time.time()}
+        if scenes:
+            pixels = compute_pixels(build_image(collection, start, end), bbox[0], bbox[3], size, size,
+                                    self.resolution)
+            array = np.stack([pixels[band] for band in BANDS]).astype(np.float32)
+            tmp_path = os.path.join(directory, f"{name}.npy.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        else:
+            with self.lock:
+                self.stats['empty'] += 1
+        write_meta(directory, name, (len(BANDS), size, size), np.float32, bbox, self.resolution, NODATA, **meta)
+        with self.lock:
+            self.stats['builds'] += 1
+            self.checked[(row, col, bucket)] = time.time()
+        logger.info(f"Built composite {name} for bucket {bucket} ({start} to {end}) from {len(scenes)} scenes")
+        return self.load(row, col, bucket)
+
+    def get(self, row, col, bucket):
+        """Composite for a tile and bucket, built or rebuilt as needed"""
+        key = (row, col, bucket)
+        with self.lock:
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        # Requests for the same tile and bucket wait for one build
+        with build_lock:
+            composite = self.load(row, col, bucket)
+            if composite is None:
+                self.prune()
+                return self.build(row, col, bucket)
+
+            with self.lock:
+                last_check = self.checked.setdefault(key, composite.meta['built_at'])
+            if self.is_open(bucket) and time.time() - last_check > COMPOSITE_CHECK_MINUTES * 60:
+                start, end = self.window(bucket)
+                scenes, latest = scene_list(build_collection(tile_bounds(row, col, self.tile_degrees), start, end))
+                with self.lock:
+                    self.stats['checks'] += 1
+                    self.checked[key] = time.time()
+                if scenes != composite.meta['scenes']:
+                    with self.lock:
+                        self.stats['invalidated'] += 1
+                    logger.info(f"New scenes for composite {row}_{col} bucket {bucket}, rebuilding")
+                    return self.build(row, col, bucket, scenes, latest)
+            with self.lock:
+                self.stats['hits'] += 1
+            return composite
+
+    def values_at(self, lat, lng, day):
+        """{ndvi, ndwi, soil_moisture, image_date} at a point for the bucket containing day, or None"""
+        row, col = cell_index(lat, lng, self.tile_degrees)
+        try:
+            composite = self.get(row, col, bucket_of(day, self.bucket_days))
+        except ee_cache.ReplayMissError:
+            raise
+        except Exception as e:
+            with self.lock:
+                self.stats['errors'] += 1
+            logger.error(f"Composite for {lat}, {lng} failed: {str(e)}")
+            return None
+        values = composite.sample(lat, lng)
+        if values is None:
+            return None
+        return dict(values, image_date=composite.meta['latest_scene'])
+
+    def prune(self):
+        """Delete buckets that ended more than COMPOSITE_KEEP_DAYS ago"""
+        if not os.path.isdir(self.directory):
+            return
+        oldest = bucket_of(datetime.now() - timedelta(days=COMPOSITE_KEEP_DAYS), self.bucket_days)
+        for name in os.listdir(self.directory):
+            if name.isdigit() and int(name) < oldest:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                with self.lock:
+                    for key in [k for k in self.composites if k[2] == int(name)]:
+                        self.composites.pop(key, None)
+                        self.checked.pop(key, None)
+                        self.build_locks.pop(key, None)
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, cached_composites=len(self.composites))
+
+
+class CompositeBackend(ImageryBackend):
+    """Index values from the tile composite of the request's end date"""
+    name = 'composite'
+
+    def __init__(self, store=None):
+        self.store = store or get_store()
+
+    def index_values(self, lat, lng, start_date, end_date, bbox=None, include_soil_moisture=True):
+        # Regions are left to the other backends
+        if bbox:
+            return None
+        values = self.store.values_at(lat, lng, end_date)
+        if values is None:
+            return None
+        return {
+            'ndvi': values['ndvi'],
+            'ndwi': values['ndwi'],
+            'soil_moisture': values['soil_moisture'] if include_soil_moisture else None,
+            'image_date': values['image_date'],
+            'source': self.name
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide composite store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CompositeStore()
+    return _store
+
+
+def metrics():
+    """Composite metrics, or None if no composite has been requested yet"""
+    return _store.metrics() if _store is not None else None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build Sentinel-2 composites per tile and time bucket")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    warm_parser = subparsers.add_parser('warm', help="Build the current bucket's composites for a region")
+    warm_parser.add_argument('--bbox', nargs=4, type=float, required=True,
+                             metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    warm_parser.add_argument('--date', default=None, help="Day in the bucket (default today)")
+    subparsers.add_parser('prune', help="Delete old buckets")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == 'prune':
+        store.prune()
+        return
+
+    ee_cache.initialize(os.getenv('EE_PROJECT', 'ee-ndirangudenise61'))
+
+    west, south, east, north = args.bbox
+    bucket = bucket_of(args.date or ee_cache.now())
+    first_row, first_col = cell_index(south, west, store.tile_degrees)
+    last_row, last_col = cell_index(north, east, store.tile_degrees)
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            # One tile at a time at batch priority, behind interactive requests
+            with ee_scheduler.priority(ee_scheduler.BATCH):
+                store.get(row, col, bucket)
+    print(store.metrics())
+
+
+if __name__ == '__main__':
+    main()
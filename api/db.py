@@ -0,0 +1,22 @@
+# db.py
+"""Database configuration shared by the API modules."""
+import os
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Also loaded here so worker scripts get the same settings as the API
+load_dotenv()
+
+# Database configuration
+DB_CONFIG = {
+    'dbname': os.getenv('DB_NAME', 'flood_prediction_db'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', '1234'),
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432')
+}
+
+
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
@@ -0,0 +1,277 @@
+# ee_cache.py
+"""
+Record/replay and content-addressed caching of Earth Engine results.
+
+Every evaluated computation graph is keyed by the SHA-256 of its serialized
+expression (plus call parameters such as point and scale), so the same graph
+built again gives the same key. Pixel downloads (computePixels) go through
+evaluate_array and are keyed by image and grid. EE_CACHE_MODE selects what happens:
+
+    off     every call goes to Earth Engine (default)
+    record  every call goes to Earth Engine and the result is stored on disk
+    replay  results are served from disk only; a missing entry raises
+            ReplayMissError and nothing is sent to Earth Engine
+    cache   stored results younger than EE_CACHE_TTL_HOURS are served from
+            disk, everything else is fetched and stored
+
+Replay also works without credentials: initialize() stores the Earth Engine
+algorithm list when recording and builds the client from it when replaying.
+
+Graphs with date windows ending "today" would hash differently the next day, so
+code building them takes the time from now(). Recording pins it to the time of
+the first recording in the directory (clock.json) and replay reuses that;
+EE_CACHE_NOW sets it explicitly in any mode.
+
+Record with:
+    EE_CACHE_MODE=record python app.py
+then run tests and benchmarks offline with EE_CACHE_MODE=replay.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'record', 'replay', 'cache')
+EE_CACHE_MODE = os.getenv('EE_CACHE_MODE', 'off').lower()
+EE_CACHE_DIR = os.getenv('EE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ee_cache'))
+# Age after which a cached result is fetched again in 'cache' mode (0 = never)
+EE_CACHE_TTL_HOURS = float(os.getenv('EE_CACHE_TTL_HOURS', 24))
+
+# Fixed current time (ISO date or datetime) for Earth Engine graphs; see now()
+EE_CACHE_NOW = os.getenv('EE_CACHE_NOW', '')
+
+ALGORITHMS_FILE = 'algorithms.json'
+CLOCK_FILE = 'clock.json'
+_pinned_now = None
+
+
+class ReplayMissError(RuntimeError):
+    """A replayed call has no recorded result"""
+
+
+def graph_key(obj, *params):
+    """Stable key of an Earth Engine object's computation graph and extra call parameters"""
+    digest = hashlib.sha256(obj.serialize().encode('utf-8'))
+    if params:
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def is_deterministic_error(error):
+    """Errors from evaluating the graph itself (worth replaying), not transport or quota failures"""
+    import ee_scheduler
+
+    if ee_scheduler.is_quota_error(error) or isinstance(error, (TimeoutError, ConnectionError, OSError)):
+        return False
+    return type(error).__name__ == 'EEException'
+
+
+class ResponseStore:
+    """Results on disk as <dir>/<key[:2]>/<key>.json"""
+
+    def __init__(self, mode=EE_CACHE_MODE, directory=EE_CACHE_DIR, ttl_hours=EE_CACHE_TTL_HOURS):
+        if mode not in MODES:
+            raise ValueError(f"EE_CACHE_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+        self.mode = mode
+        self.directory = directory
+        self.ttl_seconds = ttl_hours * 3600
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'expired': 0, 'write_errors': 0}
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def load(self, key):
+        """Stored entry for key, or None if missing (or expired in 'cache' mode)"""
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable Earth Engine cache entry {key}: {str(e)}")
+            return None
+        if self.mode == 'cache' and self.ttl_seconds > 0 and time.time() - entry['created'] > self.ttl_seconds:
+            with self.lock:
+                self.stats['expired'] += 1
+            return None
+        return entry
+
+    def save(self, key, entry):
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so readers never see a partial file
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(entry, created=time.time()), f, default=str)
+            os.replace(temp_path, path)
+            with self.lock:
+                self.stats['stored'] += 1
+        except OSError as e:
+            with self.lock:
+                self.stats['write_errors'] += 1
+            logger.error(f"Could not store Earth Engine result {key}: {str(e)}")
+
+    def resolve(self, key, compute, fresh=False):
+        """
+        Result for key according to the mode; compute() fetches it from Earth Engine.
+        fresh skips stored results in 'cache' mode (for checks whose answer changes over time).
+        """
+        if self.mode != 'record' and not (fresh and self.mode == 'cache'):
+            entry = self.load(key)
+            if entry is not None:
+                with self.lock:
+                    self.stats['hits'] += 1
+                return self._unpack(entry)
+            with self.lock:
+                self.stats['misses'] += 1
+            if self.mode == 'replay':
+                raise ReplayMissError(f"No recorded Earth Engine result for {key} in {self.directory}")
+
+        # Identical concurrent misses share one Earth Engine call
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            try:
+                result = compute()
+            except Exception as e:
+                if self.mode == 'record' and is_deterministic_error(e):
+                    self.save(key, {'error': str(e)})
+                raise
+            self.save(key, {'result': result})
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    @staticmethod
+    def _unpack(entry):
+        if 'error' in entry:
+            import ee
+            raise ee.EEException(entry['error'])
+        return entry['result']
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, mode=self.mode, inflight=len(self.inflight))
+
+
+_store = ResponseStore()
+
+
+def evaluate(obj, compute, *params, fresh=False):
+    """
+    Result of compute() (which evaluates obj, e.g. obj.getInfo) through the record/replay
+    store; params distinguish calls that evaluate the same graph differently.
+    """
+    if not _store.enabled:
+        return compute()
+    return _store.resolve(graph_key(obj, *params), compute, fresh)
+
+
+def evaluate_array(obj, compute, *params, fresh=False):
+    """evaluate() for calls returning a NumPy array (computePixels), stored as base64 .npy bytes"""
+    if not _store.enabled:
+        return compute()
+
+    def compute_encoded():
+        buffer = io.BytesIO()
+        np.save(buffer, compute(), allow_pickle=False)
+        return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    encoded = _store.resolve(graph_key(obj, *params), compute_encoded, fresh)
+    return np.load(io.BytesIO(base64.b64decode(encoded)), allow_pickle=False)
+
+
+def metrics():
+    return _store.metrics()
+
+
+def now():
+    """Current time for date windows in Earth Engine graphs (pinned when recording or replaying)"""
+    return _pinned_now or datetime.now()
+
+
+def pin_clock():
+    """Set now() from EE_CACHE_NOW, or from the recording's clock in record and replay modes"""
+    global _pinned_now
+    if EE_CACHE_NOW:
+        _pinned_now = datetime.fromisoformat(EE_CACHE_NOW)
+        return
+    if _store.mode not in ('record', 'replay'):
+        return
+
+    clock_path = os.path.join(_store.directory, CLOCK_FILE)
+    try:
+        with open(clock_path, encoding='utf-8') as f:
+            _pinned_now = datetime.fromisoformat(json.load(f)['now'])
+    except FileNotFoundError:
+        if _store.mode == 'replay':
+            logger.warning(f"No recorded clock in {_store.directory}; replaying with the real time")
+            return
+        # Later recordings into the same directory keep this clock
+        _pinned_now = datetime.now()
+        os.makedirs(_store.directory, exist_ok=True)
+        with open(clock_path, 'w', encoding='utf-8') as f:
+            json.dump({'now': _pinned_now.isoformat()}, f)
+    logger.info(f"Earth Engine graphs use the pinned time {_pinned_now.isoformat()}")
+
+
+def initialize(project):
+    """
+    ee.Initialize for the current mode. Recording stores the algorithm list;
+    replay builds the client from it without credentials or network.
+    """
+    import ee
+
+    pin_clock()
+    algorithms_path = os.path.join(_store.directory, ALGORITHMS_FILE)
+    if _store.mode == 'replay':
+        try:
+            with open(algorithms_path, encoding='utf-8') as f:
+                algorithms = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(f"No recorded algorithm list in {_store.directory}; record first")
+        ee.data.getAlgorithms = lambda: algorithms
+        ee.data.initialize = lambda *args, **kwargs: None
+        ee.Initialize(credentials=None, project=project)
+        logger.info(f"Earth Engine replaying from {_store.directory}")
+        return
+
+    try:
+        ee.Initialize(project=project)
+    except Exception:
+        ee.Authenticate()
+        ee.Initialize(project=project)
+
+    if _store.mode == 'record':
+        os.makedirs(_store.directory, exist_ok=True)
+        with open(algorithms_path, 'w', encoding='utf-8') as f:
+            json.dump(ee.data.getAlgorithms(), f)
+        logger.info(f"Earth Engine recording to {_store.directory}")
@@ -0,0 +1,266 @@
+# ee_scheduler.py
+"""
+Central scheduler for Earth Engine requests.
+
+Every getInfo()/computePixels call goes through one process-wide scheduler that
+applies a token-bucket rate limit and a concurrency cap, retries quota errors
+with jittered exponential backoff, and runs interactive work ahead of
+background (watchlist, batch) work. Point lookups on the same image within a
+short window are merged into a single reduceRegions call. getInfo and point
+results go through ee_cache, which can record, replay or cache them.
+"""
+import contextlib
+import contextvars
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import ee_cache
+
+logger = logging.getLogger(__name__)
+
+# Priorities, lower runs first
+INTERACTIVE = 0
+WATCHLIST = 5
+BATCH = 10
+
+RATE_PER_SECOND = float(os.getenv('EE_RATE_PER_SECOND', 10))
+BURST = int(os.getenv('EE_BURST', 20))
+MAX_CONCURRENT = int(os.getenv('EE_MAX_CONCURRENT', 8))
+MAX_RETRIES = int(os.getenv('EE_MAX_RETRIES', 5))
+BACKOFF_SECONDS = float(os.getenv('EE_BACKOFF_SECONDS', 1.0))
+BATCH_WINDOW_MS = float(os.getenv('EE_BATCH_WINDOW_MS', 50))
+REQUEST_TIMEOUT = float(os.getenv('EE_REQUEST_TIMEOUT', 120))
+
+QUOTA_ERROR_MARKERS = ('too many', 'quota', 'rate limit', '429', 'resource exhausted')
+
+_priority = contextvars.ContextVar('ee_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the Earth Engine calls made inside the block at the given priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_quota_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in QUOTA_ERROR_MARKERS)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EEScheduler:
+    """Priority queue served by MAX_CONCURRENT worker threads behind a token bucket"""
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST, max_concurrent=MAX_CONCURRENT,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, batch_window_ms=BATCH_WINDOW_MS):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_window = batch_window_ms / 1000
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.pending_points = {}
+        self.active = 0
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'throttle_events': 0,
+            'rate_limited_seconds': 0.0,
+            'merged_point_lookups': 0,
+            'batched_calls': 0
+        }
+        for i in range(max_concurrent):
+            threading.Thread(target=self._worker, name=f'ee-worker-{i}', daemon=True).start()
+
+    def call(self, fn, priority_level=None):
+        """Run fn() through the scheduler and return its result"""
+        return self.submit(fn, priority_level).result(timeout=REQUEST_TIMEOUT)
+
+    def submit(self, fn, priority_level=None):
+        """Queue fn() and return a Future"""
+        level = _priority.get() if priority_level is None else priority_level
+        future = Future()
+        with self.lock:
+            self.stats['submitted'] += 1
+        # The worker runs fn in the caller's context (log trace id, stage)
+        self.queue.put((level, next(self.sequence), contextvars.copy_context(), fn, future))
+        return future
+
+    def get_info(self, obj, priority_level=None, fresh=False):
+        """obj.getInfo() through the scheduler (or from the record/replay store)"""
+        return ee_cache.evaluate(obj, lambda: self.call(obj.getInfo, priority_level), fresh=fresh)
+
+    def _worker(self):
+        while True:
+            level, _, context, fn, future = self.queue.get()
+            with self.lock:
+                self.active += 1
+            try:
+                future.set_result(context.run(self._run_with_retries, fn))
+                with self.lock:
+                    self.stats['completed'] += 1
+            except Exception as e:
+                with self.lock:
+                    self.stats['failed'] += 1
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.active -= 1
+
+    def _run_with_retries(self, fn):
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire()
+            if waited:
+                with self.lock:
+                    self.stats['rate_limited_seconds'] += waited
+            try:
+                return fn()
+            except Exception as e:
+                if not is_quota_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                with self.lock:
+                    self.stats['throttle_events'] += 1
+                    self.stats['retries'] += 1
+                logger.warning(f"Earth Engine throttled, retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+
+    def sample_point(self, image, lat, lng, scale, reducer='mean', priority_level=None):
+        """
+        Reduce image at a point. Lookups on the same image, scale and reducer made within
+        the batching window are answered by one reduceRegions call.
+        Returns the point's values keyed by band name.
+        """
+        return ee_cache.evaluate(
+            image, lambda: self._queue_point(image, lat, lng, scale, reducer, priority_level),
+            'sample_point', lat, lng, scale, reducer
+        )
+
+    def _queue_point(self, image, lat, lng, scale, reducer, priority_level):
+        key = (image.serialize(), scale, reducer)
+        level = _priority.get() if priority_level is None else priority_level
+        future = Future()
+        with self.lock:
+            batch = self.pending_points.get(key)
+            if batch is None:
+                batch = self.pending_points[key] = {'image': image, 'points': [], 'priority': level}
+                timer = threading.Timer(self.batch_window, self._flush_points, args=(key,))
+                timer.daemon = True
+                timer.start()
+            batch['points'].append((lat, lng, future))
+            batch['priority'] = min(batch['priority'], level)
+        return future.result(timeout=REQUEST_TIMEOUT)
+
+    def _flush_points(self, key):
+        import ee
+
+        with self.lock:
+            batch = self.pending_points.pop(key)
+            self.stats['batched_calls'] += 1
+            self.stats['merged_point_lookups'] += len(batch['points']) - 1
+        _, scale, reducer_name = key
+        points = batch['points']
+
+        def run():
+            features = ee.FeatureCollection([
+                ee.Feature(ee.Geometry.Point([lng, lat]), {'point_index': i})
+                for i, (lat, lng, _) in enumerate(points)
+            ])
+            reducer = ee.Reducer.first() if reducer_name == 'first' else ee.Reducer.mean()
+            # Name outputs after the bands: a single-band image would otherwise get 'mean' or 'first'
+            reducer = reducer.forEachBand(batch['image'])
+            return batch['image'].reduceRegions(collection=features, reducer=reducer, scale=scale).getInfo()
+
+        def resolve(done):
+            try:
+                result = done.result()
+                by_index = {f['properties']['point_index']: f['properties'] for f in result['features']}
+                for i, (_, _, future) in enumerate(points):
+                    properties = dict(by_index.get(i, {}))
+                    properties.pop('point_index', None)
+                    future.set_result(properties)
+            except Exception as e:
+                for _, _, future in points:
+                    if not future.done():
+                        future.set_exception(e)
+
+        self.submit(run, batch['priority']).add_done_callback(resolve)
+
+    def metrics(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                rate_limited_seconds=round(self.stats['rate_limited_seconds'], 2),
+                queue_depth=self.queue.qsize(),
+                active=self.active,
+                pending_point_batches=len(self.pending_points)
+            )
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler, started on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = EEScheduler()
+    return _scheduler
+
+
+def get_info(obj, priority_level=None, fresh=False):
+    return get_scheduler().get_info(obj, priority_level, fresh)
+
+
+def call(fn, priority_level=None):
+    return get_scheduler().call(fn, priority_level)
+
+
+def sample_point(image, lat, lng, scale, reducer='mean', priority_level=None):
+    return get_scheduler().sample_point(image, lat, lng, scale, reducer, priority_level)
+
+
+def metrics():
+    """Scheduler metrics, or None if no Earth Engine call has been made yet"""
+    return _scheduler.metrics() if _scheduler is not None else None
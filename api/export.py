@@ -0,0 +1,207 @@
+# export.py
+"""
+Streaming export of analysis_results and historical_data.
+
+Rows are read through a server-side (named) cursor in EXPORT_CHUNK_ROWS
+batches and each batch is encoded and sent before the next is fetched, so the
+API process holds one chunk at a time whatever the size of the export.
+Formats: csv, ndjson and parquet (one row group per chunk, requires pyarrow).
+"""
+import csv
+import io
+import os
+import uuid
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from http_cache import dumps
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 5000))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# (select expression, column name, type) per table; every table exposes latitude,
+# longitude, risk_level and a date column for filtering
+TABLES = {
+    'analysis_results': {
+        'from': 'analysis_results a',
+        'date_column': 'a.analysis_date',
+        'columns': [
+            ('a.id', 'id', 'int'),
+            ('a.latitude', 'latitude', 'float'),
+            ('a.longitude', 'longitude', 'float'),
+            ('a.location_name', 'location_name', 'text'),
+            ('a.risk_level', 'risk_level', 'text'),
+            ('a.ndvi', 'ndvi', 'float'),
+            ('a.ndwi', 'ndwi', 'float'),
+            ('a.soil_moisture', 'soil_moisture', 'float'),
+            ('a.water_level', 'water_level', 'float'),
+            ('a.confidence_score', 'confidence_score', 'float'),
+            ('a.analysis_date', 'analysis_date', 'timestamp'),
+        ]
+    },
+    'historical_data': {
+        'from': 'historical_data h JOIN analysis_results a ON a.id = h.analysis_id',
+        'date_column': 'h.date',
+        'columns': [
+            ('h.id', 'id', 'int'),
+            ('h.analysis_id', 'analysis_id', 'int'),
+            ('a.latitude', 'latitude', 'float'),
+            ('a.longitude', 'longitude', 'float'),
+            ('a.risk_level', 'risk_level', 'text'),
+            ('h.date', 'date', 'date'),
+            ('h.ndvi', 'ndvi', 'float'),
+            ('h.ndwi', 'ndwi', 'float'),
+            ('h.soil_moisture', 'soil_moisture', 'float'),
+            ('h.water_level', 'water_level', 'float'),
+        ]
+    }
+}
+
+
+def parse_filters(args):
+    """Export filters from query parameters; raises ValueError"""
+    filters = {}
+    if args.get('bbox'):
+        west, south, east, north = (float(v) for v in args['bbox'].split(','))
+        if west >= east or south >= north:
+            raise ValueError("bbox must be west,south,east,north")
+        filters['bbox'] = (west, south, east, north)
+    if args.get('risk_level'):
+        filters['risk_levels'] = [level.strip().upper() for level in args['risk_level'].split(',')]
+    for name in ('start_date', 'end_date'):
+        if args.get(name):
+            filters[name] = datetime.strptime(args[name], '%Y-%m-%d').date()
+    return filters
+
+
+def build_query(table, filters):
+    """(sql, params, column names) for a table and filters"""
+    spec = TABLES[table]
+    conditions, params = [], []
+    if 'bbox' in filters:
+        west, south, east, north = filters['bbox']
+        conditions.append("a.longitude BETWEEN %s AND %s AND a.latitude BETWEEN %s AND %s")
+        params += [west, east, south, north]
+    if 'risk_levels' in filters:
+        conditions.append("a.risk_level = ANY(%s)")
+        params.append(filters['risk_levels'])
+    if 'start_date' in filters:
+        conditions.append(f"{spec['date_column']} >= %s")
+        params.append(filters['start_date'])
+    if 'end_date' in filters:
+        # Inclusive end date for both DATE and TIMESTAMP columns
+        conditions.append(f"{spec['date_column']} < %s::date + 1")
+        params.append(filters['end_date'])
+
+    alias = spec['columns'][0][0].split('.')[0]
+    sql = f"SELECT {', '.join(expr for expr, _, _ in spec['columns'])} FROM {spec['from']}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {alias}.id"
+    return sql, params, [name for _, name, _ in spec['columns']]
+
+
+def iter_chunks(conn, sql, params, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Lists of row tuples from a named (server-side) cursor"""
+    cur = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cur.itersize = chunk_rows
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def encode_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(chunks, columns):
+    for rows in chunks:
+        yield b''.join(dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file whose contents are taken out after every row group"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_schema(table):
+    types = {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'text': pa.string(),
+        'timestamp': pa.timestamp('us'),
+        'date': pa.date32()
+    }
+    return pa.schema([(name, types[kind]) for _, name, kind in TABLES[table]['columns']])
+
+
+def encode_parquet(chunks, columns, table):
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = arrow_schema(table)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in chunks:
+            arrays = [pa.array(list(values), type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def encode(fmt, chunks, columns, table):
+    """Byte chunks of the export in the given format"""
+    if fmt == 'csv':
+        return encode_csv(chunks, columns)
+    if fmt == 'ndjson':
+        return encode_ndjson(chunks, columns)
+    return encode_parquet(chunks, columns, table)
@@ -0,0 +1,23 @@
+# grid.py
+"""Fixed lat/lng grid used to key per-location data (time series, caches)."""
+import os
+
+# Cell size in degrees (0.01° is about 1.1 km at the equator)
+CELL_SIZE = float(os.getenv('GRID_CELL_SIZE', 0.01))
+
+
+def cell_index(lat, lng, cell_size=CELL_SIZE):
+    """Integer (row, col) of the grid cell containing a point"""
+    return int((lat + 90) // cell_size), int((lng + 180) // cell_size)
+
+
+def cell_id(lat, lng, cell_size=CELL_SIZE):
+    """Stable string key of the grid cell containing a point"""
+    row, col = cell_index(lat, lng, cell_size)
+    return f"{row}_{col}"
+
+
+def cell_center(lat, lng, cell_size=CELL_SIZE):
+    """Centre (lat, lng) of the grid cell containing a point"""
+    row, col = cell_index(lat, lng, cell_size)
+    return (row + 0.5) * cell_size - 90, (col + 0.5) * cell_size - 180
@@ -0,0 +1,93 @@
+# gunicorn.conf.py
+"""
+Production server: a pre-forking gunicorn master with threaded workers.
+
+The app and its read-only assets (TFLite model bytes, memory-mapped local
+rasters, imported modules) are loaded once in the master and shared
+copy-on-write by the workers it forks. Each worker re-creates what does not
+survive fork (logging and flush threads, Earth Engine connections). One worker
+runs the watchlist, partition maintenance and local raster refresh; job workers
+run in all of them.
+
+Run from the api directory:
+    gunicorn -c gunicorn.conf.py app:app
+
+Sizing (environment):
+    WEB_CONCURRENCY / GUNICORN_WORKERS   worker processes (default: CPU count)
+    GUNICORN_THREADS                     threads per worker (default 8; requests mostly wait on
+                                         Earth Engine, geocoding and Postgres)
+    GUNICORN_TIMEOUT                     seconds before a stuck worker is restarted (default 120)
+    GUNICORN_MAX_REQUESTS                recycle workers after this many requests (0 = never)
+
+Reloads:
+    kill -HUP <master>    graceful: new workers are forked from the already loaded master and
+                          old ones finish their requests (picks up gunicorn config changes only)
+    kill -USR2 <master>, then kill -QUIT <old master>
+                          new code, model or rasters: starts a new master next to the old one
+"""
+import fcntl
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max(max_requests // 10, 1) if max_requests else 0
+# Import the app (and everything it loads) in the master, before forking
+preload_app = True
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+# Held by the worker that runs the singleton background workers
+SINGLETON_LOCK_PATH = os.getenv('SINGLETON_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'flood_api_singletons.lock'))
+SINGLETON_RETRY_SECONDS = 30
+_singleton_lock = None
+
+
+def when_ready(server):
+    import app
+
+    app.init_db()
+    loaded = app.preload_assets()
+    server.log.info(f"Preloaded in master: {', '.join(loaded) or 'nothing'}")
+
+
+def post_fork(server, worker):
+    import app
+
+    app.after_fork()
+
+
+def elect_singleton(worker):
+    """
+    Run the singletons once this worker holds the lock. The lock is released when its
+    holder exits (recycled, crashed or replaced on reload) and another worker takes over.
+    """
+    global _singleton_lock
+    import app
+
+    lock_file = open(SINGLETON_LOCK_PATH, 'w')
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except OSError:
+            time.sleep(SINGLETON_RETRY_SECONDS)
+    # Kept open (and so locked) for the life of the worker
+    _singleton_lock = lock_file
+    worker.log.info(f"Worker {worker.pid} runs the watchlist, partition maintenance and raster refresh")
+    app.start_singleton_workers()
+
+
+def post_worker_init(worker):
+    import app
+
+    app.start_background_workers(singletons=False)
+    threading.Thread(target=elect_singleton, args=(worker,), name='singleton-election', daemon=True).start()
@@ -0,0 +1,143 @@
+# http_cache.py
+"""Fast JSON serialization, response compression and HTTP cache validators."""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = int(os.getenv('MIN_COMPRESS_SIZE', 1024))
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Serialize to JSON bytes, with orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header with q > 0"""
+    encodings = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            encodings.add(name.lower())
+    return encodings
+
+
+def compress(body, accept_encoding):
+    """(body, Content-Encoding or None), choosing brotli over gzip when both are accepted"""
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in encodings:
+        return brotli.compress(body, quality=5), 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+
+def make_etag(*parts):
+    """Validator from the values that determine a response (sent as a weak ETag)"""
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(etag):
+    """True if the request's If-None-Match already matches etag (weak comparison)"""
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def not_modified_response(etag, cache_control=None):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def json_response(payload, status=200, etag=None, cache_control='no-cache'):
+    """
+    JSON response with compression negotiated from Accept-Encoding, an optional ETag
+    and Cache-Control. Returns 304 when If-None-Match matches the ETag.
+
+    The ETag is weak: the identity, gzip and br bodies are the same representation
+    but not byte-identical, which a strong validator would promise.
+    """
+    if status == 200 and not_modified(etag):
+        return not_modified_response(etag, cache_control)
+
+    body, encoding = compress(dumps(payload), request.headers.get('Accept-Encoding'))
+    response = Response(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+class ResponseCache:
+    """Small in-process LRU of (etag, payload) with a time-to-live"""
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            etag, payload, stored = entry
+            if time.time() - stored > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return etag, payload
+
+    def put(self, key, etag, payload):
+        with self.lock:
+            self.entries[key] = (etag, payload, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,321 @@
+# imagery.py
+"""
+Imagery backends: spectral index values at a point or region for a date window.
+
+IMAGERY_BACKEND selects the implementation:
+    ee            Google Earth Engine, least cloudy scene per request
+    composite     cached cloud-free composites per tile and time bucket (composites.py)
+    local         directory of GeoTIFF/COG scenes (LOCAL_ARCHIVE_DIR)
+    composite,ee  composites first, the per-request search where they have no pixel (default)
+    local,ee      local archive first, Earth Engine when it has no scene
+"""
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import ee_scheduler
+
+logger = logging.getLogger(__name__)
+
+IMAGERY_BACKEND = os.getenv('IMAGERY_BACKEND', 'composite,ee')
+LOCAL_ARCHIVE_DIR = os.getenv('LOCAL_ARCHIVE_DIR', '')
+# Pixels around the point averaged by the local backend
+LOCAL_POINT_WINDOW = int(os.getenv('LOCAL_POINT_WINDOW', 3))
+# Largest array read for a region query by the local backend
+LOCAL_REGION_MAX_PIXELS = 256
+
+
+def to_datetime(value):
+    return datetime.strptime(value, '%Y-%m-%d') if isinstance(value, str) else value
+
+
+class ImageryBackend:
+    """
+    index_values returns {'ndvi', 'ndwi', 'soil_moisture', 'image_date', 'source'} or None
+    when there is no usable image. bbox (west, south, east, north) averages over a region
+    instead of the point. soil_moisture is None when the backend cannot provide it.
+    """
+    name = None
+
+    def index_values(self, lat, lng, start_date, end_date, bbox=None, include_soil_moisture=True):
+        raise NotImplementedError
+
+
+class EarthEngineBackend(ImageryBackend):
+    """Sentinel-2 (least cloudy or latest image) with optional Landsat 8 fallback"""
+    name = 'ee'
+
+    def __init__(self, collection='COPERNICUS/S2_SR_HARMONIZED', max_cloud=50, sort='least_cloudy',
+                 lookback_days=30, landsat_fallback=True, scale=30, reducer='mean'):
+        self.collection = collection
+        self.max_cloud = max_cloud
+        self.sort = sort
+        self.lookback_days = lookback_days
+        self.landsat_fallback = landsat_fallback
+        self.scale = scale
+        self.reducer = reducer
+
+    def select_image(self, region, start_date, end_date):
+        """(image with 'ndvi'/'ndwi' bands, source image) or (None, None)"""
+        import ee
+
+        start = (to_datetime(start_date) - timedelta(days=self.lookback_days)).strftime('%Y-%m-%d')
+        end = to_datetime(end_date).strftime('%Y-%m-%d')
+
+        s2 = ee.ImageCollection(self.collection) \
+            .filterBounds(region) \
+            .filterDate(start, end) \
+            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', self.max_cloud))
+
+        if ee_scheduler.get_info(s2.size()) > 0:
+            if self.sort == 'latest':
+                image = ee.Image(s2.sort('system:time_start', False).first())
+            else:
+                image = ee.Image(s2.sort('CLOUDY_PIXEL_PERCENTAGE').first())
+            ndvi = image.normalizedDifference(['B8', 'B4']).rename('ndvi')  # NIR and Red bands
+            ndwi = image.normalizedDifference(['B3', 'B8']).rename('ndwi')  # Green and NIR bands
+            return ndvi.addBands(ndwi), image
+
+        if not self.landsat_fallback:
+            return None, None
+
+        logger.warning("No Sentinel-2 imagery available, trying Landsat data")
+        landsat = ee.ImageCollection('LANDSAT/LC08/C02/T1_L2') \
+            .filterBounds(region) \
+            .filterDate(start, end) \
+            .filter(ee.Filter.lt('CLOUD_COVER', self.max_cloud))
+        if ee_scheduler.get_info(landsat.size()) == 0:
+            return None, None
+
+        image = ee.Image(landsat.sort('CLOUD_COVER').first())
+        ndvi = image.normalizedDifference(['SR_B5', 'SR_B4']).rename('ndvi')  # NIR and Red bands
+        ndwi = image.normalizedDifference(['SR_B3', 'SR_B5']).rename('ndwi')  # Green and NIR bands
+        return ndvi.addBands(ndwi), image
+
+    def index_values(self, lat, lng, start_date, end_date, bbox=None, include_soil_moisture=True):
+        import ee
+
+        point = ee.Geometry.Point([lng, lat])
+        geometry = ee.Geometry.Rectangle(list(bbox)) if bbox else point
+        indices, image = self.select_image(geometry if bbox else point.buffer(1000), start_date, end_date)
+        if indices is None:
+            return None
+
+        if include_soil_moisture:
+            era5_land = ee.ImageCollection('ECMWF/ERA5_LAND/HOURLY') \
+                .filterDate(to_datetime(start_date).strftime('%Y-%m-%d'), to_datetime(end_date).strftime('%Y-%m-%d')) \
+                .select('volumetric_soil_water_layer_1')
+            indices = indices.addBands(era5_land.mean())
+
+        reducer = ee.Reducer.first() if self.reducer == 'first' else ee.Reducer.mean()
+        # One request for the values and the image date
+        result = ee_scheduler.get_info(ee.Dictionary({
+            'values': indices.reduceRegion(reducer=reducer, geometry=geometry, scale=self.scale),
+            'image_date': ee.Date(image.get('system:time_start')).format('YYYY-MM-dd')
+        }))
+
+        values = result['values']
+        return {
+            'ndvi': values.get('ndvi'),
+            'ndwi': values.get('ndwi'),
+            'soil_moisture': values.get('volumetric_soil_water_layer_1'),
+            'image_date': result['image_date'],
+            'source': self.name
+        }
+
+
+# Band file naming used by SEN12-FLOOD style archives, e.g. s2_source_12_2019_03_21_B08_10m.tif
+BAND_PATTERN = re.compile(r'_(B0?[2348]|B8A|VV|VH)(?=[_.])', re.IGNORECASE)
+DATE_PATTERN = re.compile(r'(\d{4})[_:-]?(\d{2})[_:-]?(\d{2})')
+S2_BANDS = {'B3': 'green', 'B03': 'green', 'B4': 'red', 'B04': 'red', 'B8': 'nir', 'B08': 'nir'}
+
+
+class SceneIndex:
+    """
+    Footprint/date index of the scenes in a directory, cached in .scene_index.json so
+    unchanged files are not reopened when the index is rebuilt.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache_path = os.path.join(directory, '.scene_index.json')
+        self.lock = threading.Lock()
+        self.signature = None
+        self.scenes = []
+        self.bounds = np.empty((0, 4))
+        self.dates = np.empty(0, dtype='datetime64[D]')
+
+    def _scan_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.lower().endswith(('.tif', '.tiff')):
+                    yield os.path.join(root, name)
+
+    def _file_entry(self, path):
+        """Footprint (WGS84), date and band of one band file"""
+        import rasterio
+        from rasterio.warp import transform_bounds
+
+        name = os.path.basename(path)
+        band = BAND_PATTERN.search(name)
+        with rasterio.open(path) as src:
+            bounds = transform_bounds(src.crs, 'EPSG:4326', *src.bounds)
+            date = src.tags().get('DATE') or src.tags().get('TIFFTAG_DATETIME')
+        match = DATE_PATTERN.search(date or name)
+        if band is None or match is None:
+            return None
+        return {
+            'scene': BAND_PATTERN.sub('', os.path.splitext(os.path.relpath(path, self.directory))[0]),
+            'band': band.group(1).upper(),
+            'date': '-'.join(match.groups()),
+            'bounds': list(bounds),
+            'mtime': os.path.getmtime(path)
+        }
+
+    def refresh(self):
+        """Rebuild the index if files were added, removed or changed"""
+        paths = sorted(self._scan_files())
+        signature = tuple((p, os.path.getmtime(p)) for p in paths)
+        with self.lock:
+            if signature == self.signature:
+                return
+
+            cached = {}
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, 'r') as f:
+                    cached = json.load(f)
+
+            files = {}
+            for path in paths:
+                rel = os.path.relpath(path, self.directory)
+                entry = cached.get(rel)
+                if entry is None or entry['mtime'] != os.path.getmtime(path):
+                    try:
+                        entry = self._file_entry(path)
+                    except Exception as e:
+                        logger.error(f"Could not index {path}: {str(e)}")
+                        entry = None
+                if entry is not None:
+                    files[rel] = entry
+
+            try:
+                with open(self.cache_path, 'w') as f:
+                    json.dump(files, f)
+            except OSError as e:
+                # Read-only archives still work, the index is just rebuilt per process
+                logger.warning(f"Could not write scene index cache: {str(e)}")
+
+            scenes = {}
+            for rel, entry in files.items():
+                scene = scenes.setdefault(entry['scene'], {'date': entry['date'], 'bounds': entry['bounds'], 'bands': {}})
+                scene['bands'][entry['band']] = os.path.join(self.directory, rel)
+
+            self.scenes = [dict(s, key=k) for k, s in scenes.items()]
+            self.bounds = np.array([s['bounds'] for s in self.scenes]).reshape(-1, 4)
+            self.dates = np.array([s['date'] for s in self.scenes], dtype='datetime64[D]')
+            self.signature = signature
+            logger.info(f"Indexed {len(self.scenes)} local scenes")
+
+    def find(self, lat, lng, start_date, end_date, required_bands):
+        """Most recent scene covering the point within the date window, or None"""
+        self.refresh()
+        start = np.datetime64(to_datetime(start_date).date())
+        end = np.datetime64(to_datetime(end_date).date())
+        w, s, e, n = self.bounds.T
+        candidates = np.flatnonzero(
+            (w <= lng) & (lng <= e) & (s <= lat) & (lat <= n) & (self.dates >= start) & (self.dates <= end))
+
+        for i in candidates[np.argsort(self.dates[candidates])[::-1]]:
+            bands = self.scenes[i]['bands']
+            if all(any(S2_BANDS.get(code) == band for code in bands) for band in required_bands):
+                return self.scenes[i]
+        return None
+
+
+class LocalArchiveBackend(ImageryBackend):
+    """Serves index values from a directory of GeoTIFF/COG Sentinel-2 band files"""
+    name = 'local'
+
+    def __init__(self, directory=LOCAL_ARCHIVE_DIR, lookback_days=30, point_window=LOCAL_POINT_WINDOW):
+        if not directory:
+            raise ValueError("LOCAL_ARCHIVE_DIR is not set")
+        self.index = SceneIndex(directory)
+        self.lookback_days = lookback_days
+        self.point_window = point_window
+
+    def index_values(self, lat, lng, start_date, end_date, bbox=None, include_soil_moisture=True):
+        from pipeline.band_math import ndvi_ndwi
+        from pipeline.raster_io import read_band_at_point, read_band_in_bbox
+
+        start = to_datetime(start_date) - timedelta(days=self.lookback_days)
+        scene = self.index.find(lat, lng, start, end_date, ('green', 'red', 'nir'))
+        if scene is None:
+            return None
+
+        bands = {}
+        for code, path in scene['bands'].items():
+            name = S2_BANDS.get(code)
+            if name is None:
+                continue
+            if bbox:
+                bands[name] = read_band_in_bbox(
+                    path, bbox, out_shape=(LOCAL_REGION_MAX_PIXELS, LOCAL_REGION_MAX_PIXELS))
+            else:
+                bands[name] = read_band_at_point(path, lng, lat, self.point_window)
+            if bands[name] is None:
+                return None
+
+        indices = ndvi_ndwi(bands['green'], bands['red'], bands['nir'])
+        return {
+            'ndvi': float(np.nanmean(indices[..., 0])),
+            'ndwi': float(np.nanmean(indices[..., 1])),
+            'soil_moisture': None,
+            'image_date': scene['date'],
+            'source': self.name
+        }
+
+
+class ChainBackend(ImageryBackend):
+    """Tries each backend in order until one has an image"""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = ','.join(b.name for b in backends)
+
+    def index_values(self, lat, lng, start_date, end_date, bbox=None, include_soil_moisture=True):
+        for backend in self.backends:
+            values = backend.index_values(lat, lng, start_date, end_date, bbox, include_soil_moisture)
+            if values is not None:
+                return values
+        return None
+
+
+def get_backend(config=IMAGERY_BACKEND, **ee_options):
+    """
+    Backend from a config string such as 'ee', 'local' or 'local,ee'. ee_options configure
+    the Earth Engine search; composites are built with their own collection, cloud filter
+    and reducer, so they are left out when a caller asks for specific options.
+    """
+    backends = []
+    for name in config.split(','):
+        name = name.strip()
+        if name == 'composite' and ee_options:
+            logger.info("Composite imagery backend skipped: Earth Engine options were given")
+            continue
+        if name == 'ee':
+            backends.append(EarthEngineBackend(**ee_options))
+        elif name == 'local':
+            backends.append(LocalArchiveBackend())
+        elif name == 'composite':
+            from composites import CompositeBackend
+            backends.append(CompositeBackend())
+        else:
+            raise ValueError(f"Unknown imagery backend: {name}")
+    if not backends:
+        raise ValueError(f"No imagery backend left in {config!r} for options {ee_options}")
+    return backends[0] if len(backends) == 1 else ChainBackend(backends)
@@ -0,0 +1,318 @@
+# jobs.py
+"""
+Asynchronous jobs for analyses that take too long for a request.
+
+POST /api/jobs stores a job in Postgres and returns its id; a pool of worker
+threads claims queued jobs (FOR UPDATE SKIP LOCKED, so several processes can
+share the queue) and stores the result, which GET /api/jobs/<id> returns until
+it expires. Jobs left running by a stopped worker are picked up again once
+their lease runs out. Submitting the same kind and parameters again returns
+the pending or still-valid job instead of creating a new one.
+
+Run workers outside the API process with:
+    python jobs.py work
+or set JOB_WORKERS (default 2) for in-process workers.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from psycopg2.extras import Json, RealDictCursor
+
+import ee_scheduler
+import log_config
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+# Finished jobs (and their results) are kept this long
+RESULT_TTL_HOURS = float(os.getenv('JOB_RESULT_TTL_HOURS', 24))
+# A running job whose worker has not finished it within this time is run again
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 2))
+CLEANUP_SECONDS = int(os.getenv('JOB_CLEANUP_SECONDS', 600))
+
+
+def init_job_tables(conn):
+    """Create the jobs table"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params JSONB,
+                dedup_key TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                result JSONB,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                lease_until TIMESTAMP,
+                expires_at TIMESTAMP
+            );
+
+            CREATE INDEX IF NOT EXISTS jobs_status_created_idx ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_dedup_key_idx ON jobs (dedup_key);
+            -- At most one pending job per kind and parameters
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_dedup_idx ON jobs (dedup_key)
+                WHERE status IN ('queued', 'running');
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def dedup_key(kind, params):
+    canonical = json.dumps({'kind': kind, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def to_json(value):
+    return Json(value, dumps=lambda o: json.dumps(o, default=str))
+
+
+class JobQueue:
+    """
+    Postgres-backed job queue with a worker pool.
+
+    handlers maps a job kind to fn(params) returning a JSON-serializable result.
+    """
+
+    def __init__(self, handlers, workers=JOB_WORKERS, poll_seconds=POLL_SECONDS):
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0, 'running': 0}
+
+    def submit(self, kind, params):
+        """Enqueue a job, or return the matching pending/unexpired one; returns (job id, created)"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        key = dedup_key(kind, params)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            # A job whose worker died on its last attempt must not be handed out as the match
+            if self.fail_exhausted(cur, datetime.now()):
+                conn.commit()
+            for _ in range(2):
+                cur.execute("""
+                    SELECT id FROM jobs
+                    WHERE dedup_key = %s
+                    AND (status IN ('queued', 'running') OR (status = 'done' AND expires_at > %s))
+                    ORDER BY created_at DESC LIMIT 1
+                """, (key, datetime.now()))
+                row = cur.fetchone()
+                if row:
+                    with self.lock:
+                        self.stats['deduplicated'] += 1
+                    return row[0], False
+
+                job_id = uuid.uuid4().hex
+                cur.execute("""
+                    INSERT INTO jobs (id, kind, params, dedup_key)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (dedup_key) WHERE status IN ('queued', 'running') DO NOTHING
+                    RETURNING id
+                """, (job_id, kind, to_json(params), key))
+                inserted = cur.fetchone()
+                conn.commit()
+                if inserted:
+                    with self.lock:
+                        self.stats['submitted'] += 1
+                    self.wake_event.set()
+                    return job_id, True
+                # Another request queued the same job in the meantime; return that one
+            raise RuntimeError("Could not enqueue job")
+        finally:
+            cur.close()
+            conn.close()
+
+    def get(self, job_id):
+        """Job status and result, or None if unknown or expired"""
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cur.execute("""
+                SELECT id, kind, params, status, attempts, result, error,
+                created_at, started_at, finished_at, expires_at
+                FROM jobs
+                WHERE id = %s AND (expires_at IS NULL OR expires_at > %s)
+            """, (job_id, datetime.now()))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            for field in ('created_at', 'started_at', 'finished_at', 'expires_at'):
+                if job[field] is not None:
+                    job[field] = job[field].isoformat()
+            return job
+        finally:
+            cur.close()
+            conn.close()
+
+    def claim(self):
+        """Mark the oldest runnable job as running; returns (id, kind, params) or None"""
+        now = datetime.now()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            self.fail_exhausted(cur, now)
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'running', started_at = %s, lease_until = %s, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status = 'queued' OR (status = 'running' AND lease_until < %s))
+                    AND attempts < %s
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, params
+            """, (now, now + timedelta(seconds=LEASE_SECONDS), now, MAX_ATTEMPTS))
+            row = cur.fetchone()
+            conn.commit()
+            return row
+        finally:
+            cur.close()
+            conn.close()
+
+    def finish(self, job_id, result=None, error=None):
+        now = datetime.now()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE jobs
+                SET status = %s, result = %s, error = %s, finished_at = %s, expires_at = %s, lease_until = NULL
+                WHERE id = %s
+            """, ('failed' if error else 'done', to_json(result) if error is None else None, error,
+                  now, now + timedelta(hours=RESULT_TTL_HOURS), job_id))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def run_job(self, job_id, kind, params):
+        with log_config.trace(job_id), log_config.stage(f'job:{kind}'):
+            self._run_job(job_id, kind, params)
+
+    def _run_job(self, job_id, kind, params):
+        with self.lock:
+            self.stats['running'] += 1
+        try:
+            # Jobs are background work; interactive requests go first for Earth Engine capacity
+            with ee_scheduler.priority(ee_scheduler.BATCH):
+                result = self.handlers[kind](params)
+            self.finish(job_id, result=result)
+            with self.lock:
+                self.stats['completed'] += 1
+        except Exception as e:
+            logger.error(f"Job {job_id} ({kind}) failed: {str(e)}")
+            self.finish(job_id, error=str(e))
+            with self.lock:
+                self.stats['failed'] += 1
+        finally:
+            with self.lock:
+                self.stats['running'] -= 1
+
+    @staticmethod
+    def fail_exhausted(cur, now):
+        """Fail running jobs whose lease expired on their last attempt (their worker stopped)"""
+        cur.execute("""
+            UPDATE jobs
+            SET status = 'failed', error = 'Worker stopped before the job finished',
+            finished_at = %s, expires_at = %s, lease_until = NULL
+            WHERE status = 'running' AND lease_until < %s AND attempts >= %s
+        """, (now, now + timedelta(hours=RESULT_TTL_HOURS), now, MAX_ATTEMPTS))
+        return cur.rowcount
+
+    def cleanup(self):
+        """Delete expired jobs and fail jobs that ran out of attempts"""
+        now = datetime.now()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("DELETE FROM jobs WHERE expires_at < %s", (now,))
+            deleted = cur.rowcount
+            self.fail_exhausted(cur, now)
+            conn.commit()
+            return deleted
+        finally:
+            cur.close()
+            conn.close()
+
+    def work(self):
+        """Worker loop: claim and run jobs until stopped"""
+        while not self.stop_event.is_set():
+            try:
+                job = self.claim()
+            except Exception as e:
+                logger.error(f"Job claim failed: {str(e)}")
+                job = None
+            if job is None:
+                self.wake_event.wait(self.poll_seconds)
+                self.wake_event.clear()
+                continue
+            self.run_job(*job)
+
+    def cleanup_forever(self):
+        while not self.stop_event.is_set():
+            try:
+                self.cleanup()
+            except Exception as e:
+                logger.error(f"Job cleanup failed: {str(e)}")
+            self.stop_event.wait(CLEANUP_SECONDS)
+
+    def start(self):
+        """Start the worker threads and the cleanup thread"""
+        for i in range(self.workers):
+            threading.Thread(target=self.work, name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=self.cleanup_forever, name='job-cleanup', daemon=True).start()
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, workers=self.workers)
+
+
+def main():
+    log_config.setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'work'
+
+    conn = get_db_connection()
+    try:
+        init_job_tables(conn)
+    finally:
+        conn.close()
+
+    if command == 'work':
+        from app import job_handlers
+        queue = JobQueue(job_handlers(), workers=max(JOB_WORKERS, 1))
+        queue.start()
+        queue.stop_event.wait()
+    elif command == 'cleanup':
+        print(f"Deleted {JobQueue({}).cleanup()} expired jobs")
+    else:
+        print("Usage: python jobs.py [work | cleanup]")
+
+
+if __name__ == '__main__':
+    main()
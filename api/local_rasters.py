@@ -0,0 +1,323 @@
+# local_rasters.py
+"""
+Locally stored copies of coarse or static Earth Engine layers.
+
+Each layer is a memory-mapped .npy array in EPSG:4326 with a .json sidecar
+holding its georeferencing (bbox and resolution in degrees), nodata value and
+source date range. The API samples these before falling back to Earth Engine.
+
+Ingest a region:
+    python local_rasters.py ingest --bbox 33.9 -4.7 41.9 5.0
+    python local_rasters.py ingest --layers soil_moisture --days 10
+
+Time-varying layers already on disk are re-ingested every
+LOCAL_RASTER_REFRESH_HOURS by the API (LocalRasterRefresher) or with
+    python local_rasters.py refresh
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import ee_cache
+import ee_scheduler
+
+logger = logging.getLogger(__name__)
+
+LOCAL_RASTER_DIR = os.getenv('LOCAL_RASTER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rasters'))
+# Kenya
+DEFAULT_BBOX = tuple(float(v) for v in os.getenv('LOCAL_RASTER_BBOX', '33.9,-4.7,41.9,5.0').split(','))
+# Samples of time-varying layers older than this are ignored. Age counts from the last source
+# image, and ERA5-Land is published about 5 days behind real time, so a fresh ingest is already that old
+MAX_AGE_DAYS = int(os.getenv('LOCAL_RASTER_MAX_AGE_DAYS', 10))
+# Re-ingest time-varying layers this often, keeping them within MAX_AGE_DAYS (0 = never)
+REFRESH_HOURS = float(os.getenv('LOCAL_RASTER_REFRESH_HOURS', 24))
+# Largest tile requested from Earth Engine in one computePixels call
+INGEST_TILE_SIZE = 1024
+
+# name -> how to build it in Earth Engine and how to store it
+LAYERS = {
+    'soil_moisture': {
+        'collection': 'ECMWF/ERA5_LAND/HOURLY',
+        'band': 'volumetric_soil_water_layer_1',
+        'resolution': 0.05,
+        'dtype': 'float32',
+        'nodata': np.nan,
+        'time_varying': True
+    },
+    'water_occurrence': {
+        'image': 'JRC/GSW1_4/GlobalSurfaceWater',
+        'band': 'occurrence',
+        # occurrence is masked where water was never seen; that is 0, and only pixels
+        # outside the dataset's footprint (where max_extent is masked) are nodata
+        'fill': 0,
+        'footprint_band': 'max_extent',
+        'resolution': 0.001,
+        'dtype': 'uint8',
+        'nodata': 255,
+        'time_varying': False
+    }
+}
+
+
+class LocalRaster:
+    """A memory-mapped single-band layer with point sampling"""
+
+    def __init__(self, directory, name):
+        with open(os.path.join(directory, f"{name}.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.data = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        self.west, self.south, self.east, self.north = self.meta['bbox']
+        self.resolution = self.meta['resolution']
+        nodata = self.meta.get('nodata')
+        self.nodata = np.nan if nodata is None else nodata
+
+    @property
+    def age_days(self):
+        """Days since the end of the source date range, or None for static layers"""
+        end_date = self.meta.get('end_date')
+        if not end_date:
+            return None
+        return (datetime.now() - datetime.strptime(end_date, '%Y-%m-%d')).days
+
+    def sample_many(self, lats, lngs):
+        """Values at many points as float64, NaN outside the raster or on nodata"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        rows = np.floor((self.north - lats) / self.resolution).astype(np.int64)
+        cols = np.floor((lngs - self.west) / self.resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.data.shape[0]) & (cols >= 0) & (cols < self.data.shape[1])
+
+        values = np.full(lats.shape, np.nan)
+        values[inside] = self.data[rows[inside], cols[inside]]
+        if not (isinstance(self.nodata, float) and math.isnan(self.nodata)):
+            values[values == self.nodata] = np.nan
+        return values
+
+    def sample(self, lat, lng):
+        """Value at a point, or None"""
+        value = self.sample_many([lat], [lng])[0]
+        return None if np.isnan(value) else float(value)
+
+
+class LocalRasterStore:
+    """Opens layers on first use and re-opens them when they are re-ingested"""
+
+    def __init__(self, directory=LOCAL_RASTER_DIR, max_age_days=MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.layers = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """The layer, or None if it has not been ingested"""
+        meta_path = os.path.join(self.directory, f"{name}.json")
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.layers.get(name)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, LocalRaster(self.directory, name))
+                self.layers[name] = cached
+            return cached[1]
+
+    def preload(self):
+        """Open every ingested layer; returns their names"""
+        return [name for name in LAYERS if self.get(name) is not None]
+
+    def sample(self, name, lat, lng):
+        """Value at a point if the layer covers it and is recent enough, else None"""
+        try:
+            layer = self.get(name)
+            if layer is None:
+                return None
+            age = layer.age_days
+            if age is not None and age > self.max_age_days:
+                return None
+            return layer.sample(lat, lng)
+        except Exception as e:
+            logger.error(f"Local raster sample failed for {name}: {str(e)}")
+            return None
+
+
+def write_layer(directory, name, array, bbox, resolution, nodata=None, **meta):
+    """Write an array and its sidecar as a layer (also handy for small fixture rasters)"""
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, f"{name}.npy"), array)
+    write_meta(directory, name, array.shape, array.dtype, bbox, resolution, nodata, **meta)
+
+
+def write_meta(directory, name, shape, dtype, bbox, resolution, nodata=None, **meta):
+    if isinstance(nodata, float) and math.isnan(nodata):
+        nodata = None
+    meta = dict(meta, bbox=list(bbox), resolution=resolution, shape=list(shape), dtype=str(np.dtype(dtype)),
+                nodata=nodata, ingested_at=datetime.now().isoformat())
+    tmp_path = os.path.join(directory, f"{name}.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, f"{name}.json"))
+
+
+def build_ee_image(name, days):
+    """Earth Engine image for a layer and its source date range"""
+    import ee
+
+    spec = LAYERS[name]
+    if not spec['time_varying']:
+        source = ee.Image(spec['image'])
+        image = source.select(spec['band'])
+        if 'footprint_band' in spec:
+            image = image.unmask(spec['fill']).updateMask(source.select(spec['footprint_band']).mask())
+        return image, {}
+
+    # ERA5-Land is published with a few days' delay; average the most recent window
+    end_date = ee_cache.now()
+    start_date = end_date - timedelta(days=days)
+    collection = ee.ImageCollection(spec['collection']) \
+        .filterDate(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')) \
+        .select(spec['band'])
+    latest = ee_scheduler.get_info(ee.Date(collection.aggregate_max('system:time_start')).format('YYYY-MM-dd'),
+                                   ee_scheduler.BATCH)
+    return collection.mean(), {'start_date': start_date.strftime('%Y-%m-%d'), 'end_date': latest, 'days': days}
+
+
+def compute_pixels(image, west, north, width, height, resolution, priority_level=None):
+    """EPSG:4326 pixels of image as a structured array with one field per band"""
+    import ee
+
+    grid = {
+        'dimensions': {'width': width, 'height': height},
+        'affineTransform': {
+            'scaleX': resolution, 'shearX': 0, 'translateX': west,
+            'shearY': 0, 'scaleY': -resolution, 'translateY': north
+        },
+        'crsCode': 'EPSG:4326'
+    }
+    request = {'expression': image, 'fileFormat': 'NUMPY_NDARRAY', 'grid': grid}
+    # Recorded and replayed like getInfo results (see ee_cache.py)
+    return ee_cache.evaluate_array(
+        image, lambda: ee_scheduler.call(lambda: ee.data.computePixels(request), priority_level),
+        'compute_pixels', grid
+    )
+
+
+def ingest(name, bbox=DEFAULT_BBOX, directory=LOCAL_RASTER_DIR, days=7, resolution=None):
+    """Download a layer for bbox tile by tile into a memory-mapped array"""
+    spec = LAYERS[name]
+    resolution = resolution or spec['resolution']
+    west, south, east, north = bbox
+    # Tolerance so a stored (already aligned) bbox gives the same grid again
+    width = int(math.ceil((east - west) / resolution - 1e-6))
+    height = int(math.ceil((north - south) / resolution - 1e-6))
+    bbox = (west, north - height * resolution, west + width * resolution, north)
+
+    image, dates = build_ee_image(name, days)
+    image = image.unmask(spec['nodata'] if spec['dtype'] != 'float32' else -9999)
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f"{name}.npy.tmp")
+    array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=spec['dtype'], shape=(height, width))
+
+    for row in range(0, height, INGEST_TILE_SIZE):
+        for col in range(0, width, INGEST_TILE_SIZE):
+            tile_height = min(INGEST_TILE_SIZE, height - row)
+            tile_width = min(INGEST_TILE_SIZE, width - col)
+            tile = compute_pixels(image, west + col * resolution, north - row * resolution,
+                                  tile_width, tile_height, resolution, ee_scheduler.BATCH)
+            values = tile[spec['band']]
+            if spec['dtype'] == 'float32':
+                values = np.where(values == -9999, np.nan, values)
+            array[row:row + tile_height, col:col + tile_width] = values
+        logger.info(f"{name}: {min(row + INGEST_TILE_SIZE, height)}/{height} rows")
+
+    array.flush()
+    del array
+    os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+    write_meta(directory, name, (height, width), spec['dtype'], bbox, resolution, spec['nodata'],
+               source=spec.get('collection') or spec.get('image'), band=spec['band'], **dates)
+    return height, width
+
+
+def refresh(directory=LOCAL_RASTER_DIR, older_than_hours=None):
+    """
+    Re-ingest the time-varying layers on disk over their stored bbox, resolution and window;
+    with older_than_hours, only those ingested longer ago than that
+    """
+    refreshed = []
+    for name, spec in LAYERS.items():
+        if not spec['time_varying']:
+            continue
+        try:
+            with open(os.path.join(directory, f"{name}.json"), 'r') as f:
+                meta = json.load(f)
+        except OSError:
+            continue
+        ingested_at = datetime.fromisoformat(meta['ingested_at'])
+        if older_than_hours is not None and datetime.now() - ingested_at < timedelta(hours=older_than_hours):
+            continue
+        ingest(name, tuple(meta['bbox']), directory, meta.get('days', 7), meta['resolution'])
+        refreshed.append(name)
+    return refreshed
+
+
+class LocalRasterRefresher:
+    """Runs refresh() every REFRESH_HOURS in a daemon thread"""
+
+    def __init__(self, directory=LOCAL_RASTER_DIR, interval_hours=REFRESH_HOURS):
+        self.directory = directory
+        self.interval = interval_hours * 3600
+        self.stop_event = threading.Event()
+        self.last_run = None
+
+    def run_forever(self):
+        # Checked hourly so layers already stale at startup are caught up straight away
+        while not self.stop_event.is_set():
+            try:
+                refreshed = refresh(self.directory, older_than_hours=self.interval / 3600)
+                if refreshed:
+                    self.last_run = {'layers': refreshed, 'finished_at': datetime.now().isoformat()}
+                    logger.info(f"Refreshed local rasters: {', '.join(refreshed)}")
+            except Exception as e:
+                logger.error(f"Local raster refresh failed: {str(e)}")
+            self.stop_event.wait(min(self.interval, 3600))
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name='local-raster-refresh', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Store Earth Engine layers locally")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest')
+    ingest_parser.add_argument('--bbox', nargs=4, type=float, default=DEFAULT_BBOX,
+                               metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    ingest_parser.add_argument('--layers', nargs='+', choices=sorted(LAYERS), default=sorted(LAYERS))
+    ingest_parser.add_argument('--days', type=int, default=7, help="Averaging window for time-varying layers")
+    ingest_parser.add_argument('--directory', default=LOCAL_RASTER_DIR)
+    refresh_parser = subparsers.add_parser('refresh')
+    refresh_parser.add_argument('--directory', default=LOCAL_RASTER_DIR)
+    args = parser.parse_args()
+
+    ee_cache.initialize(os.getenv('EE_PROJECT', 'ee-ndirangudenise61'))
+
+    if args.command == 'refresh':
+        print(f"Refreshed: {', '.join(refresh(args.directory)) or 'no time-varying layers ingested'}")
+        return
+
+    for name in args.layers:
+        height, width = ingest(name, tuple(args.bbox), args.directory, args.days)
+        print(f"Ingested {name}: {width}x{height} pixels")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+# log_config.py
+"""
+Non-blocking structured logging.
+
+Request threads only put records on a bounded in-memory queue; a
+QueueListener thread formats them as JSON lines and writes them to a
+size-rotated file and the console. Every record carries the trace id of the
+request (or job) that produced it and the current stage, so the lines of one
+analysis can be followed. Identical warnings and errors repeated within
+LOG_REPEAT_WINDOW seconds are logged once, and the next occurrence after the
+window reports how many were suppressed.
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', 'flood_prediction.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+# 'json' or 'text' for the console
+LOG_CONSOLE_FORMAT = os.getenv('LOG_CONSOLE_FORMAT', 'text')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_REPEAT_WINDOW = float(os.getenv('LOG_REPEAT_WINDOW', 60))
+
+_trace_id = contextvars.ContextVar('trace_id', default='-')
+_stage = contextvars.ContextVar('stage', default='-')
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def set_trace(trace_id=None):
+    """Start a trace in the current context; returns a token for reset_trace"""
+    return _trace_id.set(trace_id or new_trace_id())
+
+
+def reset_trace(token):
+    _trace_id.reset(token)
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+@contextlib.contextmanager
+def trace(trace_id=None):
+    """Log records in the block carry trace_id (a new one if not given)"""
+    token = set_trace(trace_id)
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Log records in the block carry this stage name"""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the trace id and stage onto the record in the thread that logs it"""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get()
+        record.stage = _stage.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """Lets the first of identical WARNING+ records through per window and counts the rest"""
+
+    def __init__(self, window=LOG_REPEAT_WINDOW):
+        super().__init__()
+        self.window = window
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.window <= 0:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            record.suppressed = entry[1] if entry else 0
+            self.seen[key] = [now, 0]
+            if len(self.seen) > 10000:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Drops (and counts) records instead of waiting when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting (including tracebacks) happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'trace_id': getattr(record, 'trace_id', '-'),
+            'stage': getattr(record, 'stage', '-'),
+            'msg': record.getMessage()
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed_repeats'] = record.suppressed
+        if record.exc_info:
+            entry['exc'] = ''.join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s %(stage)s] %(message)s')
+
+    def format(self, record):
+        record.trace_id = getattr(record, 'trace_id', '-')
+        record.stage = getattr(record, 'stage', '-')
+        text = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            text += f" (repeated {record.suppressed} more times)"
+        return text
+
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """Route all logging through the queue; safe to call more than once"""
+    global _queue_handler
+    if _listener is not None:
+        return _queue_handler
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter())
+    _queue_handler.addFilter(RepeatFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _start_listener(log_queue, _output_handlers(log_file, rotate=True))
+    return _queue_handler
+
+
+def _output_handlers(log_file, rotate):
+    handlers = []
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(JsonFormatter() if LOG_CONSOLE_FORMAT == 'json' else TextFormatter())
+    handlers.append(console)
+    if log_file:
+        try:
+            if rotate:
+                file_handler = logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+                )
+            else:
+                # Several processes appending to one file cannot rotate it themselves
+                file_handler = logging.handlers.WatchedFileHandler(log_file, encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            # Read-only filesystems (serverless) log to the console only
+            print(f"File logging disabled: {str(e)}", file=sys.stderr)
+    return handlers
+
+
+def _start_listener(log_queue, handlers):
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def after_fork(log_file=LOG_FILE):
+    """
+    Restart the listener in a forked worker, whose copy of the listener thread is gone.
+    Workers append to the log file without rotating it (use logrotate with copytruncate
+    or move+reopen; WatchedFileHandler reopens a moved file).
+    """
+    if _listener is None:
+        return
+    atexit.unregister(_listener.stop)
+    for handler in _listener.handlers:
+        handler.close()
+    # A fresh queue: the inherited one may have been locked by the master's listener at fork
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _start_listener(log_queue, _output_handlers(log_file, rotate=False))
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def init_request_tracing(app):
+    """Give every Flask request a trace id (from X-Request-ID when sent) and echo it back"""
+    from flask import g, request
+
+    @app.before_request
+    def start_trace():
+        g.trace_token = set_trace(request.headers.get('X-Request-ID', '')[:64] or None)
+        g.stage_token = _stage.set('request')
+
+    @app.after_request
+    def add_trace_header(response):
+        response.headers['X-Request-ID'] = current_trace_id()
+        return response
+
+    @app.teardown_request
+    def end_trace(exc=None):
+        try:
+            if 'stage_token' in g:
+                _stage.reset(g.stage_token)
+            if 'trace_token' in g:
+                reset_trace(g.trace_token)
+        except ValueError:
+            # Token from another context (e.g. a streamed response finishing later)
+            _stage.set('-')
+            _trace_id.set('-')
@@ -0,0 +1,178 @@
+# model_server.py
+"""Flood CNN serving: the model is loaded once per process and requests are micro-batched."""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def default_model_path():
+    """Prefer the exported TFLite model, which does not need TensorFlow, over the Keras one"""
+    tflite_path = os.path.join(MODEL_DIR, 'my_model.tflite')
+    return tflite_path if os.path.exists(tflite_path) else os.path.join(MODEL_DIR, 'my_model.keras')
+
+
+MODEL_PATH = os.getenv('MODEL_PATH') or default_model_path()
+MAX_BATCH_SIZE = int(os.getenv('PREDICT_MAX_BATCH_SIZE', 32))
+MAX_WAIT_MS = float(os.getenv('PREDICT_MAX_WAIT_MS', 10))
+
+_model_lock = threading.Lock()
+_model = None
+_model_content = None
+_batcher = None
+
+
+def preload():
+    """
+    Read a .tflite model into memory before the server forks, so workers share one copy.
+    The interpreter itself is built per process (its thread pool does not survive fork),
+    and Keras models are not preloaded since TensorFlow is not fork-safe.
+    """
+    global _model_content
+    if not MODEL_PATH.endswith('.tflite') or not os.path.exists(MODEL_PATH):
+        return False
+    with open(MODEL_PATH, 'rb') as f:
+        _model_content = f.read()
+    return True
+
+
+def get_model():
+    """Load the model and its normalization statistics once per process"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from pipeline.model import load_model
+                _model = load_model(MODEL_PATH, model_content=_model_content)
+    return _model
+
+
+class Metric:
+    """Running count/sum/max of an observed value"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 4) if self.count else 0,
+            'max': round(self.max, 4)
+        }
+
+
+class MicroBatcher:
+    """
+    Collects single-patch requests from many threads into batches for one predict call.
+
+    A batch is run as soon as it holds max_batch_size patches or the oldest patch
+    has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.queue_wait_ms = Metric()
+        self.batch_size = Metric()
+        self.inference_ms = Metric()
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, patch):
+        """Queue one (H, W, C) patch; returns a Future resolving to its flood probability"""
+        future = Future()
+        self.queue.put((patch, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        items = [self.queue.get()]
+        deadline = items[0][2] + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            started = time.perf_counter()
+            try:
+                batch = np.stack([patch for patch, _, _ in items])
+                probabilities = self.predict_fn(batch)
+                for (_, future, _), p in zip(items, probabilities):
+                    future.set_result(float(p))
+            except Exception as e:
+                self.errors += 1
+                for _, future, _ in items:
+                    future.set_exception(e)
+            finished = time.perf_counter()
+
+            with self.lock:
+                for _, _, queued in items:
+                    self.queue_wait_ms.observe((started - queued) * 1000)
+                self.batch_size.observe(len(items))
+                self.inference_ms.observe((finished - started) * 1000)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_wait_ms': self.queue_wait_ms.to_dict(),
+                'batch_size': self.batch_size.to_dict(),
+                'inference_ms': self.inference_ms.to_dict(),
+                'errors': self.errors,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000
+            }
+
+
+def predict_batch(features):
+    """Flood probability for each raw feature patch in an (N, H, W, C) batch"""
+    from pipeline.dataset import normalize
+
+    model, stats = get_model()
+    features = normalize(features.astype(np.float32), stats)
+    return np.asarray(model.predict_on_batch(features))[:, 1]
+
+
+def get_batcher():
+    """Process-wide micro-batcher, started on first use"""
+    global _batcher
+    if _batcher is None:
+        with _model_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(predict_batch)
+    return _batcher
+
+
+def predict_patches(patches, timeout=30):
+    """Submit patches through the micro-batcher and wait for their probabilities"""
+    batcher = get_batcher()
+    futures = [batcher.submit(patch) for patch in patches]
+    return [future.result(timeout=timeout) for future in futures]
+
+
+def metrics():
+    """Serving metrics, or None if no prediction has been requested yet"""
+    return _batcher.metrics() if _batcher is not None else None
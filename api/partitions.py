@@ -0,0 +1,457 @@
+# partitions.py
+"""
+Schema management for the analysis tables.
+
+analysis_results and historical_data are range-partitioned by month on their
+date columns. Indexes are declared on the parent tables, so every monthly
+partition gets its own copy. Partitions are created ahead of time, and
+partitions older than RETENTION_MONTHS are dropped or moved to the archive
+schema. risk_daily_summary keeps one row per day and grid cell. run_analysis
+updates it as results are inserted, and the dashboard endpoints read it
+instead of the raw rows.
+
+    python partitions.py init        # create tables and upcoming partitions
+    python partitions.py migrate     # move existing unpartitioned tables into partitions
+    python partitions.py maintain    # create partitions, apply retention, rebuild recent summaries
+    python partitions.py rollup 30   # rebuild the summaries of the last 30 days
+"""
+import logging
+import os
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+from db import get_db_connection
+from grid import CELL_SIZE, cell_center, cell_id
+
+logger = logging.getLogger(__name__)
+
+# Partitions whose whole month is older than this are removed from the live tables
+RETENTION_MONTHS = int(os.getenv('PARTITION_RETENTION_MONTHS', 24))
+# 'drop' deletes old partitions, 'archive' detaches them into the archive schema
+RETENTION_ACTION = os.getenv('PARTITION_RETENTION_ACTION', 'archive')
+MONTHS_AHEAD = 2
+ARCHIVE_SCHEMA = 'archive'
+MAINTENANCE_HOURS = float(os.getenv('PARTITION_MAINTENANCE_HOURS', 24))
+
+# Partitioned table -> partition key
+PARTITIONED_TABLES = {
+    'analysis_results': 'analysis_date',
+    'historical_data': 'date'
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def table_kind(cur, table):
+    """'p' for a partitioned table, 'r' for a plain table, None if missing"""
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = %s AND n.nspname = current_schema()
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def create_tables(cur):
+    # The partition key must be part of the primary key, and a partitioned
+    # analysis_results cannot be referenced by id alone, so historical_data
+    # keeps analysis_id as an indexed column without a foreign key.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            id SERIAL,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            location_name TEXT,
+            risk_level VARCHAR(50),
+            ndvi DOUBLE PRECISION,
+            ndwi DOUBLE PRECISION,
+            soil_moisture DOUBLE PRECISION,
+            water_level DOUBLE PRECISION,
+            confidence_score DOUBLE PRECISION,
+            analysis_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, analysis_date)
+        ) PARTITION BY RANGE (analysis_date);
+
+        CREATE INDEX IF NOT EXISTS analysis_results_date_idx ON analysis_results (analysis_date);
+        CREATE INDEX IF NOT EXISTS analysis_results_location_idx ON analysis_results (latitude, longitude);
+        CREATE INDEX IF NOT EXISTS analysis_results_risk_idx ON analysis_results (risk_level, analysis_date);
+
+        CREATE TABLE IF NOT EXISTS historical_data (
+            id SERIAL,
+            analysis_id INTEGER,
+            date DATE NOT NULL,
+            ndvi DOUBLE PRECISION,
+            ndwi DOUBLE PRECISION,
+            soil_moisture DOUBLE PRECISION,
+            water_level DOUBLE PRECISION,
+            PRIMARY KEY (id, date)
+        ) PARTITION BY RANGE (date);
+
+        CREATE INDEX IF NOT EXISTS historical_data_analysis_idx ON historical_data (analysis_id);
+        CREATE INDEX IF NOT EXISTS historical_data_date_idx ON historical_data (date);
+    """)
+
+
+def create_summary_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS risk_daily_summary (
+            day DATE,
+            cell_id TEXT,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            analyses INTEGER DEFAULT 0,
+            high INTEGER DEFAULT 0,
+            medium INTEGER DEFAULT 0,
+            low INTEGER DEFAULT 0,
+            sum_confidence DOUBLE PRECISION DEFAULT 0,
+            sum_ndvi DOUBLE PRECISION DEFAULT 0,
+            sum_ndwi DOUBLE PRECISION DEFAULT 0,
+            sum_soil_moisture DOUBLE PRECISION DEFAULT 0,
+            max_water_level DOUBLE PRECISION,
+            PRIMARY KEY (day, cell_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS risk_daily_summary_location_idx
+            ON risk_daily_summary (latitude, longitude, day);
+    """)
+
+
+def ensure_partitions(cur, first_month, last_month):
+    """Create the monthly partitions from first_month to last_month (inclusive)"""
+    created = []
+    for table in PARTITIONED_TABLES:
+        month = month_start(first_month)
+        while month <= last_month:
+            name = partition_name(table, month)
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s)
+            """, (month, add_months(month, 1)))
+            created.append(name)
+            month = add_months(month, 1)
+    return created
+
+
+def init_partitioned_tables(conn):
+    """Create the partitioned tables, the summary table and the upcoming partitions"""
+    cur = conn.cursor()
+    try:
+        legacy = [table for table in PARTITIONED_TABLES if table_kind(cur, table) == 'r']
+        if legacy:
+            # Existing unpartitioned tables keep working until they are migrated
+            logger.warning(f"Unpartitioned tables {legacy}; run 'python partitions.py migrate'")
+        else:
+            create_tables(cur)
+            this_month = month_start(date.today())
+            ensure_partitions(cur, this_month, add_months(this_month, MONTHS_AHEAD))
+        create_summary_table(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def migrate(conn):
+    """Copy unpartitioned analysis tables into partitioned ones; the old tables are kept renamed"""
+    cur = conn.cursor()
+    try:
+        legacy = {}
+        for table, key in PARTITIONED_TABLES.items():
+            if table_kind(cur, table) != 'r':
+                continue
+            old = f"{table}_unpartitioned"
+            cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            legacy[table] = old
+
+        create_tables(cur)
+        create_summary_table(cur)
+        this_month = month_start(date.today())
+        for table, old in legacy.items():
+            key = PARTITIONED_TABLES[table]
+            cur.execute(f"SELECT MIN({key}), MAX({key}) FROM {old}")
+            first, last = cur.fetchone()
+            first = min(month_start(first), this_month) if first else this_month
+            last = max(month_start(last), add_months(this_month, MONTHS_AHEAD)) if last \
+                else add_months(this_month, MONTHS_AHEAD)
+            ensure_partitions(cur, first, last)
+
+            if table == 'analysis_results':
+                cur.execute(f"""
+                    INSERT INTO analysis_results
+                    (id, latitude, longitude, location_name, risk_level, ndvi, ndwi,
+                    soil_moisture, water_level, confidence_score, analysis_date)
+                    SELECT id, latitude, longitude, location_name, risk_level, ndvi, ndwi,
+                    soil_moisture, water_level, confidence_score, COALESCE(analysis_date, CURRENT_TIMESTAMP)
+                    FROM {old}
+                """)
+            else:
+                cur.execute(f"""
+                    INSERT INTO historical_data
+                    (id, analysis_id, date, ndvi, ndwi, soil_moisture, water_level)
+                    SELECT id, analysis_id, COALESCE(date, CURRENT_DATE), ndvi, ndwi, soil_moisture, water_level
+                    FROM {old}
+                """)
+            cur.execute(f"""
+                SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false)
+                FROM {table}
+            """)
+            logger.info(f"Migrated {table} into monthly partitions; {old} can be dropped")
+
+        conn.commit()
+        return list(legacy)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def apply_retention(conn, months=RETENTION_MONTHS, action=RETENTION_ACTION, today=None):
+    """Drop or archive partitions whose month ended more than `months` months ago"""
+    cutoff = add_months(month_start(today or date.today()), -months)
+    cur = conn.cursor()
+    removed = []
+    try:
+        if action == 'archive':
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        for table in PARTITIONED_TABLES:
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = %s
+            """, (table,))
+            for (name,) in cur.fetchall():
+                suffix = name[len(table) + 1:]
+                try:
+                    month = datetime.strptime(suffix, 'y%Ym%m').date()
+                except ValueError:
+                    continue
+                if month >= cutoff:
+                    continue
+                if action == 'archive':
+                    cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                    cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+                else:
+                    cur.execute(f"DROP TABLE {name}")
+                removed.append(name)
+        conn.commit()
+        if removed:
+            logger.info(f"Retention ({action}): {removed}")
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def record_summary(cur, lat, lng, risk_level, satellite_data, confidence, day):
+    """
+    Add one analysis to its cell's daily summary (call in the insert's transaction).
+    day is the inserted row's analysis_date::date, the day rollup() groups it under.
+    """
+    center_lat, center_lng = cell_center(lat, lng)
+    level = (risk_level or '').upper()
+    cur.execute("""
+        INSERT INTO risk_daily_summary AS s
+        (day, cell_id, latitude, longitude, analyses, high, medium, low,
+        sum_confidence, sum_ndvi, sum_ndwi, sum_soil_moisture, max_water_level)
+        VALUES (%s, %s, %s, %s, 1, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (day, cell_id) DO UPDATE SET
+            analyses = s.analyses + 1,
+            high = s.high + EXCLUDED.high,
+            medium = s.medium + EXCLUDED.medium,
+            low = s.low + EXCLUDED.low,
+            sum_confidence = s.sum_confidence + EXCLUDED.sum_confidence,
+            sum_ndvi = s.sum_ndvi + EXCLUDED.sum_ndvi,
+            sum_ndwi = s.sum_ndwi + EXCLUDED.sum_ndwi,
+            sum_soil_moisture = s.sum_soil_moisture + EXCLUDED.sum_soil_moisture,
+            max_water_level = GREATEST(s.max_water_level, EXCLUDED.max_water_level)
+    """, (
+        day, cell_id(lat, lng), center_lat, center_lng,
+        int(level == 'HIGH'), int(level == 'MEDIUM'), int(level == 'LOW'),
+        confidence or 0, satellite_data.get('ndvi') or 0, satellite_data.get('ndwi') or 0,
+        satellite_data.get('soil_moisture') or 0, satellite_data.get('water_level')
+    ))
+
+
+def rollup(conn, start_day, end_day=None):
+    """Rebuild the daily summaries from analysis_results for start_day..end_day (inclusive)"""
+    end_day = end_day or date.today()
+    cur = conn.cursor()
+    try:
+        # Blocks record_summary until the rebuild commits: an analysis committed before the lock
+        # is in the rebuilt rows, one committed after it is added on top of them
+        cur.execute("LOCK TABLE risk_daily_summary IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("DELETE FROM risk_daily_summary WHERE day BETWEEN %s AND %s", (start_day, end_day))
+        cur.execute("""
+            INSERT INTO risk_daily_summary
+            (day, cell_id, latitude, longitude, analyses, high, medium, low,
+            sum_confidence, sum_ndvi, sum_ndwi, sum_soil_moisture, max_water_level)
+            SELECT
+                analysis_date::date,
+                row_index || '_' || col_index,
+                (row_index + 0.5) * %(cell)s - 90,
+                (col_index + 0.5) * %(cell)s - 180,
+                COUNT(*),
+                COUNT(*) FILTER (WHERE UPPER(risk_level) = 'HIGH'),
+                COUNT(*) FILTER (WHERE UPPER(risk_level) = 'MEDIUM'),
+                COUNT(*) FILTER (WHERE UPPER(risk_level) = 'LOW'),
+                COALESCE(SUM(confidence_score), 0),
+                COALESCE(SUM(ndvi), 0),
+                COALESCE(SUM(ndwi), 0),
+                COALESCE(SUM(soil_moisture), 0),
+                MAX(water_level)
+            FROM (
+                SELECT *,
+                    FLOOR((latitude + 90) / %(cell)s)::BIGINT AS row_index,
+                    FLOOR((longitude + 180) / %(cell)s)::BIGINT AS col_index
+                FROM analysis_results
+                WHERE analysis_date >= %(start)s AND analysis_date < %(end)s::date + 1
+            ) r
+            GROUP BY analysis_date::date, row_index, col_index
+        """, {'cell': CELL_SIZE, 'start': start_day, 'end': end_day})
+        rows = cur.rowcount
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def daily_summary(conn, start_day, end_day, bbox=None):
+    """Per-day totals and per-cell aggregates for the dashboard, from the summary table"""
+    conditions = ["day BETWEEN %s AND %s"]
+    params = [start_day, end_day]
+    if bbox:
+        west, south, east, north = bbox
+        conditions.append("longitude BETWEEN %s AND %s AND latitude BETWEEN %s AND %s")
+        params += [west, east, south, north]
+    where = " AND ".join(conditions)
+
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT day, SUM(analyses), SUM(high), SUM(medium), SUM(low),
+            SUM(sum_confidence) / NULLIF(SUM(analyses), 0)
+            FROM risk_daily_summary WHERE {where}
+            GROUP BY day ORDER BY day
+        """, params)
+        days = [{
+            'date': day.strftime('%Y-%m-%d'),
+            'analyses': analyses,
+            'high': high,
+            'medium': medium,
+            'low': low,
+            'mean_confidence': round(confidence, 1) if confidence is not None else None
+        } for day, analyses, high, medium, low, confidence in cur.fetchall()]
+
+        cur.execute(f"""
+            SELECT cell_id, latitude, longitude, SUM(analyses), SUM(high), SUM(medium), SUM(low),
+            SUM(sum_ndvi) / NULLIF(SUM(analyses), 0),
+            SUM(sum_ndwi) / NULLIF(SUM(analyses), 0),
+            SUM(sum_soil_moisture) / NULLIF(SUM(analyses), 0),
+            MAX(max_water_level), MAX(day)
+            FROM risk_daily_summary WHERE {where}
+            GROUP BY cell_id, latitude, longitude
+            ORDER BY SUM(high) DESC, SUM(analyses) DESC
+        """, params)
+        cells = [{
+            'cell_id': cell, 'latitude': lat, 'longitude': lng,
+            'analyses': analyses, 'high': high, 'medium': medium, 'low': low,
+            'mean_ndvi': round(ndvi, 3) if ndvi is not None else None,
+            'mean_ndwi': round(ndwi, 3) if ndwi is not None else None,
+            'mean_soil_moisture': round(soil, 3) if soil is not None else None,
+            'max_water_level': water,
+            'last_day': last_day.strftime('%Y-%m-%d')
+        } for cell, lat, lng, analyses, high, medium, low, ndvi, ndwi, soil, water, last_day in cur.fetchall()]
+        return {'days': days, 'cells': cells}
+    finally:
+        cur.close()
+
+
+def maintain(conn):
+    """Create upcoming partitions, apply retention and rebuild yesterday's and today's summaries"""
+    report = {}
+    cur = conn.cursor()
+    try:
+        if all(table_kind(cur, table) == 'p' for table in PARTITIONED_TABLES):
+            this_month = month_start(date.today())
+            ensure_partitions(cur, this_month, add_months(this_month, MONTHS_AHEAD))
+            conn.commit()
+            report['retention'] = apply_retention(conn)
+    finally:
+        cur.close()
+    report['summary_rows'] = rollup(conn, date.today() - timedelta(days=1))
+    return report
+
+
+class PartitionMaintainer:
+    """Runs maintain() every MAINTENANCE_HOURS in a daemon thread"""
+
+    def __init__(self, interval_hours=MAINTENANCE_HOURS):
+        self.interval = interval_hours * 3600
+        self.stop_event = threading.Event()
+        self.last_run = None
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                self.last_run = dict(maintain(conn), finished_at=datetime.now().isoformat())
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {str(e)}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name='partition-maintenance', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'maintain'
+
+    conn = get_db_connection()
+    try:
+        if command == 'init':
+            init_partitioned_tables(conn)
+        elif command == 'migrate':
+            print(f"Migrated: {migrate(conn) or 'nothing to migrate'}")
+            rollup(conn, date.today() - timedelta(days=RETENTION_MONTHS * 31))
+        elif command == 'maintain':
+            print(maintain(conn))
+        elif command == 'rollup':
+            days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+            print(f"{rollup(conn, date.today() - timedelta(days=days))} summary rows")
+        else:
+            print("Usage: python partitions.py [init | migrate | maintain | rollup DAYS]")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
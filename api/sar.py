@@ -0,0 +1,165 @@
+# sar.py
+"""
+Flood extent from Sentinel-1 backscatter change, computed in Earth Engine.
+
+Open water is a specular reflector, so newly flooded land shows a strong drop
+in VV/VH backscatter compared with a dry reference period, regardless of cloud
+cover. Speckle-filtered reference and current mosaics from the same orbit
+direction are differenced; pixels whose backscatter dropped by more than
+FLOOD_DB_DROP and is low enough to be open water are marked flooded.
+Permanent water, steep slopes and isolated pixels are removed. Only the
+aggregated areas and a small preview image leave Earth Engine.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from shapely.geometry import mapping
+
+import ee_cache
+import ee_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Backscatter drop (dB) between reference and current mosaics that marks new water
+FLOOD_DB_DROP = float(os.getenv('SAR_FLOOD_DB_DROP', 3.0))
+# Current VV backscatter (dB) below which a pixel is treated as open water
+OPEN_WATER_VV_DB = float(os.getenv('SAR_OPEN_WATER_VV_DB', -15.0))
+# Months per year a pixel must be water to count as permanent (JRC seasonality)
+PERMANENT_WATER_MONTHS = 10
+MAX_SLOPE_DEGREES = 5
+# Flooded clusters smaller than this many pixels are treated as noise
+MIN_CONNECTED_PIXELS = 8
+SPECKLE_RADIUS_M = 50
+SAR_SCALE = int(os.getenv('SAR_SCALE', 30))
+DEFAULT_RADIUS_M = int(os.getenv('SAR_RADIUS_M', 5000))
+PREVIEW_DIMENSIONS = 256
+
+# Sentinel-1 revisit over Kenya is about 12 days
+CURRENT_DAYS = 12
+# Reference period: from 90 to 30 days before the end date
+REFERENCE_START_DAYS = 90
+REFERENCE_END_DAYS = 30
+
+
+def s1_collection(region, start, end, orbit_pass=None):
+    import ee
+
+    collection = ee.ImageCollection('COPERNICUS/S1_GRD') \
+        .filterBounds(region) \
+        .filterDate(start, end) \
+        .filter(ee.Filter.eq('instrumentMode', 'IW')) \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VV')) \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'VH'))
+    if orbit_pass:
+        collection = collection.filter(ee.Filter.eq('orbitProperties_pass', orbit_pass))
+    return collection.select(['VV', 'VH'])
+
+
+def mosaic(collection):
+    """Speckle-filtered mean backscatter (dB)"""
+    return collection.mean().focal_median(SPECKLE_RADIUS_M, 'circle', 'meters')
+
+
+def flood_mask(reference, current):
+    """1 where the current period shows new open water, masked elsewhere"""
+    import ee
+
+    difference = current.subtract(reference)
+    flooded = difference.select('VV').lt(-FLOOD_DB_DROP) \
+        .And(difference.select('VH').lt(-FLOOD_DB_DROP)) \
+        .And(current.select('VV').lt(OPEN_WATER_VV_DB))
+
+    permanent_water = ee.Image('JRC/GSW1_4/GlobalSurfaceWater').select('seasonality') \
+        .gte(PERMANENT_WATER_MONTHS).unmask(0)
+    slope = ee.Terrain.slope(ee.Image('USGS/SRTMGL1_003'))
+    flooded = flooded.updateMask(permanent_water.Not()).updateMask(slope.lt(MAX_SLOPE_DEGREES))
+    flooded = flooded.updateMask(flooded.connectedPixelCount(MIN_CONNECTED_PIXELS * 2).gte(MIN_CONNECTED_PIXELS))
+    return flooded.selfMask().rename('flooded')
+
+
+def flood_extent(geometry=None, lat=None, lng=None, radius_m=DEFAULT_RADIUS_M, end_date=None,
+                 current_days=CURRENT_DAYS, reference_start_days=REFERENCE_START_DAYS,
+                 reference_end_days=REFERENCE_END_DAYS, scale=SAR_SCALE, preview=True):
+    """
+    Flooded area within a shapely geometry, or within radius_m of lat/lng.
+    Returns None if either period has no Sentinel-1 coverage.
+    """
+    import ee
+
+    region = ee.Geometry(mapping(geometry)) if geometry is not None \
+        else ee.Geometry.Point([lng, lat]).buffer(radius_m)
+
+    end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else ee_cache.now()
+    current_period = ((end - timedelta(days=current_days)).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+    reference_period = ((end - timedelta(days=reference_start_days)).strftime('%Y-%m-%d'),
+                        (end - timedelta(days=reference_end_days)).strftime('%Y-%m-%d'))
+
+    # Compare like with like: use the orbit direction of the latest current scene
+    current_scenes = s1_collection(region, *current_period)
+    latest = ee_scheduler.get_info(ee.Dictionary({
+        'count': current_scenes.size(),
+        'orbit_pass': ee.Algorithms.If(
+            current_scenes.size().gt(0),
+            current_scenes.sort('system:time_start', False).first().get('orbitProperties_pass'),
+            None
+        )
+    }))
+    if not latest['count']:
+        return None
+    orbit_pass = latest['orbit_pass']
+
+    current_collection = s1_collection(region, *current_period, orbit_pass=orbit_pass)
+    reference_collection = s1_collection(region, *reference_period, orbit_pass=orbit_pass)
+    current = mosaic(current_collection)
+    reference = mosaic(reference_collection)
+    flooded = flood_mask(reference, current)
+
+    pixel_area = ee.Image.pixelArea()
+    valid = current.select('VV').mask().And(reference.select('VV').mask())
+    areas = ee.Image.cat([
+        flooded.unmask(0).multiply(pixel_area).rename('flooded'),
+        pixel_area.updateMask(valid).rename('analyzed')
+    ]).reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=region,
+        scale=scale,
+        maxPixels=1e9,
+        tileScale=4
+    )
+    # One request for the areas and scene counts
+    result = ee_scheduler.get_info(ee.Dictionary({
+        'areas': areas,
+        'current_scenes': current_collection.size(),
+        'reference_scenes': reference_collection.size()
+    }))
+    if not result['reference_scenes']:
+        return None
+
+    flooded_km2 = (result['areas'].get('flooded') or 0) / 1e6
+    analyzed_km2 = (result['areas'].get('analyzed') or 0) / 1e6
+    fraction = flooded_km2 / analyzed_km2 if analyzed_km2 else 0.0
+
+    preview_url = None
+    if preview:
+        try:
+            preview_url = ee_scheduler.call(lambda: flooded.visualize(palette=['0000FF']).getThumbURL({
+                'region': region,
+                'dimensions': PREVIEW_DIMENSIONS,
+                'format': 'png'
+            }))
+        except Exception as e:
+            logger.error(f"SAR preview failed: {str(e)}")
+
+    return {
+        'flooded_area_km2': round(flooded_km2, 3),
+        'analyzed_area_km2': round(analyzed_km2, 3),
+        'flooded_percentage': round(fraction * 100, 2),
+        'flood_fraction': round(fraction, 4),
+        'current_period': list(current_period),
+        'reference_period': list(reference_period),
+        'current_scenes': result['current_scenes'],
+        'reference_scenes': result['reference_scenes'],
+        'orbit_pass': orbit_pass,
+        'preview_url': preview_url
+    }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The API modules are imported flatly, as app.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import local_rasters
+from local_rasters import LocalRasterStore, write_layer
+
+# 4 x 4 pixels of 0.5 degrees: west 36, south -2, east 38, north 0
+BBOX = (36.0, -2.0, 38.0, 0.0)
+RESOLUTION = 0.5
+
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def store(tmp_path):
+    soil_moisture = np.arange(16, dtype='float32').reshape(4, 4) / 100
+    soil_moisture[0, 0] = np.nan
+    write_layer(str(tmp_path), 'soil_moisture', soil_moisture, BBOX, RESOLUTION, np.nan,
+                end_date=days_ago(1), days=7)
+    occurrence = np.full((4, 4), 40, dtype='uint8')
+    occurrence[3, 3] = 255
+    write_layer(str(tmp_path), 'water_occurrence', occurrence, BBOX, RESOLUTION, 255)
+    return LocalRasterStore(str(tmp_path), max_age_days=10)
+
+
+def test_sample_inside_coverage(store):
+    # Row 1 (latitude -0.5 to -1.0), column 2 (longitude 37.0 to 37.5)
+    assert store.sample('soil_moisture', -0.7, 37.2) == pytest.approx(0.06)
+    assert store.sample('water_occurrence', -0.7, 37.2) == 40
+
+
+def test_sample_outside_coverage_or_nodata(store):
+    assert store.sample('soil_moisture', 1.0, 37.0) is None
+    assert store.sample('soil_moisture', -1.0, 40.0) is None
+    assert store.sample('soil_moisture', -0.2, 36.2) is None
+    assert store.sample('water_occurrence', -1.8, 37.8) is None
+
+
+def test_stale_time_varying_layer_is_ignored(tmp_path):
+    write_layer(str(tmp_path), 'soil_moisture', np.ones((4, 4), dtype='float32'), BBOX, RESOLUTION, np.nan,
+                end_date=days_ago(30), days=7)
+    assert LocalRasterStore(str(tmp_path), max_age_days=10).sample('soil_moisture', -0.7, 37.2) is None
+    assert LocalRasterStore(str(tmp_path), max_age_days=60).sample('soil_moisture', -0.7, 37.2) == 1.0
+
+
+def test_missing_layer(tmp_path):
+    assert LocalRasterStore(str(tmp_path)).sample('soil_moisture', -0.7, 37.2) is None
+
+
+def test_reingested_layer_is_reopened(store, tmp_path):
+    assert store.sample('water_occurrence', -0.7, 37.2) == 40
+    write_layer(str(tmp_path), 'water_occurrence', np.full((4, 4), 90, dtype='uint8'), BBOX, RESOLUTION, 255)
+    # Make sure the sidecar's mtime changes even on coarse filesystem clocks
+    meta_path = tmp_path / 'water_occurrence.json'
+    stat = meta_path.stat()
+    os.utime(meta_path, (stat.st_atime, stat.st_mtime + 10))
+    assert store.sample('water_occurrence', -0.7, 37.2) == 90
+
+
+def test_ingest_writes_tiles_into_one_layer(tmp_path, monkeypatch):
+    class FakeImage:
+        def unmask(self, value):
+            return self
+
+    def fake_compute_pixels(image, west, north, width, height, resolution, priority_level=None):
+        # Each pixel holds 10 x its tile's column offset in degrees, to check placement
+        tile = np.zeros((height, width), dtype=[('occurrence', 'uint8')])
+        tile['occurrence'] = int(round((west - BBOX[0]) * 10))
+        return tile
+
+    monkeypatch.setattr(local_rasters, 'build_ee_image', lambda name, days: (FakeImage(), {}))
+    monkeypatch.setattr(local_rasters, 'compute_pixels', fake_compute_pixels)
+    monkeypatch.setattr(local_rasters, 'INGEST_TILE_SIZE', 2)
+
+    assert local_rasters.ingest('water_occurrence', BBOX, str(tmp_path), resolution=RESOLUTION) == (4, 4)
+    store = LocalRasterStore(str(tmp_path))
+    assert store.sample('water_occurrence', -0.2, 36.2) == 0
+    assert store.sample('water_occurrence', -1.8, 37.8) == 10
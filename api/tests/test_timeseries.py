@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+import timeseries
+from timeseries import TimeSeriesStore
+
+NAIROBI = (-1.29, 36.82)
+MOMBASA = (-4.04, 39.67)
+
+
+def make_store(directory):
+    return TimeSeriesStore(str(directory), flush_interval=0)
+
+
+def ndvi_means(store, lat, lng):
+    return store.rollup(lat, lng, 'daily')[1]['ndvi'].round(2).tolist()
+
+
+def test_flush_merges_observations_from_several_stores(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    first.add(*NAIROBI, '2026-10-10', {'ndvi': 0.1})
+    first.add(*NAIROBI, '2026-10-11', {'ndvi': 0.2})
+    second.add(*NAIROBI, '2026-10-12', {'ndvi': 0.3})
+
+    first.flush()
+    second.flush()
+
+    # The second store picked up the first one's rows, and a fresh store reads all of them
+    assert ndvi_means(second, *NAIROBI) == [0.1, 0.2, 0.3]
+    assert ndvi_means(make_store(tmp_path), *NAIROBI) == [0.1, 0.2, 0.3]
+
+
+def test_flush_does_not_duplicate_rows(tmp_path):
+    store = make_store(tmp_path)
+    store.add(*NAIROBI, '2026-10-10', {'ndvi': 0.1})
+    store.flush()
+    store.flush()
+    store.add(*NAIROBI, '2026-10-11', {'ndvi': 0.2})
+    store.flush()
+
+    days, _ = timeseries.read_cell(os.path.join(tmp_path, f"{timeseries.cell_id(*NAIROBI)}.npz"))
+    assert len(days) == 2
+
+
+def test_failed_write_keeps_rows_and_writes_other_cells(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    store.add(*NAIROBI, '2026-10-10', {'ndvi': 0.1})
+    store.add(*MOMBASA, '2026-10-10', {'ndvi': 0.5})
+    failing_cell = timeseries.cell_id(*NAIROBI)
+
+    savez = np.savez
+
+    def flaky_savez(path, **arrays):
+        savez(path, **arrays)
+        if failing_cell in os.path.basename(path):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(timeseries.np, 'savez', flaky_savez)
+    store.flush()
+
+    assert list(store.pending) == [failing_cell]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp.npz')]
+    assert ndvi_means(make_store(tmp_path), *MOMBASA) == [0.5]
+
+    monkeypatch.setattr(timeseries.np, 'savez', savez)
+    store.flush()
+    assert store.pending == {}
+    assert ndvi_means(make_store(tmp_path), *NAIROBI) == [0.1]
@@ -0,0 +1,355 @@
+# timeseries.py
+"""
+Per-location indicator time series.
+
+Observations are kept per grid cell in compact array-backed blocks. Daily, weekly
+and monthly rollups (sum, sum of squares, count per indicator) are updated on
+every insert, so trend, slope and anomaly queries read the rollups with
+vectorized NumPy instead of scanning raw observations.
+
+With TIMESERIES_DIR set, each cell is stored as <cell>.npz. Several server
+processes (gunicorn workers) can share the directory: each appends only its
+own new observations to a cell's file, under an exclusive lock on the file.
+"""
+import atexit
+import fcntl
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from grid import cell_id
+
+logger = logging.getLogger(__name__)
+
+INDICATORS = ('ndvi', 'ndwi', 'soil_moisture', 'water_level')
+PERIODS = ('daily', 'weekly', 'monthly')
+EPOCH = date(1970, 1, 1)
+
+TIMESERIES_DIR = os.getenv('TIMESERIES_DIR', '')
+FLUSH_INTERVAL = int(os.getenv('TIMESERIES_FLUSH_INTERVAL', 60))
+
+
+def to_day(value):
+    """Days since 1970-01-01 for a date, datetime or 'YYYY-MM-DD' string"""
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def from_day(day):
+    return (EPOCH + timedelta(days=int(day))).strftime('%Y-%m-%d')
+
+
+def period_keys(days, period):
+    """Vectorized period index of day numbers: the day, the Monday-based week or the month"""
+    days = np.asarray(days, dtype=np.int64)
+    if period == 'daily':
+        return days
+    if period == 'weekly':
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    months = days.astype('datetime64[D]').astype('datetime64[M]')
+    return months.astype(np.int64)
+
+
+def period_start_day(key, period):
+    """First day number of a period index"""
+    if period == 'daily':
+        return int(key)
+    if period == 'weekly':
+        return int(key) * 7 - 3
+    return int(np.datetime64(int(key), 'M').astype('datetime64[D]').astype(np.int64))
+
+
+class Rollup:
+    """Sorted period keys with per-indicator sum, sum of squares and count"""
+
+    def __init__(self, period, capacity=16):
+        n = len(INDICATORS)
+        self.period = period
+        self.size = 0
+        self.keys = np.empty(capacity, dtype=np.int64)
+        self.sum = np.zeros((capacity, n))
+        self.sumsq = np.zeros((capacity, n))
+        self.count = np.zeros((capacity, n), dtype=np.int32)
+
+    def _grow(self):
+        capacity = len(self.keys) * 2
+        for name in ('keys', 'sum', 'sumsq', 'count'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, day, values):
+        """Add one observation row (NaN = missing indicator)"""
+        key = int(period_keys(day, self.period))
+        # Observations almost always arrive in time order, so this is usually the last row
+        if self.size and self.keys[self.size - 1] == key:
+            i = self.size - 1
+        else:
+            i = int(np.searchsorted(self.keys[:self.size], key))
+            if i == self.size or self.keys[i] != key:
+                if self.size == len(self.keys):
+                    self._grow()
+                for name in ('keys', 'sum', 'sumsq', 'count'):
+                    array = getattr(self, name)
+                    array[i + 1:self.size + 1] = array[i:self.size]
+                self.keys[i] = key
+                self.sum[i] = 0
+                self.sumsq[i] = 0
+                self.count[i] = 0
+                self.size += 1
+
+        present = ~np.isnan(values)
+        self.sum[i, present] += values[present]
+        self.sumsq[i, present] += values[present] ** 2
+        self.count[i, present] += 1
+
+    @classmethod
+    def build(cls, period, days, values):
+        """Rollup of many observations at once (used when loading from disk)"""
+        rollup = cls(period, capacity=max(16, len(days)))
+        if not len(days):
+            return rollup
+        keys = period_keys(days, period)
+        order = np.argsort(keys, kind='stable')
+        keys, values = keys[order], values[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0)
+        n = len(starts)
+        rollup.keys[:n] = keys[starts]
+        rollup.sum[:n] = np.add.reduceat(filled, starts, axis=0)
+        rollup.sumsq[:n] = np.add.reduceat(filled ** 2, starts, axis=0)
+        rollup.count[:n] = np.add.reduceat(present.astype(np.int32), starts, axis=0)
+        rollup.size = n
+        return rollup
+
+    def means(self, start_key=None, end_key=None):
+        """(keys, means (n, indicators)) for periods in [start_key, end_key]"""
+        keys = self.keys[:self.size]
+        lo = 0 if start_key is None else int(np.searchsorted(keys, start_key, 'left'))
+        hi = self.size if end_key is None else int(np.searchsorted(keys, end_key, 'right'))
+        count = self.count[lo:hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(count > 0, self.sum[lo:hi] / count, np.nan)
+        return keys[lo:hi], means
+
+
+class CellSeries:
+    """Raw observations of one grid cell plus its rollups"""
+
+    def __init__(self, days=None, values=None):
+        n = len(INDICATORS)
+        if days is None:
+            days = np.empty(0, dtype=np.int64)
+            values = np.empty((0, n), dtype=np.float32)
+        capacity = max(16, len(days))
+        self.size = len(days)
+        self.days = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, n), dtype=np.float32)
+        self.days[:self.size] = days
+        self.values[:self.size] = values
+        self.rollups = {period: Rollup.build(period, days, values.astype(np.float64)) for period in PERIODS}
+
+    def add(self, day, values):
+        if self.size == len(self.days):
+            capacity = len(self.days) * 2
+            self.days = np.resize(self.days, capacity)
+            self.values = np.resize(self.values, (capacity, self.values.shape[1]))
+        self.days[self.size] = day
+        self.values[self.size] = values
+        self.size += 1
+        for rollup in self.rollups.values():
+            rollup.add(day, values)
+
+
+def linear_slope(x, y):
+    """Least-squares slope of y over x, ignoring NaNs; None with fewer than 2 points"""
+    mask = ~np.isnan(y)
+    if mask.sum() < 2:
+        return None
+    x = x[mask].astype(np.float64)
+    y = y[mask]
+    x_centered = x - x.mean()
+    denominator = (x_centered ** 2).sum()
+    if denominator == 0:
+        return None
+    return float((x_centered * (y - y.mean())).sum() / denominator)
+
+
+def read_cell(path):
+    """(days, values) stored in a cell file, empty if there is none"""
+    if not os.path.exists(path):
+        return np.empty(0, dtype=np.int64), np.empty((0, len(INDICATORS)), dtype=np.float32)
+    with np.load(path) as data:
+        return data['days'], data['values']
+
+
+class TimeSeriesStore:
+    """Grid-cell keyed indicator series, optionally persisted as one .npz per cell"""
+
+    def __init__(self, directory=TIMESERIES_DIR, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.cells = {}
+        # cell -> [(day, row)] recorded since the last flush
+        self.pending = {}
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+            self.start_flush_thread()
+
+    def start_flush_thread(self):
+        """Flush periodically in a daemon thread (again in each forked worker)"""
+        if self.directory and self.flush_interval:
+            thread = threading.Thread(target=self._flush_loop, args=(self.flush_interval,),
+                                      name='timeseries-flush', daemon=True)
+            thread.start()
+
+    def _get(self, cell, create=False):
+        series = self.cells.get(cell)
+        if series is None and self.directory:
+            path = os.path.join(self.directory, f"{cell}.npz")
+            if os.path.exists(path):
+                series = self.cells[cell] = CellSeries(*read_cell(path))
+        if series is None and create:
+            series = self.cells[cell] = CellSeries()
+        return series
+
+    def add(self, lat, lng, when, values):
+        """Record one observation; values is a dict with any of INDICATORS"""
+        # Missing or None indicators become NaN
+        row = np.array([values.get(name) for name in INDICATORS], dtype=np.float64)
+        cell = cell_id(lat, lng)
+        with self.lock:
+            self._get(cell, create=True).add(to_day(when), row)
+            self.pending.setdefault(cell, []).append((to_day(when), row))
+
+    def rollup(self, lat, lng, period='daily', days=None, end=None):
+        """(period start dates, {indicator: means}) for the last `days` days, or None"""
+        end_day = to_day(end or datetime.now())
+        with self.lock:
+            series = self._get(cell_id(lat, lng))
+            if series is None:
+                return None
+            start_key = None if days is None else period_keys(end_day - days + 1, period)
+            keys, means = series.rollups[period].means(start_key, period_keys(end_day, period))
+        starts = np.array([period_start_day(k, period) for k in keys], dtype=np.int64)
+        return starts, {name: means[:, i] for i, name in enumerate(INDICATORS)}
+
+    def history(self, lat, lng, days=10, min_points=2):
+        """
+        Daily means over the last `days` days, newest first, in the shape returned by
+        get_historical_analysis. None if the cell has fewer than min_points days.
+        """
+        result = self.rollup(lat, lng, 'daily', days)
+        if result is None or len(result[0]) < min_points:
+            return None
+        starts, means = result
+
+        history = {'dates': [from_day(d) for d in starts[::-1]]}
+        for name, values in means.items():
+            history[name] = [None if np.isnan(v) else round(float(v), 2) for v in values[::-1]]
+        return history
+
+    def trend(self, lat, lng, indicator, days=90, period='daily', threshold=0.05):
+        """
+        Least-squares slope per day over the window, and the change it implies across
+        the window classified as Increasing/Decreasing/Stable. None without enough data.
+        """
+        result = self.rollup(lat, lng, period, days)
+        if result is None:
+            return None
+        starts, means = result
+        slope = linear_slope(starts, means[indicator])
+        if slope is None:
+            return None
+
+        change = slope * float(starts[-1] - starts[0])
+        direction = 'Stable' if abs(change) < threshold else ('Increasing' if change > 0 else 'Decreasing')
+        return {'slope_per_day': round(slope, 5), 'change': round(change, 3), 'direction': direction}
+
+    def anomaly(self, lat, lng, indicator, window=30, days=365):
+        """
+        Rolling z-score of the latest daily mean against the preceding `window` days.
+        Returns {'date', 'value', 'zscore'} or None.
+        """
+        result = self.rollup(lat, lng, 'daily', days)
+        if result is None:
+            return None
+        starts, means = result
+        values = means[indicator]
+        mask = ~np.isnan(values)
+        starts, values = starts[mask], values[mask]
+        if len(values) < 3:
+            return None
+
+        # Rolling mean/std of the `window` points before each point, from cumulative sums
+        csum = np.concatenate([[0.0], np.cumsum(values)])
+        csumsq = np.concatenate([[0.0], np.cumsum(values ** 2)])
+        idx = np.arange(len(values))
+        lo = np.maximum(idx - window, 0)
+        n = idx - lo
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (csum[idx] - csum[lo]) / n
+            var = (csumsq[idx] - csumsq[lo]) / n - mean ** 2
+            zscores = (values - mean) / np.sqrt(np.maximum(var, 0))
+
+        z = zscores[-1]
+        return {
+            'date': from_day(starts[-1]),
+            'value': round(float(values[-1]), 3),
+            'zscore': None if not np.isfinite(z) else round(float(z), 2)
+        }
+
+    def flush(self):
+        """
+        Append observations recorded since the last flush to their cells' files, merged with
+        what other processes wrote, and reload those cells so this process sees their rows too
+        """
+        if not self.directory:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for cell, rows in pending.items():
+            path = os.path.join(self.directory, f"{cell}.npz")
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            try:
+                with open(f"{path}.lock", 'w') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    stored_days, stored_values = read_cell(path)
+                    days = np.concatenate([stored_days, np.array([day for day, _ in rows], dtype=np.int64)])
+                    values = np.concatenate([stored_values, np.array([row for _, row in rows], dtype=np.float32)])
+                    np.savez(tmp_path, days=days, values=values)
+                    os.replace(tmp_path, path)
+            except Exception as e:
+                # Kept for the next flush; the other cells are still written
+                with self.lock:
+                    self.pending[cell] = rows + self.pending.get(cell, [])
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                logger.error(f"Time series flush failed for cell {cell}: {str(e)}")
+                continue
+            with self.lock:
+                series = CellSeries(days, values)
+                for day, row in self.pending.get(cell, []):
+                    series.add(day, row)
+                self.cells[cell] = series
+
+    def _flush_loop(self, interval):
+        stop = threading.Event()
+        while not stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Time series flush failed: {str(e)}")
@@ -0,0 +1,332 @@
+# watchlist.py
+"""
+Watchlist of flood-prone places whose analyses are refreshed ahead of time.
+
+Each watchlist entry is re-analyzed when new imagery is likely to be available
+(one Sentinel-2 revisit after the last image used), with refreshes spread out in
+time to stay within Earth Engine quota. Results are stored per grid cell in
+warm_analysis, and /api/analyze serves them directly.
+
+Run as a separate worker:
+    python watchlist.py seed      # add the default Kenyan locations
+    python watchlist.py add "Budalangi" 0.13 34.02
+    python watchlist.py run       # refresh loop
+or set WATCHLIST_SCHEDULER=1 to run the loop inside the API process.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from psycopg2.extras import Json
+
+import ee_scheduler
+import log_config
+from db import get_db_connection
+from grid import cell_center, cell_id
+from http_cache import make_etag
+
+logger = logging.getLogger(__name__)
+
+# Sentinel-2 revisit time; a new image is unlikely before this
+REVISIT_DAYS = int(os.getenv('WATCHLIST_REVISIT_DAYS', 5))
+# How soon to retry when the expected image has not arrived yet or the refresh failed
+RETRY_HOURS = float(os.getenv('WATCHLIST_RETRY_HOURS', 12))
+# Quota: at most this many refreshes per hour, spaced evenly
+MAX_REFRESHES_PER_HOUR = int(os.getenv('WATCHLIST_MAX_REFRESHES_PER_HOUR', 120))
+# How often the loop looks for due locations
+POLL_SECONDS = int(os.getenv('WATCHLIST_POLL_SECONDS', 300))
+# Warm results older than this are not served
+WARM_MAX_AGE_HOURS = float(os.getenv('WARM_MAX_AGE_HOURS', 24 * REVISIT_DAYS))
+
+DEFAULT_LOCATIONS = [
+    ('Budalangi', 0.13, 34.02),
+    ('Garsen (Tana River)', -2.27, 40.12),
+    ('Hola (Tana River)', -1.50, 40.03),
+    ('Ahero (Kano Plains)', -0.17, 34.92),
+    ('Kisumu', -0.09, 34.77),
+    ('Homa Bay', -0.53, 34.45),
+    ('Port Victoria', 0.10, 33.98),
+    ('Mandera', 3.94, 41.86),
+]
+
+
+def init_watchlist_tables(conn):
+    """Create watchlist, warm_analysis and watchlist_runs tables"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS watchlist (
+                id SERIAL PRIMARY KEY,
+                name TEXT,
+                latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION,
+                cell_id TEXT UNIQUE,
+                last_image_date DATE,
+                last_refreshed TIMESTAMP,
+                next_due TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE INDEX IF NOT EXISTS watchlist_next_due_idx ON watchlist (next_due);
+
+            CREATE TABLE IF NOT EXISTS warm_analysis (
+                cell_id TEXT PRIMARY KEY,
+                etag TEXT,
+                image_date DATE,
+                payload JSONB,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS watchlist_runs (
+                id SERIAL PRIMARY KEY,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                locations INTEGER,
+                succeeded INTEGER,
+                failed INTEGER,
+                seconds_per_location DOUBLE PRECISION,
+                mean_refresh_lag_hours DOUBLE PRECISION,
+                mean_image_age_days DOUBLE PRECISION
+            );
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def add_location(name, lat, lng):
+    """Add a place to the watchlist (one entry per grid cell); it is refreshed on the next run"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO watchlist (name, latitude, longitude, cell_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (cell_id) DO UPDATE SET name = EXCLUDED.name
+        """, (name, lat, lng, cell_id(lat, lng)))
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def get_warm(lat, lng):
+    """(etag, payload) of a fresh warm analysis for the point's grid cell, or None"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT etag, payload FROM warm_analysis
+            WHERE cell_id = %s AND refreshed_at > %s
+        """, (cell_id(lat, lng), datetime.now() - timedelta(hours=WARM_MAX_AGE_HOURS)))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else None
+    finally:
+        cur.close()
+        conn.close()
+
+
+def store_warm(cur, cell, payload):
+    etag = make_etag(cell, payload['image_date'])
+    cur.execute("""
+        INSERT INTO warm_analysis (cell_id, etag, image_date, payload, refreshed_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (cell_id) DO UPDATE SET
+            etag = EXCLUDED.etag,
+            image_date = EXCLUDED.image_date,
+            payload = EXCLUDED.payload,
+            refreshed_at = EXCLUDED.refreshed_at
+    """, (cell, etag, payload['image_date'], Json(payload, dumps=lambda o: json.dumps(o, default=str))))
+
+
+def next_due_after(image_date, now):
+    """When the next image after image_date is likely to be available"""
+    due = datetime.strptime(image_date, '%Y-%m-%d') + timedelta(days=REVISIT_DAYS)
+    return due if due > now else now + timedelta(hours=RETRY_HOURS)
+
+
+class WatchlistScheduler:
+    """
+    Refreshes due watchlist entries, at most MAX_REFRESHES_PER_HOUR, spaced evenly.
+
+    analyze_fn(lat, lng) must return (response data, satellite data) like app.run_analysis.
+    """
+
+    def __init__(self, analyze_fn, max_per_hour=MAX_REFRESHES_PER_HOUR, poll_seconds=POLL_SECONDS):
+        self.analyze_fn = analyze_fn
+        self.spacing = 3600 / max_per_hour
+        self.max_per_run = max(1, int(max_per_hour * poll_seconds / 3600))
+        self.poll_seconds = poll_seconds
+        self.last_run = None
+        self.stop_event = threading.Event()
+
+    def due_locations(self, limit):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT id, name, latitude, longitude, cell_id, next_due
+                FROM watchlist
+                WHERE next_due <= CURRENT_TIMESTAMP
+                ORDER BY next_due
+                LIMIT %s
+            """, (limit,))
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    def refresh(self, entry):
+        """Re-analyze one entry; returns (refresh lag in hours, image age in days)"""
+        try:
+            return self._refresh(entry)
+        except Exception:
+            # Retried later, so a failing entry does not stay at the head of the due queue
+            self.postpone(entry[0])
+            raise
+
+    def postpone(self, entry_id):
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute("UPDATE watchlist SET next_due = %s WHERE id = %s",
+                        (datetime.now() + timedelta(hours=RETRY_HOURS), entry_id))
+            conn.commit()
+            cur.close()
+        except Exception as e:
+            logger.error(f"Could not postpone watchlist entry {entry_id}: {str(e)}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _refresh(self, entry):
+        entry_id, name, lat, lng, cell, due = entry
+        # Background refreshes yield to interactive requests for Earth Engine capacity
+        with ee_scheduler.priority(ee_scheduler.WATCHLIST), log_config.trace(), log_config.stage('watchlist'):
+            response_data, satellite_data = self.analyze_fn(*cell_center(lat, lng))
+        now = datetime.now()
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            if satellite_data.get('mock'):
+                # Earth Engine failed; keep the previous warm result (refresh() postpones the entry)
+                raise RuntimeError(f"No satellite data for {name}")
+
+            store_warm(cur, cell, response_data)
+            image_date = response_data['image_date']
+            cur.execute("""
+                UPDATE watchlist
+                SET last_image_date = %s, last_refreshed = %s, next_due = %s
+                WHERE id = %s
+            """, (image_date, now, next_due_after(image_date, now), entry_id))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+        image_age = (now - datetime.strptime(image_date, '%Y-%m-%d')).total_seconds() / 86400
+        return (now - due).total_seconds() / 3600, image_age
+
+    def run_once(self):
+        """Refresh the entries that are due now, spaced to respect the quota, and record the run"""
+        started = datetime.now()
+        entries = self.due_locations(self.max_per_run)
+        lags, ages = [], []
+        failed = 0
+
+        for i, entry in enumerate(entries):
+            if i and self.stop_event.wait(self.spacing):
+                break
+            try:
+                lag, age = self.refresh(entry)
+                lags.append(lag)
+                ages.append(age)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Watchlist refresh failed for {entry[1]}: {str(e)}")
+
+        finished = datetime.now()
+        attempted = len(lags) + failed
+        report = {
+            'started_at': started.isoformat(),
+            'locations': attempted,
+            'succeeded': len(lags),
+            'failed': failed,
+            'seconds_per_location': round((finished - started).total_seconds() / attempted, 2) if attempted else 0,
+            'mean_refresh_lag_hours': round(sum(lags) / len(lags), 2) if lags else None,
+            'mean_image_age_days': round(sum(ages) / len(ages), 1) if ages else None
+        }
+        self.last_run = report
+        if attempted:
+            self.record_run(started, finished, report)
+            logger.info(f"Watchlist run: {report}")
+        return report
+
+    def record_run(self, started, finished, report):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO watchlist_runs
+                (started_at, finished_at, locations, succeeded, failed,
+                seconds_per_location, mean_refresh_lag_hours, mean_image_age_days)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (started, finished, report['locations'], report['succeeded'], report['failed'],
+                  report['seconds_per_location'], report['mean_refresh_lag_hours'],
+                  report['mean_image_age_days']))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Watchlist run failed: {str(e)}")
+            self.stop_event.wait(self.poll_seconds)
+
+    def start(self):
+        """Run the loop in a daemon thread"""
+        thread = threading.Thread(target=self.run_forever, name='watchlist-scheduler', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    log_config.setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+
+    conn = get_db_connection()
+    try:
+        init_watchlist_tables(conn)
+    finally:
+        conn.close()
+
+    if command == 'seed':
+        for name, lat, lng in DEFAULT_LOCATIONS:
+            add_location(name, lat, lng)
+        print(f"Added {len(DEFAULT_LOCATIONS)} locations")
+    elif command == 'add':
+        name, lat, lng = sys.argv[2], float(sys.argv[3]), float(sys.argv[4])
+        add_location(name, lat, lng)
+        print(f"Added {name}")
+    elif command == 'run':
+        from app import run_analysis
+        WatchlistScheduler(run_analysis).run_forever()
+    else:
+        print("Usage: python watchlist.py [seed | add NAME LAT LNG | run]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# zonal.py
+"""
+Zonal flood-risk statistics for a GeoJSON polygon (county, river basin, ...).
+
+NDVI/NDWI come from a cloud-filtered Sentinel-2 median composite and soil
+moisture from ERA5-Land; a per-pixel risk band applies the same weights as
+calculate_flood_risk. Polygons too large for one reduceRegion call are split
+into tiles that are reduced in parallel. Each tile returns a sum and a
+fixed-bin histogram per band, which merge exactly, so the mean, percentiles
+and the share of area above each risk threshold are computed after merging.
+"""
+import contextvars
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from shapely.geometry import box, mapping, shape
+
+import ee_cache
+import ee_scheduler
+
+logger = logging.getLogger(__name__)
+
+ZONAL_SCALE = int(os.getenv('ZONAL_SCALE', 30))
+# Pixels reduced per tile; Earth Engine's interactive limits are reached well above this
+MAX_TILE_PIXELS = int(os.getenv('ZONAL_MAX_TILE_PIXELS', 4000000))
+MAX_AREA_KM2 = float(os.getenv('ZONAL_MAX_AREA_KM2', 50000))
+TILE_WORKERS = int(os.getenv('ZONAL_TILE_WORKERS', 8))
+# Tiles that still hit Earth Engine limits are split in four, up to this many times
+MAX_SPLIT_DEPTH = 2
+
+BANDS = ('ndvi', 'ndwi', 'soil_moisture', 'risk')
+PERCENTILES = (10, 25, 50, 75, 90)
+# Histogram bins of width 0.01 over [-1, 1.01); the upper bound is exclusive
+HISTOGRAM_MIN = -1.0
+HISTOGRAM_BIN_WIDTH = 0.01
+HISTOGRAM_BINS = 201
+
+CAPACITY_ERROR_MARKERS = ('memory limit', 'timed out', 'too many pixels', 'maxpixels')
+
+KM_PER_DEGREE_LAT = 110.57
+KM_PER_DEGREE_LNG = 111.32
+
+
+def parse_geometry(geojson):
+    """Shapely polygon from a GeoJSON geometry or Feature; raises ValueError"""
+    if geojson.get('type') == 'Feature':
+        geojson = geojson.get('geometry') or {}
+    if geojson.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError("geometry must be a GeoJSON Polygon or MultiPolygon")
+    geometry = shape(geojson)
+    if not geometry.is_valid:
+        geometry = geometry.buffer(0)
+    if geometry.is_empty:
+        raise ValueError("geometry is empty")
+    return geometry
+
+
+def area_km2(geometry):
+    """Approximate area of a lon/lat geometry"""
+    lat = geometry.centroid.y
+    return geometry.area * KM_PER_DEGREE_LAT * KM_PER_DEGREE_LNG * math.cos(math.radians(lat))
+
+
+def split_tiles(geometry, scale, max_tile_pixels=MAX_TILE_PIXELS):
+    """Parts of geometry on a grid of tiles holding at most max_tile_pixels pixels each"""
+    side_km = math.sqrt(max_tile_pixels) * scale / 1000
+    west, south, east, north = geometry.bounds
+    lat = (south + north) / 2
+    step_lat = side_km / KM_PER_DEGREE_LAT
+    step_lng = side_km / (KM_PER_DEGREE_LNG * max(math.cos(math.radians(lat)), 0.01))
+
+    tiles = []
+    for row in range(max(1, math.ceil((north - south) / step_lat))):
+        for col in range(max(1, math.ceil((east - west) / step_lng))):
+            cell = box(west + col * step_lng, south + row * step_lat,
+                       min(east, west + (col + 1) * step_lng), min(north, south + (row + 1) * step_lat))
+            part = geometry.intersection(cell)
+            if not part.is_empty and part.area > 0:
+                tiles.append(part)
+    return tiles
+
+
+def quarter(geometry):
+    west, south, east, north = geometry.bounds
+    mid_x, mid_y = (west + east) / 2, (south + north) / 2
+    parts = [geometry.intersection(box(*b)) for b in (
+        (west, south, mid_x, mid_y), (mid_x, south, east, mid_y),
+        (west, mid_y, mid_x, north), (mid_x, mid_y, east, north)
+    )]
+    return [p for p in parts if not p.is_empty and p.area > 0]
+
+
+def build_image(region, start_date, end_date, weights, collection='COPERNICUS/S2_SR_HARMONIZED', max_cloud=50):
+    """(image with BANDS, number of Sentinel-2 scenes in the composite)"""
+    import ee
+
+    s2 = ee.ImageCollection(collection) \
+        .filterBounds(region) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud))
+    scenes = ee_scheduler.get_info(s2.size())
+    if scenes == 0:
+        return None, 0
+
+    composite = s2.median()
+    ndvi = composite.normalizedDifference(['B8', 'B4']).rename('ndvi')  # NIR and Red bands
+    ndwi = composite.normalizedDifference(['B3', 'B8']).rename('ndwi')  # Green and NIR bands
+    soil = ee.ImageCollection('ECMWF/ERA5_LAND/HOURLY') \
+        .filterDate(start_date, end_date) \
+        .select('volumetric_soil_water_layer_1') \
+        .mean() \
+        .rename('soil_moisture')
+
+    # Same normalization and weights as calculate_flood_risk (without water level)
+    risk = ee.Image(1).subtract(ndvi.add(1).divide(2)).multiply(weights['ndvi']) \
+        .add(ndwi.add(1).divide(2).multiply(weights['ndwi'])) \
+        .add(soil.min(1).multiply(weights['soil'])) \
+        .rename('risk')
+
+    return ndvi.addBands(ndwi).addBands(soil).addBands(risk).clamp(-1, 1), scenes
+
+
+def reduce_tile(image, tile, scale, depth=0):
+    """{band: (sum, histogram counts)} for one tile"""
+    import ee
+
+    reducer = ee.Reducer.sum().combine(
+        ee.Reducer.fixedHistogram(HISTOGRAM_MIN, HISTOGRAM_MIN + HISTOGRAM_BINS * HISTOGRAM_BIN_WIDTH,
+                                  HISTOGRAM_BINS),
+        sharedInputs=True
+    )
+    try:
+        values = ee_scheduler.get_info(image.reduceRegion(
+            reducer=reducer,
+            geometry=ee.Geometry(mapping(tile)),
+            scale=scale,
+            maxPixels=MAX_TILE_PIXELS * 4,
+            tileScale=2
+        ))
+    except Exception as e:
+        message = str(e).lower()
+        if depth >= MAX_SPLIT_DEPTH or not any(marker in message for marker in CAPACITY_ERROR_MARKERS):
+            raise
+        logger.warning(f"Zonal tile too large, splitting: {str(e)}")
+        return merge([reduce_tile(image, part, scale, depth + 1) for part in quarter(tile)])
+
+    partial = {}
+    for band in BANDS:
+        histogram = values.get(f'{band}_histogram')
+        counts = np.array([count for _, count in histogram], dtype=np.float64) if histogram \
+            else np.zeros(HISTOGRAM_BINS)
+        partial[band] = (values.get(f'{band}_sum') or 0.0, counts)
+    return partial
+
+
+def merge(partials):
+    merged = {band: (0.0, np.zeros(HISTOGRAM_BINS)) for band in BANDS}
+    for partial in partials:
+        for band, (total, counts) in partial.items():
+            merged[band] = (merged[band][0] + total, merged[band][1] + counts)
+    return merged
+
+
+def percentile(counts, q):
+    """Value below which q percent of the histogram weight lies, interpolated within the bin"""
+    cumulative = np.cumsum(counts)
+    target = cumulative[-1] * q / 100
+    index = int(np.searchsorted(cumulative, target))
+    previous = cumulative[index - 1] if index else 0.0
+    fraction = (target - previous) / counts[index] if counts[index] else 0.0
+    return HISTOGRAM_MIN + (index + fraction) * HISTOGRAM_BIN_WIDTH
+
+
+def summarize(total, counts):
+    weight = counts.sum()
+    if weight == 0:
+        return None
+    summary = {'mean': round(float(total / weight), 4)}
+    for q in PERCENTILES:
+        summary[f'p{q}'] = round(float(percentile(counts, q)), 4)
+    return summary
+
+
+def share_above(counts, threshold):
+    """Share of the histogram weight in bins at or above threshold"""
+    lower_edges = HISTOGRAM_MIN + np.arange(HISTOGRAM_BINS) * HISTOGRAM_BIN_WIDTH
+    weight = counts.sum()
+    return float(counts[lower_edges >= threshold - 1e-9].sum() / weight) if weight else 0.0
+
+
+def zonal_statistics(geojson, weights, thresholds, end_date=None, days=30, scale=ZONAL_SCALE):
+    """Zonal statistics and risk shares for a GeoJSON polygon"""
+    import ee
+
+    geometry = parse_geometry(geojson)
+    area = area_km2(geometry)
+    if area > MAX_AREA_KM2:
+        raise ValueError(f"Polygon area {area:.0f} km2 exceeds the {MAX_AREA_KM2:.0f} km2 limit")
+
+    end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else ee_cache.now()
+    start = end - timedelta(days=days)
+    image, scenes = build_image(ee.Geometry(mapping(geometry)), start.strftime('%Y-%m-%d'),
+                                end.strftime('%Y-%m-%d'), weights)
+    if image is None:
+        raise LookupError("No Sentinel-2 imagery for this polygon and date range")
+
+    tiles = split_tiles(geometry, scale)
+    started = datetime.now()
+    with ThreadPoolExecutor(max_workers=min(TILE_WORKERS, len(tiles))) as executor:
+        # Copy the context per tile so the caller's Earth Engine priority applies in the workers
+        futures = [executor.submit(contextvars.copy_context().run, reduce_tile, image, tile, scale)
+                   for tile in tiles]
+        merged = merge(future.result() for future in futures)
+
+    stats = {band: summarize(*merged[band]) for band in BANDS}
+    risk_counts = merged['risk'][1]
+    share_high = share_above(risk_counts, thresholds['HIGH'])
+    share_medium = share_above(risk_counts, thresholds['MEDIUM']) - share_high
+
+    mean_risk = stats['risk']['mean'] if stats['risk'] else None
+    if mean_risk is None:
+        risk_level = 'UNKNOWN'
+    elif mean_risk > thresholds['HIGH']:
+        risk_level = 'HIGH'
+    elif mean_risk > thresholds['MEDIUM']:
+        risk_level = 'MEDIUM'
+    else:
+        risk_level = 'LOW'
+
+    return {
+        'area_km2': round(area, 2),
+        'start_date': start.strftime('%Y-%m-%d'),
+        'end_date': end.strftime('%Y-%m-%d'),
+        'scenes': scenes,
+        'scale': scale,
+        'tiles': len(tiles),
+        'seconds': round((datetime.now() - started).total_seconds(), 2),
+        'stats': stats,
+        'risk': {
+            'risk_level': risk_level,
+            'share_high': round(share_high, 4),
+            'share_medium': round(share_medium, 4),
+            'share_low': round(1 - share_high - share_medium, 4) if risk_counts.sum() else 0.0,
+            'area_high_km2': round(share_high * area, 2),
+            'area_medium_km2': round(share_medium * area, 2)
+        }
+    }
@@ -0,0 +1,160 @@
+"""
+Time the dataset preparation steps on synthetic SEN12-FLOOD trees of several sizes.
+
+For each scale a dataset is generated with pipeline.synthetic_dataset (or --data
+points at an existing one) and every stage is run twice: once for wall time and
+once under tracemalloc for peak Python/NumPy allocation.
+
+Stages:
+    scan          pipeline.dataset.list_samples for S1 and S2
+    scan (legacy) analyze_and_organize_dataset with num_samples=0 (label scan + glob only)
+    organize      analyze_and_organize_dataset copying a balanced training subset
+    split+copy    divide_train_validation_dataset copying every matched scene
+    split         pipeline.dataset.split_samples
+    features      pipeline.features.extract_features for every sample
+
+Usage:
+    python -m benchmarks.bench_data_pipeline --scales 50 200 800 --size 256
+    python -m benchmarks.bench_data_pipeline --data /data/sen12flood --json results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pipeline.dataset import list_samples, split_samples
+from pipeline.features import extract_features
+from pipeline.synthetic_dataset import generate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'normalization_creation'))
+
+from TrainFolderCreate import analyze_and_organize_dataset  # noqa: E402
+from ValidateSetCreate import divide_train_validation_dataset  # noqa: E402
+
+
+def count_files(directory):
+    return sum(len(files) for _, _, files in os.walk(directory))
+
+
+def stages(data_dir, work_dir, target_shape):
+    """{name: fn() -> number of files handled}; fns clean up their own output"""
+    images = os.path.join(data_dir, 'images')
+    labels = os.path.join(data_dir, 'labels')
+    samples = list_samples(images, labels, 's1') + list_samples(images, labels, 's2')
+    num_labels = len(os.listdir(labels))
+
+    def fresh(name):
+        path = os.path.join(work_dir, name)
+        shutil.rmtree(path, ignore_errors=True)
+        return path
+
+    def scan():
+        found = list_samples(images, labels, 's1') + list_samples(images, labels, 's2')
+        return num_labels if found is not None else 0
+
+    def scan_legacy():
+        analyze_and_organize_dataset(images, labels, fresh('scan'), num_samples=0)
+        return num_labels
+
+    def organize():
+        target = fresh('train')
+        analyze_and_organize_dataset(images, labels, target, num_samples=len(samples))
+        return count_files(target)
+
+    def split_copy():
+        random.seed(0)
+        train, validation = fresh('train2'), fresh('validation')
+        divide_train_validation_dataset(images, labels, train, validation,
+                                        num_validation_samples=max(2, len(samples) // 5))
+        return count_files(train) + count_files(validation)
+
+    def split():
+        split_samples(samples, test_size=0.2, seed=42)
+        return len(samples)
+
+    def features():
+        files = 0
+        for sample in samples:
+            if extract_features(sample['image_dir'], sample['base_filename'], sample['sensor'],
+                                target_shape) is not None:
+                files += 4 if sample['sensor'] == 's2' else 2
+        return files
+
+    return {
+        'scan': scan,
+        'scan (legacy)': scan_legacy,
+        'organize': organize,
+        'split+copy': split_copy,
+        'split': split,
+        'features': features
+    }
+
+
+def measure(fn):
+    """(seconds, files, peak bytes); the scripts' progress output is discarded"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        files = fn()
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return seconds, files, peak
+
+
+def run_scale(data_dir, work_dir, target_shape, label):
+    print(f"\n{label}")
+    print(f"{'stage':14s} {'seconds':>9s} {'files':>8s} {'files/s':>10s} {'peak alloc':>12s}")
+    results = []
+    for name, fn in stages(data_dir, work_dir, target_shape).items():
+        seconds, files, peak = measure(fn)
+        rate = files / seconds if seconds else 0
+        print(f"{name:14s} {seconds:9.3f} {files:8d} {rate:10.0f} {peak / 1e6:9.1f} MB")
+        results.append({'stage': name, 'seconds': seconds, 'files': files, 'files_per_second': rate,
+                        'peak_bytes': peak})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dataset preparation pipeline")
+    parser.add_argument('--scales', type=int, nargs='+', default=[50, 200, 800], help="Scene counts")
+    parser.add_argument('--size', type=int, default=256, help="Synthetic raster size in pixels")
+    parser.add_argument('--target-size', type=int, default=128, help="Feature size (as in training)")
+    parser.add_argument('--data', help="Benchmark an existing dataset instead of synthetic ones")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    target_shape = (args.target_size, args.target_size)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = os.path.join(tmp, 'work')
+        if args.data:
+            results.append({'data': args.data,
+                            'stages': run_scale(args.data, work_dir, target_shape, args.data)})
+        else:
+            for scenes in args.scales:
+                data_dir = os.path.join(tmp, f'sen12flood_{scenes}')
+                start = time.perf_counter()
+                summary = generate(data_dir, scenes=scenes, size=args.size)
+                label = (f"{scenes} scenes, {args.size}x{args.size} px, {summary['files']} files "
+                         f"(generated in {time.perf_counter() - start:.1f}s)")
+                results.append(dict(summary, stages=run_scale(data_dir, work_dir, target_shape, label)))
+                shutil.rmtree(data_dir)
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
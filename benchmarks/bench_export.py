@@ -0,0 +1,127 @@
+"""
+Compare the Keras model with its TFLite exports: load time, batch latency, RSS and accuracy drift.
+
+Each model is measured in a fresh subprocess so load time and RSS include the
+runtime's own imports (TensorFlow for Keras, only the TFLite interpreter otherwise).
+
+Usage:
+    python -m benchmarks.bench_export --models my_model.keras my_model.tflite my_model.int8.tflite \
+        --images validation/images --labels validation/labels
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def measure_model(model_path, data_path, batch_size, repeat):
+    """Runs inside the subprocess: load the model and time predictions on the saved batch"""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    from pipeline.model import load_model
+    model, _ = load_model(model_path)
+    load_seconds = time.perf_counter() - start
+
+    X = np.load(data_path)
+    batch = X[:batch_size]
+    model.predict_on_batch(batch)  # warm-up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict_on_batch(batch)
+        latencies.append(time.perf_counter() - start)
+
+    probabilities = np.concatenate([
+        np.asarray(model.predict_on_batch(X[i:i + batch_size]))[:, 1]
+        for i in range(0, len(X), batch_size)
+    ])
+    return {
+        'load_seconds': load_seconds,
+        'batch_ms_median': float(np.median(latencies) * 1000),
+        'batch_ms_p95': float(np.percentile(latencies, 95) * 1000),
+        'rss_mb': rss_mb(),
+        'rss_model_mb': rss_mb() - rss_before,
+        'probabilities': probabilities.tolist()
+    }
+
+
+def load_validation(model_path, image_folder, label_folder, max_samples):
+    """Normalized validation patches and labels, read with the streaming pipeline"""
+    from pipeline.dataset import batch_generator, list_samples, load_stats
+    from pipeline.model import stats_path_for
+
+    stats = load_stats(stats_path_for(model_path))
+    samples = list_samples(image_folder, label_folder, stats['sensor'])[:max_samples]
+    batches = list(batch_generator(samples, stats, 64, tuple(stats['target_shape']), shuffle=False))
+    if not batches:
+        raise ValueError("No validation samples found")
+    X = np.concatenate([b[0] for b in batches])
+    y = np.concatenate([b[1] for b in batches]).argmax(axis=1)
+    return X, y
+
+
+def run(models, image_folder, label_folder, batch_size, repeat, max_samples):
+    X, y = load_validation(models[0], image_folder, label_folder, max_samples)
+    print(f"{len(X)} validation samples, batch size {batch_size}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'validation.npy')
+        np.save(data_path, X)
+        for model_path in models:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_export', '--worker', model_path,
+                 '--data', data_path, '--batch-size', str(batch_size), '--repeat', str(repeat)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[model_path] = json.loads(output.strip().splitlines()[-1])
+
+    reference = np.asarray(results[models[0]]['probabilities'])
+    print(f"{'model':32s} {'size KiB':>9s} {'load s':>7s} {'batch ms':>9s} {'p95 ms':>8s} "
+          f"{'RSS MB':>7s} {'accuracy':>9s} {'max |dp|':>9s} {'agree':>6s}")
+    for model_path, r in results.items():
+        p = np.asarray(r['probabilities'])
+        accuracy = float(((p >= 0.5) == y).mean())
+        drift = float(np.abs(p - reference).max())
+        agreement = float(((p >= 0.5) == (reference >= 0.5)).mean())
+        print(f"{os.path.basename(model_path):32s} {os.path.getsize(model_path) / 1024:9.1f} "
+              f"{r['load_seconds']:7.2f} {r['batch_ms_median']:9.2f} {r['batch_ms_p95']:8.2f} "
+              f"{r['rss_mb']:7.0f} {accuracy:9.3f} {drift:9.4f} {agreement:6.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exported models against Keras")
+    parser.add_argument('--models', nargs='+', help="Reference Keras model first, then exports")
+    parser.add_argument('--images', help="Validation images folder")
+    parser.add_argument('--labels', help="Validation labels folder")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-samples', type=int, default=500)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--data', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure_model(args.worker, args.data, args.batch_size, args.repeat)))
+        return
+    if not (args.models and args.images and args.labels):
+        parser.error("--models, --images and --labels are required")
+    run(args.models, args.images, args.labels, args.batch_size, args.repeat, args.max_samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Throughput and peak memory of the /api/export encoders against loading everything at once.
+
+Without --db the rows are synthetic (same columns as analysis_results), which
+measures the encoders alone; with --db they come from the configured Postgres
+database (see api/db.py) through the same named-cursor path as the endpoint.
+
+Usage:
+    python -m benchmarks.bench_results_export --rows 500000
+    python -m benchmarks.bench_results_export --db --table historical_data
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import export  # noqa: E402
+
+
+def synthetic_chunks(rows, chunk_rows):
+    """analysis_results-shaped rows, generated one chunk at a time"""
+    start = datetime(2024, 1, 1)
+    levels = ('LOW', 'MEDIUM', 'HIGH')
+    for offset in range(0, rows, chunk_rows):
+        yield [
+            (i, -1.0 + (i % 1000) * 0.001, 36.0 + (i % 777) * 0.001, f"Location {i % 5000}",
+             levels[i % 3], 0.35, 0.12, 0.28, 1.5, 55.0, start + timedelta(minutes=i))
+            for i in range(offset, min(rows, offset + chunk_rows))
+        ]
+
+
+def naive(chunks, columns):
+    """What a fetchall + json.dumps endpoint would hold in memory"""
+    rows = [row for chunk in chunks for row in chunk]
+    return json.dumps([dict(zip(columns, row)) for row in rows], default=str).encode()
+
+
+def consume(make_output):
+    output = make_output()
+    return len(output) if isinstance(output, bytes) else sum(len(part) for part in output)
+
+
+def measure(make_output):
+    """(seconds, bytes produced, peak bytes allocated); timed and traced in separate runs"""
+    start = time.perf_counter()
+    size = consume(make_output)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    consume(make_output)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, size, peak
+
+
+def run(rows, chunk_rows, table, use_db, formats):
+    if use_db:
+        from db import get_db_connection
+        sql, params, columns = export.build_query(table, {})
+
+        def chunks():
+            conn = get_db_connection()
+            try:
+                yield from export.iter_chunks(conn, sql, params, chunk_rows)
+            finally:
+                conn.close()
+    else:
+        table = 'analysis_results'
+        columns = [name for _, name, _ in export.TABLES[table]['columns']]
+
+        def chunks():
+            return synthetic_chunks(rows, chunk_rows)
+
+    cases = {'naive fetchall + json': lambda: naive(chunks(), columns)}
+    for fmt in formats:
+        if fmt == 'parquet' and export.pa is None:
+            print("pyarrow not installed, skipping parquet")
+            continue
+        cases[f'stream {fmt}'] = lambda fmt=fmt: export.encode(fmt, chunks(), columns, table)
+
+    source = f"table {table}" if use_db else f"{rows} synthetic rows"
+    print(f"{source}, chunk={chunk_rows}")
+    print(f"{'case':26s} {'seconds':>8s} {'rows/s':>10s} {'MB/s':>8s} {'output MB':>10s} {'peak alloc':>12s}")
+    for name, fn in cases.items():
+        seconds, size, peak = measure(fn)
+        count = rows if not use_db else None
+        rate = f"{count / seconds:10.0f}" if count else f"{'-':>10s}"
+        print(f"{name:26s} {seconds:8.2f} {rate} {size / seconds / 1e6:8.1f} {size / 1e6:10.1f} "
+              f"{peak / 1e6:10.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming result export")
+    parser.add_argument('--rows', type=int, default=200000, help="Synthetic rows")
+    parser.add_argument('--chunk', type=int, default=export.EXPORT_CHUNK_ROWS)
+    parser.add_argument('--db', action='store_true', help="Read from the configured database")
+    parser.add_argument('--table', default='analysis_results', choices=sorted(export.TABLES))
+    parser.add_argument('--formats', nargs='+', default=list(export.FORMATS), choices=list(export.FORMATS))
+    args = parser.parse_args()
+    run(args.rows, args.chunk, args.table, args.db, args.formats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Compare the Flask development server with the pre-forked gunicorn server:
+throughput, latency and memory per process.
+
+Each server is started from api/ in a subprocess and loaded by client threads
+over keep-alive connections. Memory is read from /proc (Linux): RSS counts
+pages shared copy-on-write with the master in every worker, PSS divides them
+among the processes sharing them, and USS is what each process holds alone.
+
+Run offline against recorded Earth Engine results with EE_CACHE_MODE=replay
+(see api/ee_cache.py), e.g. for /api/analyze.
+
+Usage:
+    python -m benchmarks.bench_server --workers 4 --threads 8 --clients 32 --seconds 20
+    EE_CACHE_MODE=replay python -m benchmarks.bench_server --path "/api/analyze?lat=-1.29&lng=36.82"
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api')
+
+
+def wait_for_port(port, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not listen on port {port} within {timeout}s")
+
+
+def process_tree(pid):
+    """pid and all of its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    return pids
+
+
+def memory_mb(pid):
+    """{'rss', 'pss', 'uss'} of a process in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        'rss': round(values.get('Rss', 0), 1),
+        'pss': round(values.get('Pss', 0), 1),
+        'uss': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1)
+    }
+
+
+def load(port, path, clients, seconds):
+    """Requests/s, latency percentiles and errors from `clients` keep-alive connections"""
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    stop_at = time.perf_counter() + seconds
+
+    def client(i):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[i] += 1
+                latencies[i].append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                errors[i] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.array([value for values in latencies for value in values]) * 1000
+    return {
+        'requests': len(all_latencies),
+        'requests_per_second': round(len(all_latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(all_latencies, 50)), 2) if len(all_latencies) else None,
+        'p95_ms': round(float(np.percentile(all_latencies, 95)), 2) if len(all_latencies) else None,
+        'errors': sum(errors)
+    }
+
+
+def run_server(name, command, env, port, args):
+    process = subprocess.Popen(command, cwd=API_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        # Let workers finish booting before measuring
+        time.sleep(args.warmup)
+        load(port, args.path, args.clients, min(2, args.seconds))
+        result = load(port, args.path, args.clients, args.seconds)
+        processes = {pid: memory_mb(pid) for pid in process_tree(process.pid)}
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+    result['processes'] = processes
+    result['total_pss_mb'] = round(sum(p['pss'] for p in processes.values()), 1)
+    result['total_rss_mb'] = round(sum(p['rss'] for p in processes.values()), 1)
+
+    print(f"\n{name}: {result['requests_per_second']} req/s, p50 {result['p50_ms']} ms, "
+          f"p95 {result['p95_ms']} ms, {result['errors']} errors")
+    print(f"{'pid':>8s} {'RSS MB':>8s} {'PSS MB':>8s} {'USS MB':>8s}")
+    for pid, memory in processes.items():
+        print(f"{pid:8d} {memory['rss']:8.1f} {memory['pss']:8.1f} {memory['uss']:8.1f}")
+    print(f"{'total':>8s} {result['total_rss_mb']:8.1f} {result['total_pss_mb']:8.1f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dev server against gunicorn")
+    parser.add_argument('--path', default='/api/metrics', help="Request path to load")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds to wait after the port opens")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--servers', nargs='+', choices=['dev', 'gunicorn'], default=['dev', 'gunicorn'])
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+
+    # No background workers: only request handling is measured
+    env = dict(os.environ, PORT=str(args.port), HOST='127.0.0.1', FLASK_DEBUG='0', JOB_WORKERS='0',
+               WATCHLIST_SCHEDULER='0', PARTITION_MAINTENANCE='0', LOCAL_RASTER_REFRESH_HOURS='0',
+               GUNICORN_WORKERS=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    commands = {
+        'dev': [sys.executable, 'app.py'],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+    }
+
+    results = {}
+    for name in args.servers:
+        label = f"gunicorn ({args.workers} workers x {args.threads} threads)" if name == 'gunicorn' else 'dev server'
+        results[name] = run_server(label, commands[name], env, args.port, args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Data loading, feature extraction and model code for the flood prediction CNN."""
@@ -0,0 +1,84 @@
+"""
+Spectral index kernels shared by the training pipeline and the API.
+
+All functions work on single images (H, W) or stacked batches (N, H, W), compute
+in float32 and accept preallocated out= / scratch= buffers so repeated calls do
+not allocate.
+"""
+import numpy as np
+
+EPSILON = np.float32(1e-10)
+
+
+def _buffer(buf, shape):
+    """Return buf if given, otherwise a new float32 array of the given shape"""
+    return np.empty(shape, dtype=np.float32) if buf is None else buf
+
+
+def normalized_difference(a, b, out=None, scratch=None):
+    """(a - b) / (a + b), clipped to [-1, 1]"""
+    shape = np.broadcast_shapes(np.shape(a), np.shape(b))
+    out = _buffer(out, shape)
+    scratch = _buffer(scratch, shape)
+
+    np.add(a, b, out=scratch, dtype=np.float32)
+    scratch += EPSILON
+    np.subtract(a, b, out=out, dtype=np.float32)
+    np.divide(out, scratch, out=out)
+    return np.clip(out, -1, 1, out=out)
+
+
+def ndvi(nir, red, out=None, scratch=None):
+    """Calculate NDVI from NIR and RED bands"""
+    return normalized_difference(nir, red, out=out, scratch=scratch)
+
+
+def ndwi(green, nir, out=None, scratch=None):
+    """Calculate NDWI from GREEN and NIR bands"""
+    return normalized_difference(green, nir, out=out, scratch=scratch)
+
+
+def ndvi_ndwi(green, red, nir, out=None, scratch=None):
+    """
+    NDVI and NDWI in one call, written channels-last into out (..., 2).
+
+    scratch must hold two arrays of the band shape, e.g. np.empty((2,) + shape, np.float32).
+    The NIR band is shared by both indices, so it is only converted once.
+    """
+    shape = np.shape(nir)
+    out = _buffer(out, shape + (2,))
+    scratch = _buffer(scratch, (2,) + shape)
+    numerator, denominator = scratch[0], scratch[1]
+
+    # NDVI = (nir - red) / (nir + red)
+    np.add(nir, red, out=denominator, dtype=np.float32)
+    denominator += EPSILON
+    np.subtract(nir, red, out=numerator, dtype=np.float32)
+    np.divide(numerator, denominator, out=out[..., 0])
+
+    # NDWI = (green - nir) / (green + nir)
+    np.add(green, nir, out=denominator, dtype=np.float32)
+    denominator += EPSILON
+    np.subtract(green, nir, out=numerator, dtype=np.float32)
+    np.divide(numerator, denominator, out=out[..., 1])
+
+    return np.clip(out, -1, 1, out=out)
+
+
+def soil_moisture_proxy(vv, vh, out=None):
+    """
+    VH/VV backscatter ratio scaled to [0, 1] per image (over the last two axes)
+    """
+    out = _buffer(out, np.broadcast_shapes(np.shape(vv), np.shape(vh)))
+
+    np.add(vv, EPSILON, out=out, dtype=np.float32)
+    np.divide(vh, out, out=out, dtype=np.float32)
+
+    axes = (-2, -1) if out.ndim >= 2 else None
+    lo = out.min(axis=axes, keepdims=True)
+    span = out.max(axis=axes, keepdims=True)
+    span -= lo
+    span += EPSILON
+    out -= lo
+    out /= span
+    return out
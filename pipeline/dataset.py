@@ -0,0 +1,211 @@
+"""Streaming training input pipeline with per-channel normalization statistics."""
+import json
+import os
+
+import numpy as np
+
+from pipeline.features import SENSOR_CHANNELS, extract_features, parse_label_filename, read_flooding_label
+
+
+def list_samples(image_folder, label_folder, sensor=None):
+    """
+    List labelled scenes without loading any imagery.
+
+    Only one sensor can be used per model since S1 and S2 give a different number
+    of channels. When sensor is None the first sensor found (in sorted label order)
+    is used, which is what the notebook's process_data ended up training on.
+    """
+    samples = []
+    for label_file in sorted(os.listdir(label_folder)):
+        if not label_file.endswith('.geojson'):
+            continue
+
+        parsed = parse_label_filename(label_file)
+        if parsed is None:
+            continue
+        sensor_type, digit, base_filename = parsed
+        if sensor_type not in SENSOR_CHANNELS:
+            continue
+        if sensor is None:
+            sensor = sensor_type
+        if sensor_type != sensor:
+            continue
+
+        image_dir = os.path.join(image_folder, digit)
+        if not os.path.exists(image_dir):
+            continue
+
+        try:
+            flooding = read_flooding_label(os.path.join(label_folder, label_file))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading {label_file}: {str(e)}")
+            continue
+        if flooding is None:
+            continue
+
+        samples.append({
+            'label_file': label_file,
+            'sensor': sensor_type,
+            'image_dir': image_dir,
+            'base_filename': base_filename,
+            'label': 1 if flooding else 0
+        })
+
+    return samples
+
+
+def split_samples(samples, test_size=0.2, seed=42):
+    """Shuffle and split samples into (train, test) lists"""
+    order = np.random.default_rng(seed).permutation(len(samples))
+    n_test = int(round(len(samples) * test_size))
+    test = [samples[i] for i in order[:n_test]]
+    train = [samples[i] for i in order[n_test:]]
+    return train, test
+
+
+class ChannelStats:
+    """Per-channel count/min/max/mean/variance accumulated one batch at a time"""
+
+    def __init__(self, num_channels):
+        self.count = 0
+        self.min = np.full(num_channels, np.inf)
+        self.max = np.full(num_channels, -np.inf)
+        self.mean = np.zeros(num_channels)
+        self.m2 = np.zeros(num_channels)
+
+    def update(self, batch):
+        """Add a (..., C) array to the statistics"""
+        values = batch.reshape(-1, batch.shape[-1])
+        n = values.shape[0]
+        if n == 0:
+            return
+
+        batch_mean = values.mean(axis=0, dtype=np.float64)
+        batch_m2 = values.var(axis=0, dtype=np.float64) * n
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        np.maximum(self.max, values.max(axis=0), out=self.max)
+
+        # Chan et al. parallel update of mean and sum of squared deviations
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+    def to_dict(self):
+        return {
+            'count': int(self.count),
+            'min': self.min.tolist(),
+            'max': self.max.tolist(),
+            'mean': self.mean.tolist(),
+            'std': self.std.tolist()
+        }
+
+
+def compute_channel_stats(samples, target_shape=(128, 128)):
+    """
+    One streaming pass over the samples. Returns (stats dict, samples that could be read).
+    """
+    stats = None
+    valid_samples = []
+    for sample in samples:
+        features = extract_features(sample['image_dir'], sample['base_filename'],
+                                    sample['sensor'], target_shape)
+        if features is None:
+            continue
+        if stats is None:
+            stats = ChannelStats(features.shape[-1])
+        stats.update(features)
+        valid_samples.append(sample)
+
+    if stats is None:
+        raise ValueError("No valid data was processed")
+
+    result = stats.to_dict()
+    result['sensor'] = valid_samples[0]['sensor']
+    result['channels'] = SENSOR_CHANNELS[result['sensor']]
+    result['target_shape'] = list(target_shape)
+    return result, valid_samples
+
+
+def save_stats(stats, path):
+    """Write normalization statistics as JSON"""
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+
+
+def load_stats(path):
+    """Read normalization statistics written by save_stats"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def normalize(features, stats, out=None):
+    """Per-channel min-max scaling of a (..., C) float32 array using saved statistics"""
+    lo = np.asarray(stats['min'], dtype=np.float32)
+    scale = np.float32(1) / (np.asarray(stats['max'], dtype=np.float32) - lo + np.float32(1e-10))
+    out = np.subtract(features, lo, out=out)
+    np.multiply(out, scale, out=out)
+    return out
+
+
+def batch_generator(samples, stats, batch_size=32, target_shape=(128, 128), shuffle=True, seed=None):
+    """
+    Yield (X, y) batches for one pass over samples, reading scenes from disk as needed.
+    X is (N, H, W, C) normalized float32 and y is one-hot (N, 2).
+    """
+    order = np.arange(len(samples))
+    if shuffle:
+        np.random.default_rng(seed).shuffle(order)
+
+    num_channels = len(stats['channels'])
+    width, height = target_shape
+    X = np.empty((batch_size, height, width, num_channels), dtype=np.float32)
+    y = np.zeros((batch_size, 2), dtype=np.float32)
+    n = 0
+    for i in order:
+        sample = samples[i]
+        features = extract_features(sample['image_dir'], sample['base_filename'],
+                                    sample['sensor'], target_shape)
+        if features is None:
+            continue
+
+        normalize(features, stats, out=X[n])
+        y[n] = 0
+        y[n, sample['label']] = 1
+        n += 1
+        if n == batch_size:
+            yield X.copy(), y.copy()
+            n = 0
+
+    if n:
+        yield X[:n].copy(), y[:n].copy()
+
+
+def make_tf_dataset(samples, stats, batch_size=32, target_shape=(128, 128), shuffle=True, seed=42):
+    """
+    Wrap batch_generator in a tf.data.Dataset, reshuffled every epoch and prefetched
+    """
+    import tensorflow as tf
+
+    num_channels = len(stats['channels'])
+    width, height = target_shape
+    epoch = {'n': 0}
+
+    def generator():
+        epoch_seed = None if seed is None else seed + epoch['n']
+        epoch['n'] += 1
+        yield from batch_generator(samples, stats, batch_size, target_shape, shuffle, epoch_seed)
+
+    dataset = tf.data.Dataset.from_generator(
+        generator,
+        output_signature=(
+            tf.TensorSpec(shape=(None, height, width, num_channels), dtype=tf.float32),
+            tf.TensorSpec(shape=(None, 2), dtype=tf.float32)
+        )
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,77 @@
+"""
+Export a trained Keras model to TFLite for CPU serving, optionally int8-quantized.
+
+Usage:
+    python -m pipeline.export_model --model my_model.keras --output my_model.tflite
+    python -m pipeline.export_model --model my_model.keras --output my_model.int8.tflite \
+        --quantize --images validation/images --labels validation/labels
+
+Int8 post-training quantization is calibrated on the validation set, normalized with
+the statistics saved next to the Keras model. The statistics are copied next to the
+exported model so pipeline.model.load_model can use it directly.
+"""
+import argparse
+import shutil
+
+from pipeline.dataset import batch_generator, list_samples, load_stats
+from pipeline.model import stats_path_for
+
+
+def representative_dataset(image_folder, label_folder, stats, num_samples=200):
+    """Calibration generator yielding single normalized validation patches"""
+    samples = list_samples(image_folder, label_folder, stats['sensor'])[:num_samples]
+    if not samples:
+        raise ValueError("No validation samples found for calibration")
+
+    def generator():
+        for X, _ in batch_generator(samples, stats, batch_size=1, target_shape=tuple(stats['target_shape']),
+                                    shuffle=False):
+            yield [X]
+
+    return generator
+
+
+def export_tflite(model_path, output_path, quantize=False, image_folder=None, label_folder=None,
+                  num_calibration=200):
+    """Convert model_path to a .tflite file and return its size in bytes"""
+    import tensorflow as tf
+
+    stats = load_stats(stats_path_for(model_path))
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantize:
+        if image_folder is None or label_folder is None:
+            raise ValueError("Int8 quantization needs validation images and labels for calibration")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(
+            image_folder, label_folder, stats, num_calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float32 input/output so callers do not need to know about quantization
+        converter.inference_input_type = tf.float32
+        converter.inference_output_type = tf.float32
+
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    shutil.copyfile(stats_path_for(model_path), stats_path_for(output_path))
+    return len(tflite_model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the flood CNN to TFLite")
+    parser.add_argument('--model', default='my_model.keras')
+    parser.add_argument('--output', default='my_model.tflite')
+    parser.add_argument('--quantize', action='store_true', help="Int8 post-training quantization")
+    parser.add_argument('--images', help="Validation images folder (for --quantize)")
+    parser.add_argument('--labels', help="Validation labels folder (for --quantize)")
+    parser.add_argument('--num-calibration', type=int, default=200)
+    args = parser.parse_args()
+
+    size = export_tflite(args.model, args.output, args.quantize, args.images, args.labels,
+                         args.num_calibration)
+    print(f"Exported {args.output} ({size / 1024:.1f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Per-sample feature extraction for SEN12-FLOOD scenes (same features as the notebook's process_data)."""
+import json
+import os
+
+import numpy as np
+
+from pipeline.band_math import ndvi_ndwi, soil_moisture_proxy
+from pipeline.raster_io import load_and_resize_band
+
+# Feature channels produced for each sensor
+SENSOR_CHANNELS = {
+    's1': ['soil_moisture'],
+    's2': ['ndvi', 'ndwi']
+}
+
+
+def load_sentinel2_bands(image_dir, base_filename, target_shape):
+    """
+    Load and resize required Sentinel-2 bands
+    """
+    bands = {}
+    required_bands = {
+        'B02': 'blue',   # Blue
+        'B03': 'green',  # Green
+        'B04': 'red',    # Red
+        'B08': 'nir'     # NIR
+    }
+
+    for band_code, band_name in required_bands.items():
+        # Find the file containing the band
+        band_files = [f for f in os.listdir(image_dir)
+                      if f.startswith(base_filename) and f'_{band_code}_' in f]
+
+        if band_files:
+            band_path = os.path.join(image_dir, band_files[0])
+            resized_band = load_and_resize_band(band_path, target_shape)
+            if resized_band is not None:
+                bands[band_name] = resized_band
+
+    return bands if len(bands) == len(required_bands) else None
+
+
+def load_sentinel1_bands(image_dir, base_filename, target_shape):
+    """
+    Load and resize Sentinel-1 VV and VH bands
+    """
+    bands = {}
+    required_polarizations = ['VV', 'VH']
+
+    for pol in required_polarizations:
+        pol_files = [f for f in os.listdir(image_dir)
+                     if f.startswith(base_filename) and f'_{pol}.' in f]
+
+        if pol_files:
+            band_path = os.path.join(image_dir, pol_files[0])
+            resized_band = load_and_resize_band(band_path, target_shape)
+            if resized_band is not None:
+                bands[pol.lower()] = resized_band
+
+    return bands if len(bands) == len(required_polarizations) else None
+
+
+def read_flooding_label(label_path):
+    """Read the FLOODING property of a label file as a bool, or None if missing"""
+    with open(label_path, 'r') as f:
+        geojson_data = json.load(f)
+
+    properties = geojson_data.get('properties')
+    if properties is None and geojson_data.get('features'):
+        properties = geojson_data['features'][0].get('properties')
+    flooding = (properties or {}).get('FLOODING')
+
+    # Normalize flooding property to a boolean
+    if isinstance(flooding, str):
+        flooding = flooding.lower() == 'true'
+    elif isinstance(flooding, int):
+        flooding = bool(flooding)
+    return flooding
+
+
+def parse_label_filename(label_file):
+    """Split a label file name into (sensor, digit, base image filename), or None"""
+    parts = label_file.split('_')
+    if len(parts) < 6:
+        return None
+
+    sensor_type = parts[0]  # s1 or s2
+    digit = parts[2]
+    date = "_".join(parts[3:6])
+    return sensor_type, digit, f"{sensor_type}_source_{digit}_{date}"
+
+
+def extract_features(image_dir, base_filename, sensor_type, target_shape=(128, 128)):
+    """
+    Compute the feature stack (H, W, C) float32 for one scene, or None if bands are missing
+    """
+    if sensor_type == 's2':
+        bands = load_sentinel2_bands(image_dir, base_filename, target_shape)
+        if bands is None:
+            return None
+        # Written straight into the (H, W, 2) feature stack
+        return ndvi_ndwi(bands['green'], bands['red'], bands['nir'])
+
+    if sensor_type == 's1':
+        bands = load_sentinel1_bands(image_dir, base_filename, target_shape)
+        if bands is None:
+            return None
+        soil_moisture = soil_moisture_proxy(bands['vv'], bands['vh'])
+        return soil_moisture[..., np.newaxis]
+
+    return None
@@ -0,0 +1,50 @@
+"""TFLite model runner that does not import TensorFlow."""
+import threading
+
+import numpy as np
+
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    from tflite_runtime.interpreter import Interpreter
+
+
+class LiteModel:
+    """Runs an exported .tflite model with the same predict_on_batch interface as Keras"""
+
+    def __init__(self, model_path=None, num_threads=None, model_content=None):
+        # model_content (the file's bytes) lets forked workers share one read-only copy
+        if model_content is not None:
+            self.interpreter = Interpreter(model_content=model_content, num_threads=num_threads)
+        else:
+            self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        # The interpreter is not thread-safe
+        self.lock = threading.Lock()
+
+    def _quantize(self, x):
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] == np.float32 or not scale:
+            return x.astype(self.input['dtype'], copy=False)
+        info = np.iinfo(self.input['dtype'])
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self.input['dtype'])
+
+    def _dequantize(self, y):
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] == np.float32 or not scale:
+            return y.astype(np.float32, copy=False)
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict_on_batch(self, x):
+        """Class probabilities (N, 2) for a normalized (N, H, W, C) batch"""
+        with self.lock:
+            if x.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input['index'], list(x.shape))
+                self.interpreter.allocate_tensors()
+                self.batch_size = x.shape[0]
+            self.interpreter.set_tensor(self.input['index'], self._quantize(x))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self.output['index']))
@@ -0,0 +1,47 @@
+"""CNN definition and model/normalization file helpers."""
+import os
+
+# TensorFlow is only imported where it is needed, so .tflite models can be
+# served without it
+
+
+# Define the CNN model with multiple input channels
+def create_model(input_shape):
+    from tensorflow.keras.layers import Conv2D, Dense, Dropout, Flatten, MaxPooling2D
+    from tensorflow.keras.models import Sequential
+
+    model = Sequential([
+        Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        MaxPooling2D((2, 2)),
+        Conv2D(64, (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        Conv2D(128, (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        Flatten(),
+        Dense(128, activation='relu'),
+        Dropout(0.5),
+        Dense(2, activation='softmax')
+    ])
+    return model
+
+
+def stats_path_for(model_path):
+    """Path of the normalization statistics saved next to a model, e.g. my_model.norm.json"""
+    return os.path.splitext(model_path)[0] + '.norm.json'
+
+
+def load_model(model_path, model_content=None):
+    """
+    Load a saved model and the normalization statistics saved with it.
+    .tflite models are loaded with the TFLite interpreter only (no TensorFlow import),
+    from model_content instead of the file when given.
+    """
+    from pipeline.dataset import load_stats
+
+    stats = load_stats(stats_path_for(model_path))
+    if model_path.endswith('.tflite'):
+        from pipeline.lite_model import LiteModel
+        return LiteModel(model_path, model_content=model_content), stats
+
+    from tensorflow.keras.models import load_model as keras_load_model
+    return keras_load_model(model_path), stats
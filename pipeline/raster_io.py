@@ -0,0 +1,100 @@
+"""Raster reading helpers for Sentinel-1/Sentinel-2 band files."""
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import transform as warp_transform, transform_bounds
+from rasterio.windows import Window, from_bounds
+
+
+def get_resampling(method):
+    """Return a rasterio Resampling value from a name such as 'bilinear'"""
+    if isinstance(method, Resampling):
+        return method
+    try:
+        return Resampling[method]
+    except KeyError:
+        raise ValueError(f"Unknown resampling method: {method}")
+
+
+def point_window(src, lng, lat, size):
+    """
+    Window of size x size pixels centred on a WGS84 point, clipped to the raster.
+    Returns None if the point falls outside the raster.
+    """
+    xs, ys = warp_transform('EPSG:4326', src.crs, [lng], [lat])
+    row, col = src.index(xs[0], ys[0])
+    if not (0 <= row < src.height and 0 <= col < src.width):
+        return None
+
+    half = size // 2
+    row_off = min(max(row - half, 0), max(src.height - size, 0))
+    col_off = min(max(col - half, 0), max(src.width - size, 0))
+    return Window(col_off, row_off, min(size, src.width), min(size, src.height))
+
+
+def bbox_window(src, bbox):
+    """
+    Window covering a WGS84 bbox (min_lng, min_lat, max_lng, max_lat), clipped to the raster.
+    Returns None if the bbox does not overlap the raster.
+    """
+    bounds = transform_bounds('EPSG:4326', src.crs, *bbox)
+    window = from_bounds(*bounds, transform=src.transform)
+    window = window.round_offsets().round_lengths()
+    try:
+        return window.intersection(Window(0, 0, src.width, src.height))
+    except Exception:
+        return None
+
+
+def read_band(file_path, out_shape=None, window=None, resampling='bilinear', band=1):
+    """
+    Read one band as float32, optionally decimated to out_shape (rows, cols).
+
+    The decimation is done by GDAL while reading (using overviews when the file
+    has them), so the full-resolution array is never held in memory.
+    """
+    with rasterio.open(file_path) as src:
+        return read_band_from(src, out_shape=out_shape, window=window,
+                              resampling=resampling, band=band)
+
+
+def read_band_from(src, out_shape=None, window=None, resampling='bilinear', band=1):
+    """Same as read_band, for an already opened dataset"""
+    return src.read(
+        band,
+        window=window,
+        out_shape=out_shape,
+        resampling=get_resampling(resampling),
+        out_dtype='float32'
+    )
+
+
+def read_band_at_point(file_path, lng, lat, size, out_shape=None, resampling='bilinear', band=1):
+    """Read a size x size pixel window around a WGS84 point, or None if outside the raster"""
+    with rasterio.open(file_path) as src:
+        window = point_window(src, lng, lat, size)
+        if window is None:
+            return None
+        return read_band_from(src, out_shape=out_shape, window=window,
+                              resampling=resampling, band=band)
+
+
+def read_band_in_bbox(file_path, bbox, out_shape=None, resampling='bilinear', band=1):
+    """Read the part of a band covered by a WGS84 bbox, or None if they do not overlap"""
+    with rasterio.open(file_path) as src:
+        window = bbox_window(src, bbox)
+        if window is None:
+            return None
+        return read_band_from(src, out_shape=out_shape, window=window,
+                              resampling=resampling, band=band)
+
+
+def load_and_resize_band(file_path, target_shape, resampling='bilinear'):
+    """
+    Load a single band resized to target_shape (width, height, as with cv2.resize)
+    """
+    try:
+        width, height = target_shape
+        return read_band(file_path, out_shape=(height, width), resampling=resampling)
+    except Exception as e:
+        print(f"Error loading band from {file_path}: {str(e)}")
+        return None
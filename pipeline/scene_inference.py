@@ -0,0 +1,221 @@
+"""
+Flood probability map for a whole Sentinel scene using the patch classifier.
+
+The scene is read in overlapping windows (decimated to the model input size, as in
+training), features are computed in batches, and each window's flood probability is
+averaged into a coarser output grid. Only one row of windows plus a strip of the
+output is in memory at a time, whatever the scene size.
+
+Usage:
+    python -m pipeline.scene_inference --model my_model.keras \
+        --bands B03.tif B04.tif B08.tif --output flood_probability.tif
+    python -m pipeline.scene_inference --model my_model.keras \
+        --bands scene.tif:3 scene.tif:4 scene.tif:8 --output flood_probability.tif
+
+Bands are GREEN RED NIR for a Sentinel-2 model and VV VH for a Sentinel-1 model,
+each either a single-band file or file:band_index of a multi-band file.
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from pipeline.band_math import ndvi_ndwi, soil_moisture_proxy
+from pipeline.dataset import normalize
+from pipeline.raster_io import read_band_from
+
+# Band order expected on the command line for each sensor
+SENSOR_BANDS = {
+    's1': ['vv', 'vh'],
+    's2': ['green', 'red', 'nir']
+}
+
+
+def parse_band_spec(spec):
+    """'scene.tif:3' -> ('scene.tif', 3), 'B08.tif' -> ('B08.tif', 1)"""
+    path, _, index = spec.rpartition(':')
+    if path and index.isdigit():
+        return path, int(index)
+    return spec, 1
+
+
+def window_offsets(length, window, stride):
+    """Window start offsets covering [0, length); the last window may run past the edge"""
+    offsets = list(range(0, max(length - window, 0) + 1, stride))
+    if offsets[-1] + window < length:
+        offsets.append(offsets[-1] + stride)
+    return offsets
+
+
+def scene_area_km2(src):
+    """Approximate area covered by the raster in km²"""
+    pixel_area = abs(src.transform.a * src.transform.e)
+    if src.crs is not None and src.crs.is_geographic:
+        # Degrees to metres at the scene's centre latitude
+        lat = math.radians((src.bounds.top + src.bounds.bottom) / 2)
+        pixel_area *= 111320.0 ** 2 * math.cos(lat)
+    return pixel_area * src.width * src.height / 1e6
+
+
+def compute_features(bands, sensor, out=None):
+    """Feature batch (N, H, W, C) from a dict of (N, H, W) band arrays"""
+    if sensor == 's2':
+        return ndvi_ndwi(bands['green'], bands['red'], bands['nir'], out=out)
+    features = soil_moisture_proxy(bands['vv'], bands['vh'])
+    return features[..., np.newaxis]
+
+
+def read_window_bands(datasets, window, window_size, patch_size):
+    """
+    Read every band for one window at the model's pixel scale.
+    Windows clipped by the scene edge are read at the same scale and edge-padded.
+    """
+    scale = patch_size / window_size
+    rows = max(1, round(window.height * scale))
+    cols = max(1, round(window.width * scale))
+    bands = {}
+    for name, (src, index) in datasets.items():
+        band = read_band_from(src, out_shape=(rows, cols), window=window, band=index)
+        if band.shape != (patch_size, patch_size):
+            band = np.pad(band, ((0, patch_size - rows), (0, patch_size - cols)), mode='edge')
+        bands[name] = band
+    return bands
+
+
+def predict_scene(model, stats, band_paths, output_path, window=512, overlap=0.25,
+                  output_scale=16, batch_size=32):
+    """
+    Write a float32 flood probability GeoTIFF for the scene and return run statistics
+    """
+    sensor = stats['sensor']
+    patch_size = stats['target_shape'][0]
+    names = SENSOR_BANDS[sensor]
+    if len(band_paths) != len(names):
+        raise ValueError(f"A {sensor} model needs {len(names)} bands: {' '.join(names)}")
+
+    # Window and stride are kept on whole output pixels so the output rows can be streamed
+    window = max(output_scale, window // output_scale * output_scale)
+    stride = max(output_scale, int(window * (1 - overlap)) // output_scale * output_scale)
+
+    datasets = {}
+    try:
+        for name, spec in zip(names, band_paths):
+            path, index = parse_band_spec(spec)
+            datasets[name] = (rasterio.open(path), index)
+        ref = datasets[names[0]][0]
+        for src, _ in datasets.values():
+            if (src.width, src.height) != (ref.width, ref.height) or src.transform != ref.transform:
+                raise ValueError(f"{src.name} is not on the same grid as {ref.name}")
+
+        out_width = math.ceil(ref.width / output_scale)
+        out_height = math.ceil(ref.height / output_scale)
+        window_out = window // output_scale
+        stride_out = stride // output_scale
+
+        profile = {
+            'driver': 'GTiff',
+            'width': out_width,
+            'height': out_height,
+            'count': 1,
+            'dtype': 'float32',
+            'nodata': -1.0,
+            'crs': ref.crs,
+            'transform': ref.transform * rasterio.Affine.scale(output_scale),
+            'compress': 'deflate',
+        }
+
+        # Rolling accumulators for the output rows touched by the current row of windows
+        acc = np.zeros((window_out, out_width), dtype=np.float32)
+        weight = np.zeros((window_out, out_width), dtype=np.float32)
+        base_row = 0
+        col_offsets = window_offsets(ref.width, window, stride)
+        num_windows = 0
+        start = time.perf_counter()
+
+        with rasterio.open(output_path, 'w', **profile) as dst:
+
+            def flush(rows):
+                """Write the first `rows` accumulated output rows and shift the buffers up"""
+                nonlocal base_row
+                rows = min(rows, out_height - base_row)
+                if rows <= 0:
+                    return
+                block = np.full((rows, out_width), -1.0, dtype=np.float32)
+                covered = weight[:rows] > 0
+                block[covered] = acc[:rows][covered] / weight[:rows][covered]
+                dst.write(block, 1, window=Window(0, base_row, out_width, rows))
+
+                acc[:-rows] = acc[rows:]
+                acc[-rows:] = 0
+                weight[:-rows] = weight[rows:]
+                weight[-rows:] = 0
+                base_row += rows
+
+            for row_off in window_offsets(ref.height, window, stride):
+                flush(row_off // output_scale - base_row)
+
+                windows = [
+                    Window(col_off, row_off, min(window, ref.width - col_off), min(window, ref.height - row_off))
+                    for col_off in col_offsets
+                ]
+                for i in range(0, len(windows), batch_size):
+                    batch_windows = windows[i:i + batch_size]
+                    per_window = [read_window_bands(datasets, w, window, patch_size) for w in batch_windows]
+                    bands = {name: np.stack([b[name] for b in per_window]) for name in names}
+                    features = compute_features(bands, sensor)
+                    normalize(features, stats, out=features)
+                    probabilities = np.asarray(model.predict_on_batch(features))[:, 1]
+
+                    for w, p in zip(batch_windows, probabilities):
+                        c0 = w.col_off // output_scale
+                        rows = math.ceil(w.height / output_scale)
+                        cols = math.ceil(w.width / output_scale)
+                        acc[:rows, c0:c0 + cols] += p
+                        weight[:rows, c0:c0 + cols] += 1
+                    num_windows += len(batch_windows)
+
+            flush(out_height - base_row)
+
+        elapsed = time.perf_counter() - start
+    finally:
+        for src, _ in datasets.values():
+            src.close()
+
+    area = scene_area_km2(ref)
+    return {
+        'windows': num_windows,
+        'seconds': round(elapsed, 2),
+        'area_km2': round(area, 1),
+        'km2_per_second': round(area / elapsed, 2) if elapsed else None,
+        'output': output_path
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled flood inference over a full scene")
+    parser.add_argument('--model', required=True, help="Keras model saved by pipeline.train")
+    parser.add_argument('--bands', nargs='+', required=True,
+                        help="GREEN RED NIR (S2 model) or VV VH (S1 model), as path or path:band")
+    parser.add_argument('--output', required=True, help="Output GeoTIFF path")
+    parser.add_argument('--window', type=int, default=512, help="Window size in source pixels")
+    parser.add_argument('--overlap', type=float, default=0.25, help="Window overlap fraction")
+    parser.add_argument('--output-scale', type=int, default=16,
+                        help="Source pixels per output pixel along each axis")
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    from pipeline.model import load_model
+
+    model, stats = load_model(args.model)
+    result = predict_scene(model, stats, args.bands, args.output, args.window, args.overlap,
+                           args.output_scale, args.batch_size)
+    print(f"Processed {result['windows']} windows over {result['area_km2']} km² "
+          f"in {result['seconds']} s ({result['km2_per_second']} km²/s)")
+    print(f"Flood probability map saved to {result['output']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Train the flood CNN from disk with a streaming input pipeline.
+
+The model and training state are checkpointed after every epoch, so running the
+same command again after a disconnect resumes where it stopped. Per-epoch time
+and samples/s are appended to <checkpoint dir>/metrics.jsonl.
+
+Usage:
+    python -m pipeline.train --images /content/drive/MyDrive/train/images \
+        --labels /content/drive/MyDrive/train/labels --model my_model.keras \
+        --checkpoint-dir /content/drive/MyDrive/my_model_checkpoints
+
+Fine-tune on newly labelled scenes only:
+    python -m pipeline.train --images ... --labels ... --finetune my_model.keras --model my_model_v2.keras
+"""
+import argparse
+import json
+import os
+import time
+
+from pipeline.dataset import (compute_channel_stats, list_samples, load_stats, make_tf_dataset, save_stats,
+                              split_samples)
+from pipeline.model import create_model, stats_path_for
+
+STATE_FILE = 'state.json'
+METRICS_FILE = 'metrics.jsonl'
+STATS_FILE = 'norm.json'
+LAST_CHECKPOINT = 'last.keras'
+BEST_CHECKPOINT = 'best.keras'
+
+
+def checkpoint_dir_for(model_path):
+    """Default checkpoint directory of a model, e.g. my_model_checkpoints/"""
+    return os.path.splitext(model_path)[0] + '_checkpoints'
+
+
+def manifest_path_for(model_path):
+    """Label files a model was trained and evaluated on, e.g. my_model.samples.json"""
+    return os.path.splitext(model_path)[0] + '.samples.json'
+
+
+def load_manifest(model_path):
+    path = manifest_path_for(model_path)
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return set(json.load(f))
+
+
+def write_json(path, payload):
+    """Write then rename, so a disconnect never leaves a partial file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class TrainingState:
+    """
+    Progress of a training run, saved in <checkpoint_dir>/state.json after every epoch:
+    completed epochs, the train/test split, and early stopping's best value and wait count.
+    Per-epoch time and throughput are appended to metrics.jsonl.
+    """
+
+    def __init__(self, checkpoint_dir, epochs, patience, monitor, train_files, test_files, base_model=None):
+        self.checkpoint_dir = checkpoint_dir
+        self.state = {
+            'epoch': 0,
+            'epochs': epochs,
+            'patience': patience,
+            'monitor': monitor,
+            'best': None,
+            'best_epoch': None,
+            'wait': 0,
+            'stopped': False,
+            'base_model': base_model,
+            'train_files': train_files,
+            'test_files': test_files
+        }
+        self.pending_metrics = []
+
+    @classmethod
+    def load(cls, checkpoint_dir):
+        """The saved state, or None when the directory holds no run"""
+        path = os.path.join(checkpoint_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            saved = json.load(f)
+        state = cls(checkpoint_dir, saved['epochs'], saved['patience'], saved['monitor'],
+                    saved['train_files'], saved['test_files'], saved.get('base_model'))
+        state.state.update(saved)
+        return state
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    @property
+    def finished(self):
+        return self.state['stopped'] or self.state['epoch'] >= self.state['epochs']
+
+    def path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def save(self):
+        write_json(self.path(STATE_FILE), self.state)
+        if self.pending_metrics:
+            with open(self.path(METRICS_FILE), 'a') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in self.pending_metrics)
+            self.pending_metrics = []
+
+    def epoch_finished(self, epoch, logs, seconds, samples):
+        """Record a finished epoch (0-based) until the next save; returns (improved, stop)"""
+        value = logs.get(self.state['monitor'])
+        improved = value is not None and (self.state['best'] is None or value < self.state['best'])
+        if improved:
+            self.state.update(best=float(value), best_epoch=epoch + 1, wait=0)
+        else:
+            self.state['wait'] += 1
+        stop = bool(self.state['patience']) and self.state['wait'] >= self.state['patience']
+
+        entry = {
+            'epoch': epoch + 1,
+            'seconds': round(seconds, 2),
+            'samples': samples,
+            'samples_per_second': round(samples / seconds, 2) if seconds else None
+        }
+        entry.update({name: float(v) for name, v in logs.items()})
+        self.pending_metrics.append(entry)
+        print(f"Epoch {epoch + 1}: {entry['seconds']}s, {entry['samples_per_second']} samples/s"
+              f"{' (best so far)' if improved else ''}")
+
+        self.state.update(epoch=epoch + 1, stopped=stop)
+        return improved, stop
+
+
+def checkpoint_callback(model, state, samples):
+    """Keras callback that times each epoch and saves the model and state after it"""
+    from tensorflow.keras.callbacks import LambdaCallback
+
+    started = {}
+
+    def on_epoch_begin(epoch, logs=None):
+        started['time'] = time.perf_counter()
+
+    def on_epoch_end(epoch, logs=None):
+        seconds = time.perf_counter() - started['time']
+        improved, stop = state.epoch_finished(epoch, logs or {}, seconds, samples)
+        # The .keras file includes the optimizer state, so training resumes where it left off
+        tmp_path = state.path('last.tmp.keras')
+        model.save(tmp_path)
+        os.replace(tmp_path, state.path(LAST_CHECKPOINT))
+        if improved:
+            model.save(tmp_path)
+            os.replace(tmp_path, state.path(BEST_CHECKPOINT))
+        state.save()
+        if stop:
+            print(f"Early stopping: no improvement in {state['monitor']} for {state['patience']} epochs")
+            model.stop_training = True
+
+    return LambdaCallback(on_epoch_begin=on_epoch_begin, on_epoch_end=on_epoch_end)
+
+
+def by_label_file(samples, label_files):
+    """Samples in the order of label_files, skipping ones that are gone"""
+    index = {sample['label_file']: sample for sample in samples}
+    missing = [name for name in label_files if name not in index]
+    if missing:
+        print(f"Warning: {len(missing)} samples of the saved split no longer exist")
+    return [index[name] for name in label_files if name in index]
+
+
+def prepare_run(image_folder, label_folder, checkpoint_dir, target_shape, epochs, test_size, sensor, seed,
+                patience, base_model):
+    """New run: split the samples, fix normalization statistics and save the initial state"""
+    if base_model:
+        # Fine-tuning keeps the base model's normalization and trains on unseen samples only
+        stats = load_stats(stats_path_for(base_model))
+        seen = load_manifest(base_model)
+        if not seen:
+            print(f"Warning: {manifest_path_for(base_model)} not found, every sample counts as new")
+        samples = [s for s in list_samples(image_folder, label_folder, stats['sensor'])
+                   if s['label_file'] not in seen]
+        print(f"{len(samples)} samples not seen by {base_model}")
+    else:
+        stats = None
+        samples = list_samples(image_folder, label_folder, sensor)
+    if not samples:
+        raise ValueError("No new labelled samples found" if base_model else "No labelled samples found")
+
+    train_samples, test_samples = split_samples(samples, test_size, seed)
+    if stats is None:
+        # Statistics come from the training split only, in one streaming pass
+        print(f"Computing normalization statistics over {len(train_samples)} training samples...")
+        stats, train_samples = compute_channel_stats(train_samples, target_shape)
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    # Checkpoints of an earlier run in the same directory must not be resumed from
+    for name in (LAST_CHECKPOINT, BEST_CHECKPOINT, METRICS_FILE):
+        if os.path.exists(os.path.join(checkpoint_dir, name)):
+            os.remove(os.path.join(checkpoint_dir, name))
+    save_stats(stats, os.path.join(checkpoint_dir, STATS_FILE))
+    state = TrainingState(checkpoint_dir, epochs, patience, 'val_loss' if test_samples else 'loss',
+                          [s['label_file'] for s in train_samples], [s['label_file'] for s in test_samples],
+                          base_model)
+    state.save()
+    return state, stats, train_samples, test_samples
+
+
+def build_model(state, stats, learning_rate):
+    """Model to continue from: the last checkpoint, the base model to fine-tune, or a new one"""
+    from tensorflow.keras.models import load_model as keras_load_model
+    from tensorflow.keras.optimizers import Adam
+
+    if os.path.exists(state.path(LAST_CHECKPOINT)):
+        print(f"Resuming from {state.path(LAST_CHECKPOINT)} after epoch {state['epoch']}")
+        return keras_load_model(state.path(LAST_CHECKPOINT))
+
+    if state['base_model']:
+        if not state['base_model'].endswith('.keras'):
+            raise ValueError("Fine-tuning needs the Keras model, not an exported one")
+        model = keras_load_model(state['base_model'])
+        # Smaller steps than training from scratch, so the new samples adjust rather than overwrite
+        learning_rate = learning_rate or 1e-4
+    else:
+        width, height = stats['target_shape'][0], stats['target_shape'][1]
+        model = create_model(input_shape=(height, width, len(stats['channels'])))
+    model.compile(optimizer=Adam(learning_rate or 1e-3),
+                  loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def train(image_folder, label_folder, model_path='my_model.keras', target_shape=(128, 128),
+          epochs=10, batch_size=32, test_size=0.2, sensor=None, seed=42, checkpoint_dir=None,
+          resume=True, patience=3, base_model=None, learning_rate=None):
+    """
+    Train and save the model plus its normalization statistics, checkpointing every epoch.
+
+    With resume, a run interrupted before finishing continues from its last checkpoint
+    (same split, statistics and early stopping state); a finished run only trains again
+    when epochs exceeds its epoch count. base_model fine-tunes an existing
+    .keras model on the samples it has not seen (per its .samples.json manifest).
+    """
+    checkpoint_dir = checkpoint_dir or checkpoint_dir_for(model_path)
+    state = TrainingState.load(checkpoint_dir) if resume else None
+    if state is not None:
+        print(f"Found run in {checkpoint_dir} at epoch {state['epoch']}/{state['epochs']}")
+        stats = load_stats(state.path(STATS_FILE))
+        samples = list_samples(image_folder, label_folder, stats['sensor'])
+        train_samples = by_label_file(samples, state['train_files'])
+        test_samples = by_label_file(samples, state['test_files'])
+        ended = f"at epoch {state['epoch']}{' (stopped early)' if state['stopped'] else ''}"
+        if epochs > state['epochs']:
+            # A larger --epochs extends the run, also one that has finished, with early stopping reset
+            print(f"Extending the run {ended} to {epochs} epochs")
+            state.state.update(epochs=epochs, stopped=False, wait=0)
+        elif state.finished:
+            print(f"Run in {checkpoint_dir} already finished {ended}; nothing left to train. "
+                  f"Pass --epochs above {state['epochs']} to continue it or --restart to start over.")
+    else:
+        print("Listing samples...")
+        state, stats, train_samples, test_samples = prepare_run(
+            image_folder, label_folder, checkpoint_dir, target_shape, epochs, test_size, sensor, seed,
+            patience, base_model)
+    # The run (or the fine-tuned model) fixes the input size
+    target_shape = tuple(stats['target_shape'])
+
+    model = build_model(state, stats, learning_rate)
+    test_ds = make_tf_dataset(test_samples, stats, batch_size, target_shape, shuffle=False) if test_samples else None
+
+    history = None
+    if not state.finished:
+        model.summary()
+        # Continue the per-epoch shuffle sequence where the interrupted run stopped
+        train_ds = make_tf_dataset(train_samples, stats, batch_size, target_shape, shuffle=True,
+                                   seed=seed + state['epoch'])
+        history = model.fit(train_ds, epochs=state['epochs'], initial_epoch=state['epoch'],
+                            validation_data=test_ds,
+                            callbacks=[checkpoint_callback(model, state, len(train_samples))])
+
+    # Early stopping keeps the best epoch, not the last
+    if os.path.exists(state.path(BEST_CHECKPOINT)):
+        from tensorflow.keras.models import load_model as keras_load_model
+        model = keras_load_model(state.path(BEST_CHECKPOINT))
+        print(f"Using the best epoch ({state['best_epoch']}, {state['monitor']} {state['best']:.4f})")
+
+    if test_ds is not None:
+        test_loss, test_accuracy = model.evaluate(test_ds)
+        print(f"Test Loss: {test_loss}")
+        print(f"Test Accuracy: {test_accuracy}")
+
+    model.save(model_path)
+    save_stats(stats, stats_path_for(model_path))
+    seen = load_manifest(state['base_model']) if state['base_model'] else set()
+    write_json(manifest_path_for(model_path), sorted(seen | set(state['train_files']) | set(state['test_files'])))
+    print(f"Model saved to {model_path} with {stats_path_for(model_path)} and {manifest_path_for(model_path)}")
+    return model, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the flood prediction CNN")
+    parser.add_argument('--images', required=True, help="Images folder (images/<digit>/...)")
+    parser.add_argument('--labels', required=True, help="Folder with .geojson label files")
+    parser.add_argument('--model', default='my_model.keras', help="Output model path")
+    parser.add_argument('--sensor', choices=['s1', 's2'], default=None)
+    parser.add_argument('--size', type=int, default=128, help="Input patch size in pixels")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help="Per-epoch checkpoints and state (default <model>_checkpoints, keep it on Drive)")
+    parser.add_argument('--restart', action='store_true', help="Start over, ignoring a previous run in the checkpoint dir")
+    parser.add_argument('--patience', type=int, default=3, help="Early stopping patience in epochs (0 = off)")
+    parser.add_argument('--finetune', default=None, metavar='BASE_MODEL',
+                        help="Fine-tune this .keras model on the samples it has not seen")
+    parser.add_argument('--learning-rate', type=float, default=None,
+                        help="Adam learning rate (default 1e-3, or 1e-4 when fine-tuning)")
+    args = parser.parse_args()
+
+    train(args.images, args.labels, args.model, (args.size, args.size),
+          args.epochs, args.batch_size, args.test_size, args.sensor,
+          checkpoint_dir=args.checkpoint_dir, resume=not args.restart, patience=args.patience,
+          base_model=args.finetune, learning_rate=args.learning_rate)
+
+
+if __name__ == "__main__":
+    main()
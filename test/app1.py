@@ -8,9 +8,11 @@ import numpy as np
 from shapely.geometry import Point, Polygon
 from datetime import datetime, timedelta
 import os
+import threading
 from dotenv import load_dotenv
 import json
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from water_bodies import WaterBodyIndex, ensure_geography_column, query_nearest_water_body
 
 # Load environment variables
 load_dotenv()
@@ -34,34 +36,36 @@ DB_CONFIG = {
 def get_db_connection():
     return psycopg2.connect(**DB_CONFIG)
 
+# Water body source: 'postgres' (in-process index loaded from the water_bodies table),
+# a GeoJSON/shapefile path, or 'db' to query the indexed geography column per request
+WATER_BODY_SOURCE = os.getenv('WATER_BODY_SOURCE', 'postgres')
+WATER_BODY_RELOAD_INTERVAL = int(os.getenv('WATER_BODY_RELOAD_INTERVAL', 300))
+_water_body_index = None
+_water_body_index_lock = threading.Lock()
+
+def get_water_body_index():
+    """Index built on first use; concurrent first requests wait for one build"""
+    global _water_body_index
+    if _water_body_index is None:
+        with _water_body_index_lock:
+            if _water_body_index is None:
+                _water_body_index = WaterBodyIndex(
+                    WATER_BODY_SOURCE,
+                    get_connection=get_db_connection,
+                    reload_interval=WATER_BODY_RELOAD_INTERVAL
+                )
+    return _water_body_index
+
 # Water body detection
 def detect_water_body(lat, lng):
+    # Nearest water body within 10km radius
+    if WATER_BODY_SOURCE != 'db':
+        return get_water_body_index().nearest(lat, lng, radius=10000)
+
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
     try:
-        # Query to find nearest water body within 10km radius
-        cur.execute("""
-            SELECT name, type, 
-                   ST_Distance(
-                       geometry::geography, 
-                       ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                   ) as distance
-            FROM water_bodies
-            WHERE ST_DWithin(
-                geometry::geography,
-                ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography,
-                10000  -- 10km radius
-            )
-            ORDER BY distance
-            LIMIT 1;
-        """, (lng, lat, lng, lat))
-        
-        result = cur.fetchone()
-        return result if result else None
-        
+        return query_nearest_water_body(conn, lat, lng, radius=10000)
     finally:
-        cur.close()
         conn.close()
 
 # Analyze vegetation cover
@@ -257,4 +261,10 @@ def login():
             conn.close()
 
 if __name__ == '__main__':
+    if WATER_BODY_SOURCE == 'db':
+        conn = get_db_connection()
+        try:
+            ensure_geography_column(conn)
+        finally:
+            conn.close()
     app.run(debug=True)
\ No newline at end of file
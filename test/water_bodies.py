@@ -0,0 +1,169 @@
+# water_bodies.py
+"""In-process spatial index of water bodies for nearest-within-radius lookups."""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.geometry import Point, shape
+
+logger = logging.getLogger(__name__)
+
+# UTM zone 37S covers most of Kenya; distances are computed in this projection
+DEFAULT_EPSG = int(os.getenv('WATER_BODY_EPSG', 32737))
+
+
+def ensure_geography_column(conn):
+    """
+    DB-side path: a stored geography column with a GiST index, so radius queries do
+    not have to cast (and scan) every row of water_bodies.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            ALTER TABLE water_bodies
+                ADD COLUMN IF NOT EXISTS geog geography
+                GENERATED ALWAYS AS (geometry::geography) STORED;
+
+            CREATE INDEX IF NOT EXISTS water_bodies_geog_idx
+                ON water_bodies USING GIST (geog);
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def query_nearest_water_body(conn, lat, lng, radius=10000):
+    """Nearest water body within radius metres, using the indexed geography column"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT id, name, type,
+                   ST_Distance(geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distance
+            FROM water_bodies
+            WHERE ST_DWithin(geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
+            ORDER BY geog <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
+            LIMIT 1;
+        """, (lng, lat, lng, lat, radius, lng, lat))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'name': row[1], 'type': row[2], 'distance': row[3]}
+    finally:
+        cur.close()
+
+
+class WaterBodyIndex:
+    """
+    Water-body geometries held in an STR-tree, loaded once from Postgres or a
+    GeoJSON/shapefile and reloaded in the background when the source changes.
+    """
+
+    def __init__(self, source, get_connection=None, epsg=DEFAULT_EPSG, reload_interval=300):
+        self.source = source
+        self.get_connection = get_connection
+        self.to_metric = Transformer.from_crs('EPSG:4326', f'EPSG:{epsg}', always_xy=True)
+        self.reload_interval = reload_interval
+        self.signature = None
+        # (tree, geometries, attributes) swapped in one assignment on reload
+        self._state = None
+        self.reload()
+
+        if reload_interval:
+            thread = threading.Thread(target=self._reload_loop, name='water-body-reload', daemon=True)
+            thread.start()
+
+    def _source_signature(self):
+        """Cheap value that changes whenever the source data changes"""
+        if self.source != 'postgres':
+            stat = os.stat(self.source)
+            return stat.st_mtime, stat.st_size
+
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT n_tup_ins, n_tup_upd, n_tup_del
+                FROM pg_stat_user_tables
+                WHERE relname = 'water_bodies'
+            """)
+            return cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+
+    def _load_postgres(self):
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT id, name, type, ST_AsBinary(geometry) FROM water_bodies")
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+        attributes = [{'id': r[0], 'name': r[1], 'type': r[2]} for r in rows]
+        geometries = shapely.from_wkb([bytes(r[3]) for r in rows])
+        return geometries, attributes
+
+    def _load_file(self):
+        if self.source.endswith(('.geojson', '.json')):
+            with open(self.source, 'r') as f:
+                features = json.load(f)['features']
+        else:
+            import fiona
+            with fiona.open(self.source) as collection:
+                features = [{'properties': dict(f['properties']), 'geometry': f['geometry']}
+                            for f in collection]
+
+        attributes = []
+        geometries = []
+        for i, feature in enumerate(features):
+            properties = feature.get('properties') or {}
+            attributes.append({
+                'id': properties.get('id', i),
+                'name': properties.get('name'),
+                'type': properties.get('type')
+            })
+            geometries.append(shape(feature['geometry']))
+        return np.array(geometries, dtype=object), attributes
+
+    def reload(self):
+        """Rebuild the index from the source"""
+        start = time.perf_counter()
+        signature = self._source_signature()
+        geometries, attributes = self._load_postgres() if self.source == 'postgres' else self._load_file()
+
+        # Project once so queries are plain planar distances in metres
+        geometries = shapely.transform(
+            geometries, lambda coords: np.column_stack(self.to_metric.transform(coords[:, 0], coords[:, 1])))
+        self._state = (shapely.STRtree(geometries), geometries, attributes)
+        self.signature = signature
+        logger.info(f"Loaded {len(attributes)} water bodies in {time.perf_counter() - start:.2f}s")
+
+    def _reload_loop(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                if self._source_signature() != self.signature:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Water body reload failed: {str(e)}")
+
+    def nearest(self, lat, lng, radius=10000):
+        """Nearest water body within radius metres as {id, name, type, distance}, or None"""
+        tree, _, attributes = self._state
+        x, y = self.to_metric.transform(lng, lat)
+        indices, distances = tree.query_nearest(Point(x, y), max_distance=radius, return_distance=True)
+        if len(indices) == 0:
+            return None
+
+        best = int(np.argmin(distances))
+        return dict(attributes[indices[best]], distance=float(distances[best]))
@@ -8,59 +8,48 @@ import os
 from dotenv import load_dotenv
 import logging
 import json
+import sys
 
-# Initialize Earth Engine
-try:
-    ee.Initialize(project='ee-ndirangudenise61')
-except:
-    ee.Authenticate()
-    ee.Initialize(project='ee-ndirangudenise61')
-
+# Share the imagery backends (and the pipeline package they use) with the main API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
 
 # Load environment variables
 load_dotenv()
 
+import ee_cache
+import ee_scheduler
+from imagery import get_backend
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Initialize Earth Engine (EE_CACHE_MODE=replay needs no credentials)
+ee_cache.initialize(os.getenv('EE_PROJECT', 'ee-ndirangudenise61'))
+
 app = Flask(__name__)
 # Enable CORS for all routes and allow all origins
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+# Latest Sentinel-2 image under 20% cloud within the window, first pixel value at 10 m
+imagery_backend = get_backend(
+    collection='COPERNICUS/S2_SR',
+    max_cloud=20,
+    sort='latest',
+    lookback_days=0,
+    landsat_fallback=False,
+    scale=10,
+    reducer='first'
+)
+
 def get_satellite_data(lat, lng, start_date, end_date):
-    """Get satellite data from Google Earth Engine"""
-    point = ee.Geometry.Point([lng, lat])
-    
-    # Get Sentinel-2 collection
-    s2 = ee.ImageCollection('COPERNICUS/S2_SR') \
-        .filterBounds(point) \
-        .filterDate(start_date, end_date) \
-        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-    
-    if s2.size().getInfo() == 0:
+    """Get NDVI/NDWI of the latest clear image from the configured imagery backend"""
+    values = imagery_backend.index_values(lat, lng, start_date, end_date, include_soil_moisture=False)
+    if values is None:
         return None
 
-    # Function to calculate indices
-    def calculate_indices(image):
-        ndvi = image.normalizedDifference(['B8', 'B4']).rename('ndvi')
-        ndwi = image.normalizedDifference(['B3', 'B8']).rename('ndwi')
-        return image.addBands([ndvi, ndwi])
-
-    # Add indices to collection
-    s2_with_indices = s2.map(calculate_indices)
-    
-    # Get the most recent image
-    latest_image = s2_with_indices.sort('system:time_start', False).first()
-    
-    # Extract values at point
-    values = latest_image.select(['ndvi', 'ndwi']).reduceRegion(
-        reducer=ee.Reducer.first(),
-        geometry=point,
-        scale=10
-    ).getInfo()
-    
-    return values
+    return {'ndvi': values['ndvi'], 'ndwi': values['ndwi']}
 
 def get_soil_moisture(lat, lng, start_date, end_date):
     """Get soil moisture data from Google Earth Engine"""
@@ -71,16 +60,16 @@ def get_soil_moisture(lat, lng, start_date, end_date):
         .filterBounds(point) \
         .filterDate(start_date, end_date)
     
-    if smap.size().getInfo() == 0:
+    if ee_scheduler.get_info(smap.size()) == 0:
         return None
 
     latest = smap.sort('system:time_start', False).first()
     
-    values = latest.select('ssm').reduceRegion(
+    values = ee_scheduler.get_info(latest.select('ssm').reduceRegion(
         reducer=ee.Reducer.first(),
         geometry=point,
         scale=10000
-    ).getInfo()
+    ))
     
     return values.get('ssm')
 
@@ -98,7 +87,7 @@ def get_water_level(lat, lng):
 
 def analyze_location(lat, lng):
     """Main analysis function"""
-    end_date = datetime.now()
+    end_date = ee_cache.now()
     start_date = end_date - timedelta(days=10)
     
     # Get current satellite data